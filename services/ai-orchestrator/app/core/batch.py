@@ -0,0 +1,184 @@
+"""
+Bulk routine generation for scheduler-driven plan refreshes.
+
+Two modes share one exercise catalog across all users in the batch:
+
+- Online: fan out generate_routine calls with a bounded concurrency cap and
+  yield per-user results as they finish, so the router can stream them back
+  as NDJSON. One user's failure never fails the batch.
+- Offline: build an OpenAI Batch API JSONL job (one chat.completions request
+  per user), submit it, and later collect and validate the results.
+
+Both modes take an optional OpenAI client so they can be driven by a local
+fake (or point OPENAI_BASE_URL at one).
+"""
+
+import asyncio
+import json
+import logging
+from typing import AsyncIterator
+
+from openai import AsyncOpenAI, NotFoundError
+
+from app.core import fast_json, openai_client
+from app.core.catalog_registry import ExerciseCatalog
+from app.core.config import BATCH_MAX_CONCURRENCY
+from app.core.routine_repair import extract_json
+from app.core.usage import current_user_id
+
+logger = logging.getLogger("pulse.batch")
+
+
+class BatchNotFoundError(LookupError):
+    """Raised when the OpenAI Batch API does not know a batchId."""
+
+
+def _ok(user_id: str, routine: dict) -> dict:
+    return {"userId": user_id, "status": "ok", "routine": routine}
+
+
+def _failed(user_id: str, error: str) -> dict:
+    return {"userId": user_id, "status": "error", "error": error}
+
+
+async def generate_batch(
+    items: list[dict],
+    catalog: ExerciseCatalog,
+    concurrency: int | None = None,
+) -> AsyncIterator[dict]:
+    """
+    Generate routines for every item, yielding one result dict per user in
+    completion order. Each item needs userId and profile; history is optional.
+    """
+    limit = max(1, min(concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(item: dict) -> dict:
+        # Each item runs in its own task, so this only tags that item's usage
+        current_user_id.set(item["userId"])
+        async with semaphore:
+            try:
+                routine = await openai_client.generate_routine(
+                    profile=item["profile"],
+                    catalog=catalog,
+                    history=item.get("history") or [],
+                )
+                return _ok(item["userId"], routine)
+            except Exception as e:
+                logger.warning("Batch item failed | user=%s: %s", item["userId"], e)
+                return _failed(item["userId"], str(e))
+
+    tasks = [asyncio.ensure_future(run(item)) for item in items]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # The client went away mid-stream — stop paying for the rest
+        for task in tasks:
+            task.cancel()
+
+
+def _custom_id(index: int, user_id: str) -> str:
+    # Batch API custom_ids must be unique; a user may appear more than once.
+    return f"{index}-{user_id}"
+
+
+def build_batch_jsonl(items: list[dict], catalog: ExerciseCatalog) -> tuple[str, list[dict]]:
+    """
+    Return an OpenAI Batch API input file with one request per item, plus
+    error results for items whose prompt could not be built.
+    """
+    lines, rejected = [], []
+    for i, item in enumerate(items):
+        try:
+            messages = openai_client._generate_messages(
+                item["profile"], catalog, item.get("history") or []
+            )
+        except ValueError as e:
+            rejected.append(_failed(item["userId"], str(e)))
+            continue
+        lines.append(fast_json.dumps({
+            "custom_id": _custom_id(i, item["userId"]),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": openai_client._completion_body(
+                "generate", messages, openai_client._routine_response_format("json")
+            ),
+        }))
+    return "".join(f"{line}\n" for line in lines), rejected
+
+
+async def submit_batch(
+    items: list[dict],
+    catalog: ExerciseCatalog,
+    client: AsyncOpenAI | None = None,
+) -> dict:
+    """Upload the JSONL job and create an OpenAI batch for it."""
+    client = client or openai_client.client
+    jsonl, rejected = build_batch_jsonl(items, catalog)
+    if not jsonl:
+        raise ValueError("No batch items could be built into prompts")
+
+    upload = await client.files.create(
+        file=("routine-batch.jsonl", jsonl.encode("utf-8")),
+        purpose="batch",
+    )
+    batch = await client.batches.create(
+        input_file_id=upload.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    logger.info(
+        "Submitted routine batch | batch=%s items=%d rejected=%d",
+        batch.id, len(items) - len(rejected), len(rejected),
+    )
+    return {
+        "batchId": batch.id,
+        "status": batch.status,
+        "itemCount": len(items) - len(rejected),
+        "rejected": rejected,
+    }
+
+
+def _parse_batch_output(text: str) -> list[dict]:
+    """Validate each line of a Batch API output/error file into a result dict."""
+    results = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        user_id = record["custom_id"].split("-", 1)[1]
+        response = record.get("response") or {}
+
+        if record.get("error") or response.get("status_code") != 200:
+            error = record.get("error") or response.get("body", {}).get("error")
+            results.append(_failed(user_id, json.dumps(error)))
+            continue
+
+        try:
+            raw = response["body"]["choices"][0]["message"]["content"].strip()
+            # The batch does not keep its catalog, so only the JSON itself is recovered
+            routine = openai_client._validate_routine_json(extract_json(raw))
+            results.append(_ok(user_id, routine))
+        except (KeyError, IndexError, ValueError) as e:
+            results.append(_failed(user_id, str(e)))
+    return results
+
+
+async def collect_batch(batch_id: str, client: AsyncOpenAI | None = None) -> dict:
+    """Return the batch status, plus per-user results once it has finished."""
+    client = client or openai_client.client
+    try:
+        batch = await client.batches.retrieve(batch_id)
+    except NotFoundError as e:
+        raise BatchNotFoundError(f"Batch not found: {batch_id}") from e
+    summary = {"batchId": batch.id, "status": batch.status, "results": []}
+
+    if batch.status != "completed":
+        return summary
+
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if file_id:
+            content = await client.files.content(file_id)
+            summary["results"].extend(_parse_batch_output(content.text))
+    return summary
@@ -0,0 +1,217 @@
+"""
+Relevance-ranked catalog pruning for routine prompts.
+
+Instead of sending the first MAX_EXERCISE_CATALOG_SIZE exercises, every
+exercise is scored against the user's profile and only the best ones that fit
+in CATALOG_TOKEN_BUDGET are sent to the model.
+
+Scoring is vectorised: per-catalog feature arrays (muscle one-hot matrix,
+category/equipment/level indexes, compound flag, per-line token count) are
+built once and cached on the ExerciseCatalog, so ranking a request is a few
+NumPy operations regardless of catalog size. Selection is greedy with a
+per-muscle penalty so the shortlist stays spread across muscle groups rather
+than returning ten chest presses.
+
+Missing metadata (many catalogs only carry name/category) simply contributes
+nothing to the score; ties keep catalog order, so results are deterministic.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from app.core.catalog_registry import ExerciseCatalog
+from app.core.config import CATALOG_MIN_EXERCISES, CATALOG_TOKEN_BUDGET
+from app.core.prompt_budget import count_tokens
+
+# Category weights per goal. Unlisted categories score 0.
+_GOAL_CATEGORY_WEIGHTS = {
+    "strength": {"strength": 1.0, "powerlifting": 1.0, "olympic weightlifting": 0.6, "strongman": 0.4, "plyometrics": 0.2, "stretching": -0.5},
+    "hypertrophy": {"strength": 1.0, "powerlifting": 0.6, "olympic weightlifting": 0.2, "strongman": 0.2, "stretching": -0.5},
+    "fat_loss": {"cardio": 0.8, "plyometrics": 0.8, "strength": 0.7, "olympic weightlifting": 0.4, "strongman": 0.4},
+    "endurance": {"cardio": 1.0, "plyometrics": 0.6, "strength": 0.5},
+    "general": {"strength": 0.8, "cardio": 0.4, "plyometrics": 0.3, "stretching": 0.1},
+}
+
+# How much compound movements are preferred per goal.
+_GOAL_COMPOUND_BONUS = {"strength": 0.5, "hypertrophy": 0.3, "fat_loss": 0.3, "endurance": 0.1, "general": 0.3}
+
+# Profile equipment options (see apps/web onboarding) -> catalog equipment values.
+_EQUIPMENT_ACCESS = {
+    "full_gym": {"barbell", "dumbbell", "cable", "machine", "body only", "e-z curl bar", "kettlebells", "bands", "medicine ball", "exercise ball", "foam roll", "other"},
+    "home_gym": {"barbell", "dumbbell", "body only", "e-z curl bar", "kettlebells"},
+    "dumbbells": {"dumbbell", "body only"},
+    "resistance_bands": {"bands", "body only"},
+    "bodyweight_only": {"body only"},
+}
+
+_LEVELS = {"beginner": 0, "intermediate": 1, "advanced": 2, "expert": 2}
+
+# Score lost per already-selected exercise that shares a primary muscle.
+_DIVERSITY_PENALTY = 0.35
+_TARGET_MUSCLE_BONUS = 0.6
+_UNAVAILABLE_EQUIPMENT_PENALTY = 2.0
+_LEVEL_PENALTY = 0.5
+
+
+@dataclass
+class _CatalogFeatures:
+    muscles: np.ndarray          # (n, m) float32 one-hot of primary muscles
+    muscle_vocab: dict[str, int]
+    category: np.ndarray         # (n,) int index into category_vocab, -1 = unknown
+    category_vocab: list[str]
+    equipment: np.ndarray        # (n,) int index into equipment_vocab, -1 = unknown
+    equipment_vocab: list[str]
+    level: np.ndarray            # (n,) int, -1 = unknown
+    compound: np.ndarray         # (n,) float32 1.0 for compound movements
+    tokens: np.ndarray           # (n,) prompt tokens per line, including the newline
+
+
+def _index(values: list[str]) -> tuple[np.ndarray, list[str]]:
+    vocab: dict[str, int] = {}
+    idx = [vocab.setdefault(v, len(vocab)) if v else -1 for v in values]
+    return np.asarray(idx, dtype=np.int32), list(vocab)
+
+
+def _norm(value) -> str:
+    return str(value).strip().lower() if value else ""
+
+
+def _features(catalog: ExerciseCatalog) -> _CatalogFeatures:
+    """Build (once per catalog) the feature arrays used for scoring."""
+    if catalog.ranking_features is not None:
+        return catalog.ranking_features
+
+    exercises = catalog.exercises
+    n = len(exercises)
+
+    muscle_vocab: dict[str, int] = {}
+    rows, cols = [], []
+    for i, ex in enumerate(exercises):
+        for muscle in ex.get("primaryMuscles") or []:
+            rows.append(i)
+            cols.append(muscle_vocab.setdefault(_norm(muscle), len(muscle_vocab)))
+    muscles = np.zeros((n, max(1, len(muscle_vocab))), dtype=np.float32)
+    muscles[rows, cols] = 1.0
+
+    category, category_vocab = _index([_norm(ex.get("category")) for ex in exercises])
+    equipment, equipment_vocab = _index([_norm(ex.get("equipment")) for ex in exercises])
+
+    features = _CatalogFeatures(
+        muscles=muscles,
+        muscle_vocab=muscle_vocab,
+        category=category,
+        category_vocab=category_vocab,
+        equipment=equipment,
+        equipment_vocab=equipment_vocab,
+        level=np.asarray([_LEVELS.get(_norm(ex.get("level")), -1) for ex in exercises], dtype=np.int32),
+        compound=np.asarray([_norm(ex.get("mechanic")) == "compound" for ex in exercises], dtype=np.float32),
+        tokens=np.asarray([count_tokens(line) + 1 for line in catalog.lines], dtype=np.float32),
+    )
+    catalog.ranking_features = features
+    return features
+
+
+def prepare_catalog(catalog: ExerciseCatalog) -> None:
+    """Build the catalog's feature arrays now rather than on its first ranked request."""
+    _features(catalog)
+
+
+def _lookup(vocab: list[str], weights: dict[str, float], idx: np.ndarray, default: float = 0.0) -> np.ndarray:
+    """Map per-exercise vocab indexes through a {value: weight} table."""
+    table = np.asarray([weights.get(v, default) for v in vocab] + [default], dtype=np.float32)
+    # idx == -1 (unknown) picks the trailing default
+    return table[idx]
+
+
+def profile_level(profile: dict) -> int:
+    """The profile's experience as 0 (beginner) to 2 (advanced), or -1 if unknown."""
+    return _LEVELS.get(_norm(profile.get("experience") or profile.get("experienceLevel")), -1)
+
+
+def profile_goal(profile: dict) -> str:
+    """The profile's goal as one of the ranking goals (free-text goals are mapped, default general)."""
+    goal = _norm(profile.get("goal") or profile.get("fitnessGoal"))
+    if goal in _GOAL_CATEGORY_WEIGHTS:
+        return goal
+    if "muscle" in goal or "size" in goal:
+        return "hypertrophy"
+    if "weight" in goal or "fat" in goal or "lean" in goal:
+        return "fat_loss"
+    if "endur" in goal or "cardio" in goal:
+        return "endurance"
+    return "general"
+
+
+def _score(features: _CatalogFeatures, profile: dict) -> np.ndarray:
+    goal = profile_goal(profile)
+    score = _lookup(features.category_vocab, _GOAL_CATEGORY_WEIGHTS[goal], features.category)
+    score = score + _GOAL_COMPOUND_BONUS[goal] * features.compound
+
+    access: set[str] = set()
+    for option in profile.get("equipment") or []:
+        access |= _EQUIPMENT_ACCESS.get(_norm(option), {_norm(option)})
+    if access:
+        unavailable = {v: -_UNAVAILABLE_EQUIPMENT_PENALTY for v in features.equipment_vocab if v not in access}
+        score = score + _lookup(features.equipment_vocab, unavailable, features.equipment)
+
+    experience = profile_level(profile)
+    if experience >= 0:
+        too_hard = np.maximum(features.level - experience, 0)
+        score = score - _LEVEL_PENALTY * too_hard
+
+    targets = profile.get("targetMuscles") or profile.get("target_muscles") or []
+    target_cols = [features.muscle_vocab[m] for m in map(_norm, targets) if m in features.muscle_vocab]
+    if target_cols:
+        score = score + _TARGET_MUSCLE_BONUS * features.muscles[:, target_cols].max(axis=1)
+
+    return score
+
+
+def rank_exercises(
+    catalog: ExerciseCatalog,
+    profile: dict,
+    max_count: int,
+    token_budget: int = CATALOG_TOKEN_BUDGET,
+) -> list[int]:
+    """
+    Return catalog indexes of the exercises to show the model, best first.
+
+    Selection stops at max_count exercises or when the
+    next line would exceed token_budget, but never below CATALOG_MIN_EXERCISES.
+    """
+    n = len(catalog.exercises)
+    if n == 0:
+        return []
+
+    features = _features(catalog)
+    score = _score(features, profile).astype(np.float64)
+    # Stable tie-break on catalog order
+    score -= np.arange(n) * 1e-9
+
+    selected: list[int] = []
+    available = np.ones(n, dtype=bool)
+    muscle_counts = np.zeros(features.muscles.shape[1], dtype=np.float32)
+    spent = 0.0
+
+    while len(selected) < min(max_count, n):
+        adjusted = score - _DIVERSITY_PENALTY * (features.muscles @ muscle_counts)
+        adjusted[~available] = -np.inf
+        best = int(np.argmax(adjusted))
+        if len(selected) >= CATALOG_MIN_EXERCISES and spent + features.tokens[best] > token_budget:
+            break
+        selected.append(best)
+        available[best] = False
+        muscle_counts += features.muscles[best]
+        spent += features.tokens[best]
+
+    return selected
+
+
+def render_ranked_catalog(
+    catalog: ExerciseCatalog,
+    profile: dict,
+    max_count: int,
+) -> str:
+    """Return the prompt lines for the top-ranked exercises."""
+    return "\n".join(catalog.lines[i] for i in rank_exercises(catalog, profile, max_count))
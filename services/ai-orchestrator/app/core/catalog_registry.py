@@ -0,0 +1,137 @@
+"""
+Server-side exercise catalog registry, addressed by content hash.
+
+Clients upload a catalog once (POST /routine/catalog) and receive its
+catalogId — a SHA-256 of the canonical, order-insensitive exercise list.
+Later requests send just the catalogId instead of hundreds of exercise dicts.
+
+Each catalog is held as an ExerciseCatalog with its prompt lines rendered
+once and rowid/name indexes built once. Entries live in a small in-process
+LRU backed by Redis, so every replica can resolve an id uploaded to any other.
+Inline `available_exercises` lists go through the same LRU, so repeat
+payloads skip the rendering too.
+"""
+
+import hashlib
+import logging
+import re
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any
+
+from app.core import fast_json
+from app.core.config import CATALOG_MEMORY_ENTRIES, CATALOG_TTL_SECONDS
+from app.core.redis_client import get_redis
+
+logger = logging.getLogger("pulse.catalog_registry")
+
+
+class CatalogNotFoundError(LookupError):
+    """Raised when a catalogId is neither in memory nor in Redis."""
+
+
+def _render_line(ex: dict) -> str:
+    muscles = ", ".join(ex.get("primaryMuscles", []) or [])
+    return f'- "{ex["name"]}" (id: {ex["rowid"]}, equipment: {ex.get("equipment", "none")}, category: {ex.get("category", "")}, muscles: {muscles})'
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase a name and collapse punctuation/whitespace ("Push-Up " -> "push up")."""
+    return re.sub(r"[^a-z0-9]+", " ", name.lower()).strip()
+
+
+def compute_catalog_id(exercises: list[dict]) -> str:
+    """Return the content hash of an exercise list, independent of its order."""
+    encoded = sorted(fast_json.canonical(ex) for ex in exercises)
+    return hashlib.sha256(b"\n".join(encoded)).hexdigest()
+
+
+@dataclass
+class ExerciseCatalog:
+    """An exercise list with its prompt lines and lookup indexes precomputed."""
+
+    catalog_id: str
+    exercises: list[dict]
+    lines: list[str] = field(default_factory=list)
+    by_rowid: dict[str, dict] = field(default_factory=dict)
+    by_name: dict[str, dict] = field(default_factory=dict)
+    by_normalized_name: dict[str, dict] = field(default_factory=dict)
+    # Scoring arrays built lazily by catalog_ranking
+    ranking_features: Any = field(default=None, repr=False)
+
+    @classmethod
+    def from_exercises(cls, exercises: list[dict], catalog_id: str | None = None) -> "ExerciseCatalog":
+        return cls(
+            catalog_id=catalog_id or compute_catalog_id(exercises),
+            exercises=exercises,
+            lines=[_render_line(ex) for ex in exercises],
+            by_rowid={str(ex["rowid"]): ex for ex in exercises},
+            by_name={ex["name"].strip().lower(): ex for ex in exercises},
+            by_normalized_name={normalize_name(ex["name"]): ex for ex in exercises},
+        )
+
+
+_memory: OrderedDict[str, ExerciseCatalog] = OrderedDict()
+
+
+def _remember(catalog: ExerciseCatalog) -> ExerciseCatalog:
+    _memory[catalog.catalog_id] = catalog
+    _memory.move_to_end(catalog.catalog_id)
+    while len(_memory) > CATALOG_MEMORY_ENTRIES:
+        _memory.popitem(last=False)
+    return catalog
+
+
+def catalog_from_exercises(exercises: list[dict]) -> ExerciseCatalog:
+    """Return the (possibly already rendered) catalog for an inline exercise list."""
+    catalog_id = compute_catalog_id(exercises)
+    cached = _memory.get(catalog_id)
+    if cached is not None:
+        _memory.move_to_end(catalog_id)
+        return cached
+    return _remember(ExerciseCatalog.from_exercises(exercises, catalog_id))
+
+
+async def register_catalog(exercises: list[dict]) -> ExerciseCatalog:
+    """Store a catalog in Redis (and memory) and return it with its id."""
+    catalog = catalog_from_exercises(exercises)
+    try:
+        await get_redis().set(
+            f"catalog:{catalog.catalog_id}",
+            fast_json.dumps(exercises),
+            ex=CATALOG_TTL_SECONDS,
+        )
+    except RuntimeError:
+        logger.warning("Redis not available — catalog %s held in memory only", catalog.catalog_id)
+    return catalog
+
+
+async def get_catalog(catalog_id: str) -> ExerciseCatalog:
+    """Resolve a catalogId from the memory LRU, falling back to Redis."""
+    cached = _memory.get(catalog_id)
+    if cached is not None:
+        _memory.move_to_end(catalog_id)
+        return cached
+
+    try:
+        # GETEX slides the TTL so catalogs in active use never expire
+        raw = await get_redis().getex(f"catalog:{catalog_id}", ex=CATALOG_TTL_SECONDS)
+    except RuntimeError:
+        raw = None
+    if raw is None:
+        raise CatalogNotFoundError(
+            f"Unknown catalogId '{catalog_id}' — upload it via POST /routine/catalog"
+        )
+
+    logger.debug("Loaded catalog from Redis | catalog=%s", catalog_id)
+    return _remember(ExerciseCatalog.from_exercises(fast_json.loads(raw), catalog_id))
+
+
+async def resolve_catalog(
+    catalog_id: str | None,
+    available_exercises: list[dict] | None,
+) -> ExerciseCatalog:
+    """Return the catalog for a request that carries either a catalogId or a list."""
+    if catalog_id:
+        return await get_catalog(catalog_id)
+    return catalog_from_exercises(available_exercises or [])
@@ -0,0 +1,86 @@
+"""
+Circuit breaker for calls to an unhealthy dependency.
+
+- closed: calls go through. `failure_threshold` consecutive failures open it.
+- open: allow() is False for `reset_seconds`, so callers take their
+  fallback at once instead of waiting on a dependency that is failing.
+- half-open: after that, allow() lets one trial call through (another one
+  every `reset_seconds` if the trial never reports back). A success closes
+  the breaker; a failure opens it again.
+
+State is per process and costs a few attribute reads per call. The state of
+every breaker is exported as pulse_circuit_breaker_state (0 closed,
+1 half-open, 2 open).
+"""
+
+import logging
+import time
+
+from app.core import metrics
+
+logger = logging.getLogger("pulse.circuit_breaker")
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._trial_until = 0.0
+        self._stats = {"opened": 0, "rejected": 0}
+        metrics.gauge_function(metrics.CIRCUIT_BREAKER_STATE.labels(name), lambda: _STATE_VALUES[self.state])
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return CLOSED
+        if time.monotonic() - self._opened_at < self.reset_seconds:
+            return OPEN
+        return HALF_OPEN
+
+    def allow(self) -> bool:
+        """Whether a call should be attempted now."""
+        state = self.state
+        if state == CLOSED:
+            return True
+        now = time.monotonic()
+        if state == HALF_OPEN and now >= self._trial_until:
+            self._trial_until = now + self.reset_seconds
+            logger.info("Circuit half-open, trying one call | breaker=%s", self.name)
+            return True
+        self._stats["rejected"] += 1
+        return False
+
+    def record_success(self) -> None:
+        if self._opened_at is not None:
+            logger.info("Circuit closed | breaker=%s", self.name)
+        self._failures = 0
+        self._opened_at = None
+        self._trial_until = 0.0
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self.state == HALF_OPEN or (self._opened_at is None and self._failures >= self.failure_threshold):
+            self.trip()
+
+    def trip(self) -> None:
+        """Open the breaker now, e.g. when the dependency is already down at startup."""
+        self._opened_at = time.monotonic()
+        self._trial_until = 0.0
+        self._stats["opened"] += 1
+        metrics.CIRCUIT_BREAKER_OPENED.labels(self.name).inc()
+        logger.warning(
+            "Circuit opened | breaker=%s failures=%d reset_seconds=%s",
+            self.name, self._failures, self.reset_seconds,
+        )
+
+    def snapshot(self) -> dict:
+        return {"state": self.state, "consecutiveFailures": self._failures, **self._stats}
@@ -0,0 +1,130 @@
+"""
+Compact routine wire format for model output.
+
+In the JSON format the model spends most of its output tokens repeating keys
+(set_index/target_reps/target_weight_kg per set) and full exercise names. In
+the compact format it writes one line per exercise instead:
+
+    Upper Body Strength
+    Compound pressing and pulling, heaviest lifts first.
+    12|4|6|120|Keep elbows tucked
+    37|3|10|90|
+
+(name, description, then rowid|sets|reps|rest_seconds|note). The server
+expands this into the ROUTINE_JSON_SCHEMA shape using the catalog's rowid
+index, so callers receive exactly what the JSON format would have produced.
+"""
+
+import logging
+import re
+
+from app.core.catalog_registry import ExerciseCatalog
+
+logger = logging.getLogger("pulse.compact_routine")
+
+COMPACT_OUTPUT_FORMAT = (
+    "Return ONLY the routine in this compact line format — no JSON, no markdown fences:\n"
+    "line 1: routine name\n"
+    "line 2: one-sentence description\n"
+    "then one line per exercise, in order: id|sets|reps|rest_seconds|note\n"
+    "(id from the list; sets, reps and rest_seconds are whole numbers; note is optional)\n"
+    "Example:\n"
+    "Upper Body Strength\n"
+    "Compound pressing and pulling, heaviest lifts first.\n"
+    "12|4|6|120|Keep elbows tucked\n"
+    "37|3|10|90|"
+)
+
+# A row starts with an integer id followed by '|'
+_ROW = re.compile(r"^\s*(\d+)\s*\|")
+_INT = re.compile(r"\d+")
+
+_MAX_SETS = 10
+_DEFAULT_REST_SECONDS = 90
+
+
+def _int(field: str, default: int | None = None) -> int | None:
+    match = _INT.search(field)
+    return int(match.group()) if match else default
+
+
+def expand_row(line: str, catalog: ExerciseCatalog, order_index: int) -> dict | None:
+    """Expand one id|sets|reps|rest|note row, or return None if it is unusable."""
+    fields = [f.strip() for f in line.split("|", 4)]
+    fields += [""] * (5 - len(fields))
+    rowid, sets, reps, rest, note = fields
+
+    exercise = catalog.by_rowid.get(rowid)
+    if exercise is None:
+        logger.warning("Compact routine row references unknown exercise id %s — dropped", rowid)
+        return None
+
+    set_count = max(1, min(_int(sets, 3), _MAX_SETS))
+    target_reps = _int(reps)
+    return {
+        "exercise_name": exercise["name"],
+        "exercise_library_id": str(exercise["rowid"]),
+        "sets_data": [
+            {"set_index": i, "target_reps": target_reps, "target_weight_kg": None}
+            for i in range(1, set_count + 1)
+        ],
+        "rest_seconds": _int(rest, _DEFAULT_REST_SECONDS),
+        "order_index": order_index,
+        "notes": note,
+    }
+
+
+class CompactRoutineParser:
+    """
+    Feed compact-format text in (whole or streamed); get expanded exercises
+    out as each row's line completes. After close(), routine() returns the
+    full routine.
+    """
+
+    def __init__(self, catalog: ExerciseCatalog) -> None:
+        self._catalog = catalog
+        self._buffer = ""
+        self._header: list[str] = []
+        self._exercises: list[dict] = []
+
+    def feed(self, chunk: str) -> list[dict]:
+        """Consume a chunk and return any exercises whose row it completed."""
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split("\n")
+        return [ex for ex in map(self._line, lines) if ex is not None]
+
+    def _line(self, line: str) -> dict | None:
+        line = line.strip()
+        if not line or line.startswith("```"):
+            return None
+        if not _ROW.match(line):
+            # Name and description; column headers and trailing text are ignored
+            if len(self._header) < 2 and not self._exercises and "|" not in line:
+                self._header.append(line)
+            return None
+        exercise = expand_row(line, self._catalog, len(self._exercises))
+        if exercise is not None:
+            self._exercises.append(exercise)
+        return exercise
+
+    def close(self) -> list[dict]:
+        """Flush an unterminated last line, returning its exercise if any."""
+        return self.feed("\n")
+
+    def routine(self) -> dict:
+        """Return the expanded routine received so far."""
+        if not self._header:
+            raise ValueError("Compact routine missing name line")
+        return {
+            "name": self._header[0],
+            "description": self._header[1] if len(self._header) > 1 else "",
+            "exercises": self._exercises,
+        }
+
+
+def parse_compact_routine(text: str, catalog: ExerciseCatalog) -> dict:
+    """Expand a complete compact-format response into the routine JSON shape."""
+    parser = CompactRoutineParser(catalog)
+    parser.feed(text)
+    parser.close()
+    return parser.routine()
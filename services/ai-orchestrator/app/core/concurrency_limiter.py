@@ -0,0 +1,244 @@
+"""
+Adaptive bulkhead around upstream OpenAI calls.
+
+Every chat.completions call made by openai_client runs inside a limiter slot.
+The number of slots adapts AIMD-style to how the upstream is coping:
+
+- Each call that completes within OPENAI_LATENCY_TOLERANCE x its endpoint's
+  baseline latency adds 1/limit to the limit (about +1 per limit's worth of
+  calls).
+- A slow or timed-out call shrinks the limit by 10% and an upstream 429
+  (after the SDK's own retries) halves it, at most once per baseline
+  latency, so one burst of congested responses counts as one signal.
+
+Baselines are tracked per endpoint (a generate takes several times longer
+than an explain) and, for streams, measure time to first token.
+
+Callers beyond the limit wait in a bounded priority queue — routine
+generation/adaptation ahead of explanations and summaries. If the queue is
+full, or a waiter is not admitted within OPENAI_QUEUE_TIMEOUT_SECONDS,
+UpstreamOverloadedError is raised and the routers answer 503 with
+Retry-After. That is cheaper for everyone than letting the call run into the
+web app's 30 s request timeout after it has already cost tokens. A waiter
+whose request deadline (see deadline) comes first gets DeadlineExceededError.
+
+The limit is per process; each replica adapts on its own.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from openai import APITimeoutError, RateLimitError
+
+from app.core import deadline, metrics
+from app.core.config import (
+    OPENAI_CONCURRENCY_INITIAL,
+    OPENAI_CONCURRENCY_MAX,
+    OPENAI_CONCURRENCY_MIN,
+    OPENAI_LATENCY_TOLERANCE,
+    OPENAI_QUEUE_MAX,
+    OPENAI_QUEUE_TIMEOUT_SECONDS,
+)
+
+logger = logging.getLogger("pulse.concurrency_limiter")
+
+# Lower value = admitted first. Unknown endpoints queue behind everything.
+ENDPOINT_PRIORITY = {
+    "generate": 0,
+    "adapt": 0,
+    "explain": 1,
+    "summarize": 1,
+}
+_LOWEST_PRIORITY = 2
+
+_BACKOFF_THROTTLED = 0.5
+_BACKOFF_SLOW = 0.9
+# Weight of each new sample in the per-endpoint baseline latency
+_BASELINE_ALPHA = 0.05
+_MAX_RETRY_AFTER_SECONDS = 30
+
+
+class UpstreamOverloadedError(RuntimeError):
+    """Raised when a call is shed instead of queued for an upstream slot."""
+
+    def __init__(self, message: str, retry_after: int) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Permit:
+    """Handed to the holder of a slot; streams call first_token() on their first delta."""
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.latency: float | None = None
+
+    def first_token(self) -> None:
+        if self.latency is None:
+            self.latency = time.monotonic() - self.started
+
+
+class AdaptiveConcurrencyLimiter:
+    def __init__(
+        self,
+        initial: int = OPENAI_CONCURRENCY_INITIAL,
+        minimum: int = OPENAI_CONCURRENCY_MIN,
+        maximum: int = OPENAI_CONCURRENCY_MAX,
+        max_queue: int = OPENAI_QUEUE_MAX,
+        queue_timeout: float = OPENAI_QUEUE_TIMEOUT_SECONDS,
+        latency_tolerance: float = OPENAI_LATENCY_TOLERANCE,
+    ) -> None:
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.latency_tolerance = latency_tolerance
+
+        self._in_flight = 0
+        self._waiting = 0
+        self._queue: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._baselines: dict[str, float] = {}
+        self._last_decrease = 0.0
+
+    # --- admission ---
+
+    def _capacity(self) -> int:
+        return int(self.limit)
+
+    def retry_after(self) -> int:
+        """Estimate how long until a shed caller would be admitted."""
+        typical = max(self._baselines.values(), default=1.0)
+        backlog = (self._waiting + 1) / max(self._capacity(), 1)
+        return max(1, min(math.ceil(typical * backlog), _MAX_RETRY_AFTER_SECONDS))
+
+    def _shed(self, reason: str, endpoint: str) -> UpstreamOverloadedError:
+        retry_after = self.retry_after()
+        metrics.UPSTREAM_SHED.labels(endpoint, reason).inc()
+        logger.warning(
+            "Shedding upstream call | endpoint=%s reason=%s limit=%d in_flight=%d queued=%d retry_after=%ds",
+            endpoint, reason, self._capacity(), self._in_flight, self._waiting, retry_after,
+        )
+        return UpstreamOverloadedError(
+            "AI service is at capacity, please retry shortly", retry_after
+        )
+
+    def has_capacity(self) -> bool:
+        """True if a call would be admitted without waiting."""
+        return not self._waiting and self._in_flight < self._capacity()
+
+    def ensure_capacity(self, endpoint: str) -> None:
+        """Raise UpstreamOverloadedError now if a call for endpoint would be shed."""
+        if self._waiting >= self.max_queue and self._in_flight >= self._capacity():
+            raise self._shed("queue full", endpoint)
+
+    async def _acquire(self, endpoint: str) -> None:
+        if self.has_capacity():
+            self._in_flight += 1
+            return
+        self.ensure_capacity(endpoint)
+        # Never wait past the caller's deadline
+        left = deadline.remaining()
+        timeout = self.queue_timeout if left is None else min(self.queue_timeout, max(left, 0))
+
+        future = asyncio.get_running_loop().create_future()
+        priority = ENDPOINT_PRIORITY.get(endpoint, _LOWEST_PRIORITY)
+        heapq.heappush(self._queue, (priority, next(self._seq), future))
+        self._waiting += 1
+        queued_at = time.perf_counter()
+        try:
+            async with asyncio.timeout(timeout):
+                await future
+        except TimeoutError:
+            if future.done() and not future.cancelled():
+                # Admitted as the timeout fired; hand the slot back
+                self._release_slot()
+            if timeout < self.queue_timeout:
+                raise deadline.DeadlineExceededError("Request deadline exceeded waiting for an upstream slot") from None
+            raise self._shed("queue timeout", endpoint) from None
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release_slot()
+            raise
+        finally:
+            self._waiting -= 1
+            metrics.observe_stage("upstream_queue", endpoint, time.perf_counter() - queued_at)
+
+    def _dispatch(self) -> None:
+        """Admit queued callers, highest priority first, while slots are free."""
+        while self._queue and self._in_flight < self._capacity():
+            _, _, future = heapq.heappop(self._queue)
+            if future.done():
+                # Timed out or cancelled while waiting
+                continue
+            self._in_flight += 1
+            future.set_result(None)
+
+    def _release_slot(self) -> None:
+        self._in_flight -= 1
+        self._dispatch()
+
+    # --- adaptation ---
+
+    def _decrease(self, factor: float, endpoint: str) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < self._baselines.get(endpoint, 0.0):
+            return
+        self._last_decrease = now
+        previous = self.limit
+        self.limit = max(self.minimum, self.limit * factor)
+        if int(previous) != int(self.limit):
+            logger.info("Upstream concurrency limit lowered | limit=%d endpoint=%s", int(self.limit), endpoint)
+
+    def _on_success(self, endpoint: str, latency: float) -> None:
+        baseline = self._baselines.get(endpoint)
+        if baseline is None:
+            self._baselines[endpoint] = latency
+        elif latency > baseline * self.latency_tolerance:
+            self._decrease(_BACKOFF_SLOW, endpoint)
+            # Drift towards the new normal so a lasting slowdown stops counting as congestion
+            self._baselines[endpoint] = baseline + (latency - baseline) * _BASELINE_ALPHA
+            return
+        else:
+            self._baselines[endpoint] = baseline + (latency - baseline) * _BASELINE_ALPHA
+
+        # Additive increase only while the limit is actually being used
+        if self._in_flight >= self._capacity() - 1:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    @asynccontextmanager
+    async def slot(self, endpoint: str) -> AsyncIterator[_Permit]:
+        """
+        Hold one upstream slot for the duration of the block. Raises
+        UpstreamOverloadedError if the call is shed.
+        """
+        await self._acquire(endpoint)
+        permit = _Permit()
+        try:
+            yield permit
+        except RateLimitError:
+            self._decrease(_BACKOFF_THROTTLED, endpoint)
+            raise
+        except APITimeoutError:
+            self._decrease(_BACKOFF_SLOW, endpoint)
+            raise
+        else:
+            latency = permit.latency if permit.latency is not None else time.monotonic() - permit.started
+            self._on_success(endpoint, latency)
+        finally:
+            self._release_slot()
+
+
+upstream_limiter = AdaptiveConcurrencyLimiter()
+
+# Read at scrape time, so admitting a call costs nothing extra
+metrics.gauge_function(metrics.UPSTREAM_IN_FLIGHT, lambda: upstream_limiter._in_flight)
+metrics.gauge_function(metrics.UPSTREAM_WAITING, lambda: upstream_limiter._waiting)
+metrics.gauge_function(metrics.UPSTREAM_LIMIT, lambda: upstream_limiter._capacity())
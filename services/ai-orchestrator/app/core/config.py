@@ -7,15 +7,139 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 OPENAI_MAX_TOKENS = int(os.getenv("OPENAI_MAX_TOKENS", "1024"))
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "")  # e.g. a local fake for tests/benchmarks
+# Comma-separated pool of keys to spread load over (see model_router)
+OPENAI_API_KEYS = [k.strip() for k in os.getenv("OPENAI_API_KEYS", "").split(",") if k.strip()] or [OPENAI_API_KEY]
+# Per-endpoint models, e.g. OPENAI_MODEL_EXPLAIN=gpt-4.1-nano (default OPENAI_MODEL)
+OPENAI_ENDPOINT_MODELS = {
+    endpoint: os.getenv(f"OPENAI_MODEL_{endpoint.upper()}", "")
+    for endpoint in ("generate", "adapt", "explain", "summarize")
+}
+OPENAI_FALLBACK_MODEL = os.getenv("OPENAI_FALLBACK_MODEL", "")
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "60"))
+# SDK retries per call; only used with a single key (a pool fails over instead)
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+# Connection pool per key
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+# Default model output format for routines: "json" or "compact" (see compact_routine)
+ROUTINE_OUTPUT_FORMAT = os.getenv("ROUTINE_OUTPUT_FORMAT", "json")
+# Default /routine/adapt mode: "full" (model rewrites the routine) or "delta" (model returns changes, see routine_delta)
+ADAPT_MODE = os.getenv("ADAPT_MODE", "full")
+
+# --- Upstream circuit breaker and rule-based routines (see circuit_breaker, rule_engine) ---
+# Consecutive failed OpenAI calls that open the breaker, and how long it stays open before a trial call
+UPSTREAM_BREAKER_FAILURES = int(os.getenv("UPSTREAM_BREAKER_FAILURES", "5"))
+UPSTREAM_BREAKER_RESET_SECONDS = float(os.getenv("UPSTREAM_BREAKER_RESET_SECONDS", "30"))
+# Default engine for /routine/generate: "ai" or "rules" (per request via `engine`)
+ROUTINE_ENGINE = os.getenv("ROUTINE_ENGINE", "ai")
+# Serve a rule-based routine instead of an error while the breaker is open or the AI call fails
+ROUTINE_RULES_FALLBACK = os.getenv("ROUTINE_RULES_FALLBACK", "true").lower() in ("1", "true", "yes")
 
 # --- Redis ---
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# API socket timeouts; a hung Redis costs a request at most about this long
+# per round trip (the job worker keeps redis-py's defaults)
+REDIS_SOCKET_TIMEOUT_SECONDS = float(os.getenv("REDIS_SOCKET_TIMEOUT_SECONDS", "0.25"))
+REDIS_CONNECT_TIMEOUT_SECONDS = float(os.getenv("REDIS_CONNECT_TIMEOUT_SECONDS", "0.5"))
+# Consecutive failures that open the Redis circuit breaker; while it is open
+# Redis is skipped and rate limits are enforced in process
+REDIS_BREAKER_FAILURES = int(os.getenv("REDIS_BREAKER_FAILURES", "3"))
+REDIS_BREAKER_RESET_SECONDS = float(os.getenv("REDIS_BREAKER_RESET_SECONDS", "5"))
+# Background ping that detects an outage without traffic and reconnects after one
+REDIS_HEALTH_CHECK_SECONDS = float(os.getenv("REDIS_HEALTH_CHECK_SECONDS", "1"))
 
 # --- Per-user rate limits ---
 RATE_LIMIT_PER_MINUTE = int(os.getenv("RATE_LIMIT_PER_MINUTE", "5"))
 RATE_LIMIT_PER_HOUR = int(os.getenv("RATE_LIMIT_PER_HOUR", "30"))
 RATE_LIMIT_PER_DAY = int(os.getenv("RATE_LIMIT_PER_DAY", "100"))
+# "zset" = exact sliding window, "counter" = O(1)-memory sliding-window approximation
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "zset")
+# Users tracked by the in-process limiter used while Redis is unavailable
+RATE_LIMIT_LOCAL_MAX_USERS = int(os.getenv("RATE_LIMIT_LOCAL_MAX_USERS", "10000"))
+
+# --- Per-user token budgets (0 = disabled), counted from OpenAI usage ---
+TOKEN_LIMIT_PER_MINUTE = int(os.getenv("TOKEN_LIMIT_PER_MINUTE", "0"))
+TOKEN_LIMIT_PER_HOUR = int(os.getenv("TOKEN_LIMIT_PER_HOUR", "0"))
+TOKEN_LIMIT_PER_DAY = int(os.getenv("TOKEN_LIMIT_PER_DAY", "0"))
+USAGE_RETENTION_DAYS = int(os.getenv("USAGE_RETENTION_DAYS", "35"))
 
 # --- Cost protection ---
 MAX_PROMPT_CHARS = int(os.getenv("MAX_PROMPT_CHARS", "20000"))
 
+# --- Prompt assembly (history is compacted and trimmed to fit these) ---
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "4000"))
+PROMPT_HISTORY_TOKEN_BUDGET = int(os.getenv("PROMPT_HISTORY_TOKEN_BUDGET", "800"))
+
+# --- Routine output repair ---
+# Request strict json_schema structured outputs in JSON mode (disabled
+# automatically if the upstream rejects them)
+OPENAI_STRUCTURED_OUTPUTS = os.getenv("OPENAI_STRUCTURED_OUTPUTS", "true").lower() in ("1", "true", "yes")
+# Targeted re-asks when a routine response cannot be repaired
+ROUTINE_REASK_ATTEMPTS = int(os.getenv("ROUTINE_REASK_ATTEMPTS", "1"))
+
+# --- Upstream concurrency (adaptive per-process limit on in-flight OpenAI calls) ---
+OPENAI_CONCURRENCY_INITIAL = int(os.getenv("OPENAI_CONCURRENCY_INITIAL", "16"))
+OPENAI_CONCURRENCY_MIN = int(os.getenv("OPENAI_CONCURRENCY_MIN", "2"))
+OPENAI_CONCURRENCY_MAX = int(os.getenv("OPENAI_CONCURRENCY_MAX", "64"))
+# Callers waiting for a slot beyond this are shed with 503
+OPENAI_QUEUE_MAX = int(os.getenv("OPENAI_QUEUE_MAX", "64"))
+OPENAI_QUEUE_TIMEOUT_SECONDS = float(os.getenv("OPENAI_QUEUE_TIMEOUT_SECONDS", "10"))
+# A call slower than this multiple of its endpoint's baseline counts as congestion
+OPENAI_LATENCY_TOLERANCE = float(os.getenv("OPENAI_LATENCY_TOLERANCE", "2.0"))
+
+# --- Request deadlines (see deadline.py) ---
+# Used when a caller sends no X-Request-Timeout-Ms header (0 = no deadline)
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "0"))
+# Reserved out of the caller's budget for sending the response back
+DEADLINE_MARGIN_MS = int(os.getenv("DEADLINE_MARGIN_MS", "250"))
+# Hedge non-streaming OpenAI calls slower than this latency percentile of
+# their endpoint with a second attempt (0 = disabled; doubles cost for those calls)
+OPENAI_HEDGE_PERCENTILE = float(os.getenv("OPENAI_HEDGE_PERCENTILE", "0"))
+
+# --- Response cache ---
+CACHE_TTL_GENERATE_SECONDS = int(os.getenv("CACHE_TTL_GENERATE_SECONDS", "600"))
+CACHE_TTL_EXPLAIN_SECONDS = int(os.getenv("CACHE_TTL_EXPLAIN_SECONDS", "86400"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "5000"))
+
+# --- Single-flight coalescing ---
+SINGLEFLIGHT_LOCK_TTL_MS = int(os.getenv("SINGLEFLIGHT_LOCK_TTL_MS", "60000"))
+SINGLEFLIGHT_WAIT_SECONDS = float(os.getenv("SINGLEFLIGHT_WAIT_SECONDS", "45"))
+
+# --- Batch generation ---
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+
+# --- Exercise catalog registry ---
+CATALOG_TTL_SECONDS = int(os.getenv("CATALOG_TTL_SECONDS", str(7 * 86400)))
+CATALOG_MEMORY_ENTRIES = int(os.getenv("CATALOG_MEMORY_ENTRIES", "64"))
+# Most recently used catalogs loaded from Redis and rendered at startup (see warmup)
+CATALOG_PRELOAD_ENTRIES = int(os.getenv("CATALOG_PRELOAD_ENTRIES", "16"))
+
+# --- Catalog ranking (prompt catalog is sized to this token budget) ---
+CATALOG_TOKEN_BUDGET = int(os.getenv("CATALOG_TOKEN_BUDGET", "1500"))
+CATALOG_MIN_EXERCISES = int(os.getenv("CATALOG_MIN_EXERCISES", "20"))
+
+# --- Logging (see logging_config) ---
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # "json" lines, or "text" for local development
+# Records waiting for the writer thread; past this, new records are dropped rather than blocking
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# At most LOG_SAMPLE_BURST records per message per window (0 = keep all); errors are never dropped
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "20"))
+LOG_SAMPLE_WINDOW_SECONDS = float(os.getenv("LOG_SAMPLE_WINDOW_SECONDS", "10"))
+
+# --- Precomputed jobs (see jobs.py; run workers with python -m app.worker) ---
+# Jobs enqueued for every generated or adapted routine (empty = disabled)
+JOB_KINDS = [k.strip() for k in os.getenv("JOB_KINDS", "explain,summarize").split(",") if k.strip()]
+JOB_RESULT_TTL_SECONDS = int(os.getenv("JOB_RESULT_TTL_SECONDS", "86400"))
+JOB_STREAM_MAXLEN = int(os.getenv("JOB_STREAM_MAXLEN", "10000"))
+# How long a request waits for a queued or running job before computing inline
+JOB_WAIT_SECONDS = float(os.getenv("JOB_WAIT_SECONDS", "10"))
+# Jobs one worker process runs at a time
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "8"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Unacked jobs (failed calls, dead workers) are claimed again after this long
+JOB_RETRY_IDLE_SECONDS = float(os.getenv("JOB_RETRY_IDLE_SECONDS", "30"))
+# Worker /metrics port (0 = off)
+JOB_WORKER_METRICS_PORT = int(os.getenv("JOB_WORKER_METRICS_PORT", "9101"))
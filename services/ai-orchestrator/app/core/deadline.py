@@ -0,0 +1,139 @@
+"""
+Request deadlines and cancellation on client disconnect.
+
+Callers send their remaining time budget in the X-Request-Timeout-Ms header
+(relative, so clock skew between hosts does not matter). apply_deadline turns
+it into an absolute monotonic deadline, less DEADLINE_MARGIN_MS for sending
+the response back, and stores it in a context variable for the rest of the
+request:
+
+- model_router passes the remaining budget as the OpenAI request timeout, and
+  openai_client bounds the whole call (retries and failover included) with
+  bound().
+- The upstream concurrency limiter never queues a call past the deadline.
+- Anything still running at the deadline raises DeadlineExceededError, which
+  the routers answer with 504.
+
+Requests without the header get REQUEST_DEADLINE_SECONDS (0 = no deadline,
+e.g. for batch jobs).
+
+cancel_on_disconnect runs an endpoint's work as a task and cancels it as soon
+as the client goes away, so an abandoned request stops paying for its
+completion. Streaming responses need no help: Starlette already cancels them
+on disconnect.
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable
+
+from fastapi import HTTPException, Request
+from openai import APITimeoutError
+
+from app.core.config import DEADLINE_MARGIN_MS, REQUEST_DEADLINE_SECONDS
+
+logger = logging.getLogger("pulse.deadline")
+
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+
+# time.monotonic() value by which the current request must be answered
+_deadline: ContextVar[float | None] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceededError(TimeoutError):
+    """Raised when the caller's deadline passes before the work is done."""
+
+
+def set_deadline(budget_seconds: float | None) -> None:
+    """Set the current context's deadline budget_seconds from now (None clears it)."""
+    _deadline.set(time.monotonic() + budget_seconds if budget_seconds is not None else None)
+
+
+def remaining() -> float | None:
+    """Seconds left before the current deadline, or None if there is none."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check() -> None:
+    """Raise DeadlineExceededError if the current deadline has passed."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceededError("Request deadline exceeded")
+
+
+@asynccontextmanager
+async def bound() -> AsyncIterator[None]:
+    """
+    Cancel the block when the current deadline passes, raising
+    DeadlineExceededError. Must not wrap a yield in an async generator.
+    """
+    left = remaining()
+    if left is None:
+        yield
+        return
+    check()
+    try:
+        async with asyncio.timeout(left):
+            yield
+    except (TimeoutError, APITimeoutError) as e:
+        if isinstance(e, DeadlineExceededError) or (remaining() or 0) > 0:
+            raise
+        raise DeadlineExceededError("Request deadline exceeded") from e
+
+
+async def apply_deadline(request: Request) -> None:
+    """
+    FastAPI dependency: set the request's deadline from X-Request-Timeout-Ms
+    (or REQUEST_DEADLINE_SECONDS when the header is absent).
+    """
+    header = request.headers.get(DEADLINE_HEADER)
+    if header is None:
+        set_deadline(REQUEST_DEADLINE_SECONDS or None)
+        return
+    try:
+        budget_ms = float(header)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {DEADLINE_HEADER} header: {header!r}")
+    if budget_ms <= DEADLINE_MARGIN_MS:
+        raise HTTPException(status_code=504, detail="Request deadline exceeded before processing")
+    set_deadline((budget_ms - DEADLINE_MARGIN_MS) / 1000)
+
+
+class ClientDisconnectedError(Exception):
+    """Raised by cancel_on_disconnect when the client went away first."""
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    # The body has already been read, so the next message is the disconnect
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def cancel_on_disconnect(request: Request, work: Awaitable[Any]) -> Any:
+    """
+    Await work, cancelling it if the client disconnects first (then raising
+    ClientDisconnectedError).
+    """
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        watcher.cancel()
+
+    if task.done():
+        return task.result()
+    task.cancel()
+    # Let it unwind (closing the upstream connection) before returning
+    await asyncio.wait({task})
+    logger.info("Client disconnected — cancelled upstream work | path=%s", request.url.path)
+    raise ClientDisconnectedError()
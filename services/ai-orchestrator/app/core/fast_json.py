@@ -0,0 +1,65 @@
+"""
+orjson-backed JSON encoding and parse-once request bodies.
+
+Request bodies carry whole exercise catalogs (hundreds of dicts), so every
+extra decode or stdlib encode of them shows up in request latency.
+
+- ParseOnceRoute decodes a request body once with orjson; FastAPI's body
+  validation and any dependency calling `await request.json()` (the rate
+  limiter) share that one parsed value.
+- dumps/canonical are the encoders used for cache values, SSE/NDJSON lines
+  and content hashes.
+"""
+
+import time
+from typing import Any, Callable, Coroutine
+
+import orjson
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+
+from app.core import metrics
+
+
+def loads(data: bytes | str) -> Any:
+    return orjson.loads(data)
+
+
+def dumps(value: Any) -> str:
+    """Encode value as compact JSON text (non-JSON types fall back to str())."""
+    return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+def canonical(value: Any) -> bytes:
+    """Encode value with sorted keys, for hashing."""
+    return orjson.dumps(
+        value,
+        default=str,
+        option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS,
+    )
+
+
+class ParseOnceRequest(Request):
+    """A Request whose json() decodes the body with orjson, at most once."""
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            # orjson.JSONDecodeError subclasses json.JSONDecodeError, so FastAPI
+            # still turns malformed bodies into a 422.
+            body = await self.body()
+            start = time.perf_counter()
+            self._json = orjson.loads(body)
+            metrics.observe_stage("body_parse", metrics.route_endpoint(self.url.path), time.perf_counter() - start)
+        return self._json
+
+
+class ParseOnceRoute(APIRoute):
+    """Route class that hands endpoints and their dependencies a ParseOnceRequest."""
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+
+        async def parse_once_handler(request: Request) -> Response:
+            return await handler(ParseOnceRequest(request.scope, request.receive))
+
+        return parse_once_handler
@@ -0,0 +1,88 @@
+"""
+Hedged requests for non-streaming OpenAI calls.
+
+A small fraction of completions take far longer than the rest for reasons
+unrelated to the request (a slow replica upstream, a stalled connection).
+With OPENAI_HEDGE_PERCENTILE set (e.g. 95), a call still running after its
+endpoint's p95 latency gets a second, identical attempt and the first to
+succeed wins; the other is cancelled, closing its connection.
+
+A hedge is only sent when the upstream concurrency limiter has a free slot
+right away, so hedging never queues or sheds, and never while fewer than
+_MIN_SAMPLES latencies have been seen for the endpoint. Hedged calls can be
+billed twice, so this is off by default.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, TypeVar
+
+from app.core import metrics
+from app.core.config import OPENAI_HEDGE_PERCENTILE
+
+logger = logging.getLogger("pulse.hedging")
+
+T = TypeVar("T")
+
+_MIN_SAMPLES = 20
+_WINDOW = 200
+
+# Recent successful attempt latencies per endpoint, in seconds
+_latencies: dict[str, deque[float]] = {}
+
+
+def record_latency(endpoint: str, seconds: float) -> None:
+    _latencies.setdefault(endpoint, deque(maxlen=_WINDOW)).append(seconds)
+
+
+def hedge_delay(endpoint: str, percentile: float = OPENAI_HEDGE_PERCENTILE) -> float | None:
+    """Seconds after which a call to endpoint should be hedged, or None to never hedge."""
+    samples = _latencies.get(endpoint)
+    if percentile <= 0 or samples is None or len(samples) < _MIN_SAMPLES:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+async def _timed(endpoint: str, attempt: Callable[[], Awaitable[T]]) -> T:
+    start = time.monotonic()
+    result = await attempt()
+    record_latency(endpoint, time.monotonic() - start)
+    return result
+
+
+async def hedged(
+    endpoint: str,
+    attempt: Callable[[], Awaitable[T]],
+    spare_capacity: Callable[[], bool],
+) -> T:
+    """
+    Await attempt(), starting a second attempt() if the first is slower than
+    the endpoint's hedge_delay and spare_capacity() allows it.
+    """
+    first = asyncio.ensure_future(_timed(endpoint, attempt))
+    delay = hedge_delay(endpoint)
+    pending = {first}
+    try:
+        if delay is not None:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done and spare_capacity():
+                metrics.UPSTREAM_HEDGES.labels(endpoint, "sent").inc()
+                logger.debug("Hedging slow upstream call | endpoint=%s after=%.2fs", endpoint, delay)
+                pending.add(asyncio.ensure_future(_timed(endpoint, attempt)))
+
+        error: BaseException | None = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not first:
+                        metrics.UPSTREAM_HEDGES.labels(endpoint, "won").inc()
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,216 @@
+"""
+Precomputed explain/summary jobs on a Redis Stream.
+
+When a routine is generated (or adapted) the orchestrator enqueues an
+`explain` and a `summarize` job for it, so that the follow-up
+/routine/explain call a client almost always makes finds its answer ready
+instead of starting a fresh OpenAI call. Jobs run in a separate worker
+process (python -m app.worker), off the API's event loop and upstream
+limiter.
+
+Layout:
+
+- jobs:stream — one entry per job (kind, job id, payload), trimmed to about
+  JOB_STREAM_MAXLEN entries and read by the `ai-workers` consumer group.
+- job:{id} — a hash with the job's status (queued, running, done, failed),
+  attempts, the hash of the profile it was enqueued with and, once done,
+  the result. It lives for JOB_RESULT_TTL_SECONDS.
+- The hash key doubles as a pub/sub channel: the worker publishes the final
+  status there, so a request that arrives while the job is still running
+  waits for it rather than calling upstream a second time.
+- jobs:workers — a heartbeat key the workers refresh. Nothing is enqueued
+  while no worker is alive, so a deployment without workers behaves exactly
+  as before.
+
+The job id is the endpoint fingerprint of the routine (response_cache), so
+the same routine is only ever enqueued once per JOB_RESULT_TTL_SECONDS and
+a prompt change (PROMPT_VERSION) starts fresh jobs.
+
+A worker acks a message only once the job is done or has failed
+JOB_MAX_ATTEMPTS times. A message left unacked — the call failed, or the
+worker died mid-job — is claimed again by a worker after
+JOB_RETRY_IDLE_SECONDS. Jobs that run out of attempts are copied to
+jobs:dead for inspection.
+
+If Redis is unavailable, or the job is missing, failed or does not finish
+within JOB_WAIT_SECONDS (or the request deadline), the request computes its
+answer inline as before.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+from app.core import deadline, fast_json, metrics
+from app.core.config import (
+    JOB_KINDS,
+    JOB_RESULT_TTL_SECONDS,
+    JOB_STREAM_MAXLEN,
+    JOB_WAIT_SECONDS,
+)
+from app.core.redis_client import get_redis
+from app.core.response_cache import fingerprint
+from app.core.usage import current_user_id
+
+logger = logging.getLogger("pulse.jobs")
+
+STREAM = "jobs:stream"
+DEAD_LETTER_STREAM = "jobs:dead"
+GROUP = "ai-workers"
+HEARTBEAT_KEY = "jobs:workers"
+
+# Lua script: enqueue a job unless no worker is alive or it already exists.
+# KEYS[1] = heartbeat, KEYS[2] = job hash, KEYS[3] = stream
+# ARGV[1] = kind, ARGV[2] = job id, ARGV[3] = profile hash, ARGV[4] = payload,
+# ARGV[5] = hash TTL, ARGV[6] = stream max length, ARGV[7] = now (ms)
+# Returns 1 if enqueued, 0 if no worker is alive, -1 if the job exists.
+_LUA_ENQUEUE = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return -1
+end
+redis.call('HSET', KEYS[2], 'kind', ARGV[1], 'status', 'queued', 'profile', ARGV[3], 'attempts', 0, 'enqueued', ARGV[7])
+redis.call('EXPIRE', KEYS[2], ARGV[5])
+redis.call('XADD', KEYS[3], 'MAXLEN', '~', ARGV[6], '*', 'kind', ARGV[1], 'job', ARGV[2], 'payload', ARGV[4])
+return 1
+"""
+
+# Strong references to fire-and-forget enqueue tasks until they finish
+_pending: set[asyncio.Task] = set()
+
+
+def job_id(kind: str, routine: dict) -> str:
+    """The job id for a routine: its fingerprint for the endpoint that serves it."""
+    return fingerprint(kind, {"routine": routine})
+
+
+def job_key(job: str) -> str:
+    return f"job:{job}"
+
+
+def profile_hash(profile: dict | None) -> str:
+    return fingerprint("profile", profile) if profile else ""
+
+
+async def enqueue(kind: str, routine: dict, profile: dict | None, user_id: str | None) -> bool:
+    """Enqueue one job; returns True if a new job was added to the stream."""
+    job = job_id(kind, routine)
+    payload = fast_json.dumps({"routine": routine, "profile": profile, "userId": user_id})
+    added = await get_redis().eval(
+        _LUA_ENQUEUE,
+        3,
+        HEARTBEAT_KEY,
+        job_key(job),
+        STREAM,
+        kind,
+        job,
+        profile_hash(profile),
+        payload,
+        JOB_RESULT_TTL_SECONDS,
+        JOB_STREAM_MAXLEN,
+        int(time.time() * 1000),
+    )
+    if added == 1:
+        metrics.JOBS_ENQUEUED.labels(kind).inc()
+        logger.debug("Job enqueued | kind=%s job=%s", kind, job)
+    return added == 1
+
+
+async def _enqueue_all(routine: dict, profile: dict | None, user_id: str | None) -> None:
+    for kind in JOB_KINDS:
+        try:
+            await enqueue(kind, routine, profile, user_id)
+        except Exception as e:
+            logger.warning("Failed to enqueue job | kind=%s: %s", kind, e)
+            return
+
+
+def precompute(routine: dict, profile: dict | None = None) -> None:
+    """
+    Enqueue the follow-up jobs for a routine in the background.
+
+    Never blocks or fails the caller; a no-op without Redis or JOB_KINDS.
+    """
+    if not JOB_KINDS:
+        return
+    try:
+        get_redis()
+    except RuntimeError:
+        return
+    task = asyncio.ensure_future(_enqueue_all(routine, profile, current_user_id.get()))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
+
+
+async def _await_job(key: str, profile: dict | None) -> tuple[str, dict]:
+    """
+    Wait for the job at key to finish; returns (outcome, job hash).
+
+    outcome is hit, miss (no such job), profile_mismatch, failed or timeout.
+    """
+    redis_client = get_redis()
+    pubsub = redis_client.pubsub()
+    try:
+        # Subscribe before reading the hash so a publish in between cannot be missed
+        await pubsub.subscribe(key)
+        job = await redis_client.hgetall(key)
+        if not job:
+            return "miss", job
+        if profile and job.get("profile") != profile_hash(profile):
+            return "profile_mismatch", job
+
+        budget = JOB_WAIT_SECONDS
+        left = deadline.remaining()
+        if left is not None:
+            budget = min(budget, left)
+        wait_until = time.monotonic() + budget
+        while job.get("status") not in ("done", "failed"):
+            remaining = wait_until - time.monotonic()
+            if remaining <= 0:
+                return "timeout", job
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+            if message is not None:
+                job = await redis_client.hgetall(key)
+                if not job:
+                    return "miss", job
+    finally:
+        await pubsub.aclose()
+    return ("hit" if job["status"] == "done" else "failed"), job
+
+
+async def precomputed_or(
+    kind: str,
+    routine: dict,
+    profile: dict | None,
+    compute: Callable[[], Awaitable[Any]],
+) -> Any:
+    """
+    Return the job's result for this routine, waiting if it is still queued
+    or running, or fall back to compute().
+
+    A job enqueued with a different profile does not count (a request
+    without a profile accepts any).
+    """
+    try:
+        get_redis()
+    except RuntimeError:
+        return await compute()
+
+    start = time.perf_counter()
+    try:
+        outcome, job = await _await_job(job_key(job_id(kind, routine)), profile)
+    except Exception as e:
+        logger.warning("Job lookup failed — computing inline | kind=%s: %s", kind, e)
+        return await compute()
+    metrics.JOB_LOOKUPS.labels(kind, outcome).inc()
+    metrics.observe_stage("job_wait", kind, time.perf_counter() - start)
+
+    if outcome == "hit":
+        logger.debug("Serving precomputed result | kind=%s", kind)
+        return fast_json.loads(job["result"])
+    if outcome in ("failed", "timeout"):
+        logger.info("Precomputed job unavailable — computing inline | kind=%s outcome=%s", kind, outcome)
+    return await compute()
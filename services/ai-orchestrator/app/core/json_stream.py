@@ -0,0 +1,80 @@
+"""
+Incremental JSON parsing for streamed routine completions.
+
+The model streams a routine as one JSON object. ExerciseStreamParser scans
+each chunk exactly once, tracking string/escape state and container nesting,
+and returns every element of the top-level "exercises" array as soon as its
+closing brace arrives — long before the full routine has been generated.
+"""
+
+import json
+
+
+class ExerciseStreamParser:
+    """Feed text chunks in; get completed top-level exercise objects out."""
+
+    def __init__(self) -> None:
+        self._text = ""
+        self._pos = 0
+        self._stack: list[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+        self._last_string = ""
+        self._key_at_root = ""
+        self._exercises_depth = -1
+        self._object_start = -1
+
+    @property
+    def text(self) -> str:
+        """The full text received so far."""
+        return self._text
+
+    def feed(self, chunk: str) -> list[dict]:
+        """Consume a chunk and return any exercise objects it completed."""
+        self._text += chunk
+        text = self._text
+        completed: list[dict] = []
+
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start:i + 1]
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch == ":":
+                # A string followed by ':' directly inside the root object is a key
+                if len(self._stack) == 1 and self._stack[0] == "{":
+                    self._key_at_root = json.loads(self._last_string)
+            elif ch in "{[":
+                if (
+                    ch == "["
+                    and len(self._stack) == 1
+                    and self._key_at_root == "exercises"
+                ):
+                    self._exercises_depth = len(self._stack) + 1
+                elif ch == "{" and len(self._stack) == self._exercises_depth:
+                    self._object_start = i
+                self._stack.append(ch)
+            elif ch in "}]":
+                if not self._stack:
+                    continue
+                self._stack.pop()
+                if ch == "}" and len(self._stack) == self._exercises_depth and self._object_start >= 0:
+                    completed.append(json.loads(text[self._object_start:i + 1]))
+                    self._object_start = -1
+                elif ch == "]" and len(self._stack) == self._exercises_depth - 1:
+                    self._exercises_depth = -1
+
+        self._pos = len(text)
+        return completed
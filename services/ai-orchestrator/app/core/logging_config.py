@@ -1,20 +1,213 @@
-"""Logging configuration for the Pulse AI orchestrator."""
+"""
+Logging configuration for the Pulse AI orchestrator.
 
+Nothing is formatted or written on the event loop. The pulse.* and uvicorn
+loggers hand records to a bounded queue (a put_nowait, no I/O), and a
+QueueListener thread formats them and writes them to stdout. If stdout backs
+up and the queue fills (LOG_QUEUE_SIZE), new records are dropped and counted
+in pulse_log_records_dropped_total instead of stalling requests.
+
+Lines are JSON by default (LOG_FORMAT=text for local development) and carry
+the request id of the request that logged them. RequestIdMiddleware takes it
+from the X-Request-ID header (or generates one), keeps it in a context
+variable for the rest of the request and echoes it on the response.
+
+Hot-path messages are sampled: per logger and message template, at most
+LOG_SAMPLE_BURST records are written per LOG_SAMPLE_WINDOW_SECONDS. The first
+record of the next window reports how many were suppressed. Errors are never
+sampled, and uvicorn's access log is not sampled.
+
+Under gunicorn --preload, workers are forked from a master that already set
+this up; the writer thread does not survive the fork, so each worker starts
+its own queue and writer (os.register_at_fork).
+"""
+
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
+import re
 import sys
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+import orjson
+
+from app.core import metrics
+from app.core.config import (
+    LOG_FORMAT,
+    LOG_LEVEL,
+    LOG_QUEUE_SIZE,
+    LOG_SAMPLE_BURST,
+    LOG_SAMPLE_WINDOW_SECONDS,
+)
+
+REQUEST_ID_HEADER = "X-Request-ID"
+_REQUEST_ID_BYTES = REQUEST_ID_HEADER.lower().encode()
+# Caller-supplied ids are echoed into logs and headers, so keep them tame
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+request_id: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+_listener: logging.handlers.QueueListener | None = None
+_settings: tuple[str, str] = (LOG_LEVEL, LOG_FORMAT)
+
+
+class _SampleFilter(logging.Filter):
+    """Let through at most `burst` records per (logger, message template) per window."""
+
+    def __init__(self, burst: int, window: float) -> None:
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        # (logger, template) -> [window start, records seen in the window]
+        self._windows: dict[tuple[str, str], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.burst <= 0 or record.levelno >= logging.ERROR:
+            return True
+        template = record.msg if isinstance(record.msg, str) else type(record.msg).__name__
+        key = (record.name, template)
+        now = time.monotonic()
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.window:
+            if window is not None and window[1] > self.burst:
+                record.suppressed = window[1] - self.burst
+            self._windows[key] = [now, 1]
+            return True
+        window[1] += 1
+        if window[1] <= self.burst:
+            return True
+        metrics.LOG_RECORDS_DROPPED.labels("sampled").inc()
+        return False
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Queues records unformatted; formatting happens on the listener thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Context variables are not visible from the listener thread
+        record.request_id = request_id.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.LOG_RECORDS_DROPPED.labels("queue_full").inc()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, message, requestId, exc."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["requestId"] = record.request_id
+        if getattr(record, "suppressed", None):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return orjson.dumps(entry, default=str).decode()
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self) -> None:
+        super().__init__(fmt="%(asctime)s %(levelname)s [%(name)s] %(message)s", datefmt="%Y-%m-%dT%H:%M:%S")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        if getattr(record, "request_id", None):
+            line += f" request_id={record.request_id}"
+        if getattr(record, "suppressed", None):
+            line += f" (+{record.suppressed} similar suppressed)"
+        return line
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT) -> None:
+    """Route pulse.* and uvicorn logs through the queue to a stdout writer thread."""
+    global _listener, _settings
+    stop_logging()
+    _settings = (level, fmt)
+
+    writer = logging.StreamHandler(sys.stdout)
+    writer.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _listener = logging.handlers.QueueListener(log_queue, writer)
+    _listener.start()
+
+    sampled = _NonBlockingQueueHandler(log_queue)
+    sampled.addFilter(_SampleFilter(LOG_SAMPLE_BURST, LOG_SAMPLE_WINDOW_SECONDS))
+    unsampled = _NonBlockingQueueHandler(log_queue)
+
+    for name, handler in (
+        ("pulse", sampled),
+        ("uvicorn", sampled),
+        # gunicorn's UvicornWorker gives these its own handlers
+        ("uvicorn.error", sampled),
+        ("uvicorn.access", unsampled),
+    ):
+        logger = logging.getLogger(name)
+        logger.handlers = [handler]
+        logger.propagate = False
+    logging.getLogger("pulse").setLevel(getattr(logging, level.upper(), logging.INFO))
+
+
+def stop_logging() -> None:
+    """Write out queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _restart_in_child() -> None:
+    global _listener
+    if _listener is not None:
+        # The parent's thread is gone and its queue may be mid-put; start over
+        _listener = None
+        setup_logging(*_settings)
+
+
+atexit.register(stop_logging)
+os.register_at_fork(after_in_child=_restart_in_child)
+
+
+class RequestIdMiddleware:
+    """ASGI middleware setting request_id for the request and echoing it as X-Request-ID."""
+
+    def __init__(self, app) -> None:
+        self.app = app
 
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-def setup_logging(level: str = "INFO") -> None:
-    """Configure structured logging to stdout for the pulse.* namespace."""
-    formatter = logging.Formatter(
-        fmt="%(asctime)s %(levelname)s [%(name)s] %(message)s",
-        datefmt="%Y-%m-%dT%H:%M:%S",
-    )
+        rid = None
+        for name, value in scope["headers"]:
+            if name == _REQUEST_ID_BYTES:
+                rid = value.decode("latin-1")
+                break
+        if rid is None or not _VALID_REQUEST_ID.match(rid):
+            rid = uuid.uuid4().hex
+        header = (_REQUEST_ID_BYTES, rid.encode("latin-1"))
 
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setFormatter(formatter)
+        async def send_with_id(message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), header]
+            await send(message)
 
-    root = logging.getLogger("pulse")
-    root.setLevel(getattr(logging, level.upper(), logging.INFO))
-    root.addHandler(handler)
-    root.propagate = False
+        token = request_id.set(rid)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
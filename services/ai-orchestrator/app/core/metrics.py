@@ -0,0 +1,268 @@
+"""
+Prometheus metrics, served on GET /metrics.
+
+Everything on the request path is a prometheus_client counter or histogram
+update (a dict lookup and an add under a per-metric lock, no I/O), so it is
+safe to call per request and per upstream call. Gauges that mirror state
+kept elsewhere (the upstream limiter's in-flight calls, waiters and limit)
+are read at scrape time rather than updated on the hot path.
+
+- pulse_http_request_duration_seconds / pulse_http_requests_in_flight: per
+  route, from MetricsMiddleware (plain ASGI, so it adds no task or body
+  buffering per request).
+- pulse_stage_duration_seconds{stage,endpoint}: where a request's time goes —
+  body_parse, rate_limit (one Redis round trip, token budgets included),
+  prompt_build, upstream_queue, upstream, upstream_first_token (streams) and
+  validation.
+- pulse_upstream_tokens_total{endpoint,kind}: prompt, cached and completion
+  tokens as reported by the upstream.
+- pulse_upstream_attempts_total{endpoint,model,outcome}: every call attempt,
+  including the ones model_router failed over from.
+- pulse_upstream_keys_benched_total{key,reason}: API keys taken out of
+  rotation after a 429 or an error (key0, key1, ... in OPENAI_API_KEYS order).
+- pulse_upstream_hedges_total{endpoint,outcome}: hedge attempts sent, and
+  the ones that answered before the original call (see hedging).
+- pulse_cache_requests_total, pulse_rate_limit_decisions_total,
+  pulse_upstream_shed_total, pulse_routine_outputs_total: outcome counters.
+- pulse_routines_total{engine,reason}: routines served by the model or by
+  the rule engine, and why (see rule_engine).
+- pulse_circuit_breaker_state / pulse_circuit_breaker_opened_total: per
+  breaker: "openai" (upstream) and "redis" (see circuit_breaker, redis_client).
+- pulse_log_records_dropped_total{reason}: log records sampled out or
+  dropped because the log queue was full (see logging_config).
+- pulse_jobs_enqueued_total, pulse_job_lookups_total: precomputed jobs
+  enqueued by the API and how requests found them (see jobs). The worker
+  process serves pulse_jobs_processed_total, pulse_job_duration_seconds and
+  the pulse_job_backlog / pulse_job_pending stream gauges on its own port.
+
+Metrics are per process. When the API runs as several gunicorn workers,
+PROMETHEUS_MULTIPROC_DIR is set (start.sh) and prometheus_client keeps the
+values in files there, so GET /metrics on any worker reports all of them:
+counters and histograms summed, the gauges as noted on each. Gauges that
+mirror state (gauge_function) cannot be read from another process at scrape
+time, so in that mode every worker writes them every
+_GAUGE_REFRESH_SECONDS instead (refresh_gauges_forever).
+"""
+
+import asyncio
+import functools
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, TypeVar
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+T = TypeVar("T")
+
+# prometheus_client itself switches to file-backed values when this is set
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+_GAUGE_REFRESH_SECONDS = 5
+
+# Sub-millisecond for the local stages up to a minute for upstream calls
+_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "pulse_http_request_duration_seconds",
+    "Time from request start to the end of the response body.",
+    ["route", "method", "status"],
+    buckets=_BUCKETS,
+)
+HTTP_IN_FLIGHT = Gauge("pulse_http_requests_in_flight", "HTTP requests being handled.", multiprocess_mode="livesum")
+
+STAGE_SECONDS = Histogram(
+    "pulse_stage_duration_seconds",
+    "Time spent in one stage of handling a request.",
+    ["stage", "endpoint"],
+    buckets=_BUCKETS,
+)
+
+UPSTREAM_TOKENS = Counter(
+    "pulse_upstream_tokens",
+    "Tokens reported by the upstream, by kind (prompt, cached, completion).",
+    ["endpoint", "kind"],
+)
+UPSTREAM_ATTEMPTS = Counter(
+    "pulse_upstream_attempts",
+    "Upstream chat.completions attempts by outcome (ok, throttled, error, timeout).",
+    ["endpoint", "model", "outcome"],
+)
+UPSTREAM_KEYS_BENCHED = Counter(
+    "pulse_upstream_keys_benched",
+    "API keys benched by model_router, by key and reason (throttled, error).",
+    ["key", "reason"],
+)
+UPSTREAM_HEDGES = Counter(
+    "pulse_upstream_hedges",
+    "Hedged upstream calls by outcome (sent, won).",
+    ["endpoint", "outcome"],
+)
+UPSTREAM_SHED = Counter(
+    "pulse_upstream_shed",
+    "Calls refused by the upstream concurrency limiter.",
+    ["endpoint", "reason"],
+)
+# Summed over workers: each process has its own limiter
+UPSTREAM_IN_FLIGHT = Gauge(
+    "pulse_upstream_in_flight", "Upstream calls holding a limiter slot.", multiprocess_mode="livesum"
+)
+UPSTREAM_WAITING = Gauge("pulse_upstream_waiting", "Calls queued for an upstream slot.", multiprocess_mode="livesum")
+UPSTREAM_LIMIT = Gauge(
+    "pulse_upstream_concurrency_limit", "Current adaptive upstream concurrency limit.", multiprocess_mode="livesum"
+)
+
+CACHE_REQUESTS = Counter(
+    "pulse_cache_requests",
+    "Response cache lookups by outcome (hit, miss, bypass).",
+    ["endpoint", "outcome"],
+)
+RATE_LIMIT_DECISIONS = Counter(
+    "pulse_rate_limit_decisions",
+    "Rate-limit outcomes (allowed, limited, local_allowed, local_limited while Redis is unavailable, "
+    "token_budget, skipped) and the window that decided.",
+    ["outcome", "window"],
+)
+ROUTINE_OUTPUTS = Counter(
+    "pulse_routine_outputs",
+    "Routine responses by repair outcome (clean, repaired, reasked, failed).",
+    ["outcome"],
+)
+ROUTINES = Counter(
+    "pulse_routines",
+    "Generated routines by engine (ai, rules) and reason (requested, breaker_open, upstream_failed).",
+    ["engine", "reason"],
+)
+# The worst worker's state
+CIRCUIT_BREAKER_STATE = Gauge(
+    "pulse_circuit_breaker_state",
+    "Breaker state: 0 closed, 1 half-open, 2 open.",
+    ["breaker"],
+    multiprocess_mode="livemax",
+)
+CIRCUIT_BREAKER_OPENED = Counter("pulse_circuit_breaker_opened", "Times a breaker opened.", ["breaker"])
+LOG_RECORDS_DROPPED = Counter(
+    "pulse_log_records_dropped",
+    "Log records not written, by reason (sampled, queue_full).",
+    ["reason"],
+)
+
+JOBS_ENQUEUED = Counter("pulse_jobs_enqueued", "Precomputed jobs added to the stream.", ["kind"])
+JOB_LOOKUPS = Counter(
+    "pulse_job_lookups",
+    "Requests looking for a precomputed job, by outcome (hit, miss, profile_mismatch, failed, timeout).",
+    ["kind", "outcome"],
+)
+JOBS_PROCESSED = Counter(
+    "pulse_jobs_processed",
+    "Job attempts run by a worker, by outcome (done, retry, failed).",
+    ["kind", "outcome"],
+)
+JOB_SECONDS = Histogram("pulse_job_duration_seconds", "Time a worker spent on one job attempt.", ["kind"], buckets=_BUCKETS)
+JOB_BACKLOG = Gauge("pulse_job_backlog", "Jobs in the stream not yet delivered to a worker.")
+JOB_PENDING = Gauge("pulse_job_pending", "Jobs delivered to a worker but not acked (running or awaiting retry).")
+
+
+def route_endpoint(path: str) -> str:
+    """The endpoint a request path belongs to: /routine/generate/stream -> generate."""
+    parts = path.rstrip("/").rsplit("/", 2)
+    if parts[-1] == "stream" and len(parts) > 1:
+        return parts[-2]
+    return parts[-1]
+
+
+def observe_stage(stage: str, endpoint: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(stage, endpoint).observe(seconds)
+
+
+@contextmanager
+def stage_timer(stage: str, endpoint: str) -> Iterator[None]:
+    """Time the block (whether or not it raises) as one sample of stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage, endpoint).observe(time.perf_counter() - start)
+
+
+def timed_stage(stage: str, endpoint: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+    """Decorator form of stage_timer for synchronous functions."""
+
+    def decorate(fn: Callable[..., T]) -> Callable[..., T]:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs) -> T:
+            with stage_timer(stage, endpoint):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+_function_gauges: list[tuple[Gauge, Callable[[], float]]] = []
+
+
+def gauge_function(gauge: Gauge, f: Callable[[], float]) -> None:
+    """Report f() as the gauge's value: read at scrape time, or sampled in multiprocess mode."""
+    if MULTIPROCESS:
+        _function_gauges.append((gauge, f))
+    else:
+        gauge.set_function(f)
+
+
+def refresh_gauges() -> None:
+    """Write the current gauge_function values (multiprocess mode)."""
+    for gauge, f in _function_gauges:
+        gauge.set(f())
+
+
+async def refresh_gauges_forever() -> None:
+    """Keep this worker's gauge_function values current (multiprocess mode only)."""
+    if not MULTIPROCESS:
+        return
+    while True:
+        refresh_gauges()
+        await asyncio.sleep(_GAUGE_REFRESH_SECONDS)
+
+
+def render() -> tuple[bytes, str]:
+    """The current metrics in the Prometheus text format, and its content type."""
+    if not MULTIPROCESS:
+        return generate_latest(), CONTENT_TYPE_LATEST
+    refresh_gauges()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency and the in-flight gauge."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # The router stores the matched route in the scope; label by its
+            # template so path parameters do not explode the label set
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                route.path if route is not None else "unmatched", scope["method"], str(status)
+            ).observe(time.perf_counter() - start)
@@ -0,0 +1,196 @@
+"""
+Endpoint-aware model routing over a pool of OpenAI clients.
+
+Models: each endpoint has its own model (OPENAI_MODEL_<ENDPOINT>, defaulting
+to OPENAI_MODEL), so explanations and summaries can run on a smaller, faster
+model than routine generation. OPENAI_FALLBACK_MODEL, if set, is tried once
+every key has failed on the endpoint's own model.
+
+Keys: every key in OPENAI_API_KEYS (comma-separated; default OPENAI_API_KEY)
+gets its own AsyncOpenAI client and connection pool (OPENAI_MAX_CONNECTIONS,
+OPENAI_MAX_KEEPALIVE_CONNECTIONS). A call goes to the key with the fewest
+calls in flight, then the fewest calls in the last minute. On failure:
+
+- 429: the key is benched for the response's Retry-After (1 s if absent)
+- 5xx or a connection error: the key is benched for _ERROR_COOLDOWN_SECONDS
+
+and the call fails over to the next key, then to the fallback model. Only
+when every option has failed does the error reach the caller (and the
+concurrency limiter, which then backs off). With more than one key the SDK's
+own retries are disabled: failing over beats retrying a throttled key.
+
+Streams fail over only while the stream is being opened.
+"""
+
+import logging
+import time
+from collections import deque
+
+import httpx
+from openai import (
+    APIConnectionError,
+    APITimeoutError,
+    AsyncOpenAI,
+    DefaultAsyncHttpxClient,
+    InternalServerError,
+    RateLimitError,
+)
+
+from app.core import deadline, metrics
+from app.core.config import (
+    OPENAI_API_KEYS,
+    OPENAI_BASE_URL,
+    OPENAI_ENDPOINT_MODELS,
+    OPENAI_FALLBACK_MODEL,
+    OPENAI_MAX_CONNECTIONS,
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    OPENAI_MAX_RETRIES,
+    OPENAI_MODEL,
+    OPENAI_TIMEOUT_SECONDS,
+)
+
+logger = logging.getLogger("pulse.model_router")
+
+_ERROR_COOLDOWN_SECONDS = 1.0
+_DEFAULT_RETRY_AFTER_SECONDS = 1.0
+_RATE_WINDOW_SECONDS = 60
+
+_FAILOVER_ERRORS = (RateLimitError, InternalServerError, APIConnectionError)
+
+
+def _retry_after(error: RateLimitError) -> float:
+    """Seconds the upstream asked us to wait, from the 429's headers."""
+    headers = error.response.headers
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return max(float(headers[header]) * scale, 0.0)
+        except (KeyError, TypeError, ValueError):
+            continue
+    return _DEFAULT_RETRY_AFTER_SECONDS
+
+
+class _PoolMember:
+    def __init__(self, name: str, client: AsyncOpenAI) -> None:
+        self.name = name
+        self.client = client
+        self.in_flight = 0
+        self.benched_until = 0.0
+        self.recent: deque[float] = deque()
+
+    def calls_last_minute(self, now: float) -> int:
+        while self.recent and self.recent[0] < now - _RATE_WINDOW_SECONDS:
+            self.recent.popleft()
+        return len(self.recent)
+
+
+def _build_client(api_key: str, retries: int) -> AsyncOpenAI:
+    http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        ),
+    )
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=OPENAI_BASE_URL or None,
+        timeout=OPENAI_TIMEOUT_SECONDS,
+        max_retries=retries,
+        http_client=http_client,
+    )
+
+
+class ModelRouter:
+    """Routes chat.completions calls to a model per endpoint and a client per call."""
+
+    def __init__(
+        self,
+        clients: list[AsyncOpenAI],
+        endpoint_models: dict[str, str] | None = None,
+        default_model: str = OPENAI_MODEL,
+        fallback_model: str = "",
+    ) -> None:
+        if not clients:
+            raise ValueError("ModelRouter needs at least one client")
+        self._members = [_PoolMember(f"key{i}", client) for i, client in enumerate(clients)]
+        self.endpoint_models = endpoint_models or {}
+        self.default_model = default_model
+        self.fallback_model = fallback_model
+
+    @classmethod
+    def from_config(cls) -> "ModelRouter":
+        retries = OPENAI_MAX_RETRIES if len(OPENAI_API_KEYS) == 1 else 0
+        return cls(
+            [_build_client(key, retries) for key in OPENAI_API_KEYS],
+            endpoint_models=OPENAI_ENDPOINT_MODELS,
+            fallback_model=OPENAI_FALLBACK_MODEL,
+        )
+
+    @property
+    def primary(self) -> AsyncOpenAI:
+        """The first key's client, for non-completion APIs (files, batches)."""
+        return self._members[0].client
+
+    def model_for(self, endpoint: str) -> str:
+        return self.endpoint_models.get(endpoint) or self.default_model
+
+    def _models(self, model: str) -> list[str]:
+        models = [model]
+        if self.fallback_model and self.fallback_model != model:
+            models.append(self.fallback_model)
+        return models
+
+    def _members_by_preference(self, now: float) -> list[_PoolMember]:
+        """Usable keys least loaded first, then benched keys soonest available first."""
+        ready = [m for m in self._members if m.benched_until <= now]
+        benched = [m for m in self._members if m.benched_until > now]
+        ready.sort(key=lambda m: (m.in_flight, m.calls_last_minute(now)))
+        benched.sort(key=lambda m: m.benched_until)
+        return ready + benched
+
+    def _bench(self, member: _PoolMember, error: Exception) -> None:
+        if isinstance(error, RateLimitError):
+            reason, seconds = "throttled", _retry_after(error)
+        else:
+            reason, seconds = "error", _ERROR_COOLDOWN_SECONDS
+        metrics.UPSTREAM_KEYS_BENCHED.labels(member.name, reason).inc()
+        member.benched_until = max(member.benched_until, time.monotonic() + seconds)
+
+    async def create(self, endpoint: str, body: dict, **options):
+        """
+        chat.completions.create(**body, **options) on the best key, failing over
+        across keys and then to the fallback model on 429/5xx/connection errors.
+        body["model"] is the first model tried. The request timeout is the time
+        left before the caller's deadline, if there is one.
+        """
+        last_error: Exception | None = None
+        for model in self._models(body["model"]):
+            for member in self._members_by_preference(time.monotonic()):
+                deadline.check()
+                left = deadline.remaining()
+                if left is not None:
+                    # Each attempt gets only what is left of the caller's budget
+                    options["timeout"] = left
+                member.in_flight += 1
+                member.recent.append(time.monotonic())
+                try:
+                    response = await member.client.chat.completions.create(**{**body, "model": model}, **options)
+                except APITimeoutError:
+                    metrics.UPSTREAM_ATTEMPTS.labels(endpoint, model, "timeout").inc()
+                    # Usually the caller's deadline; repeating the call cannot beat it
+                    raise
+                except _FAILOVER_ERRORS as e:
+                    metrics.UPSTREAM_ATTEMPTS.labels(
+                        endpoint, model, "throttled" if isinstance(e, RateLimitError) else "error"
+                    ).inc()
+                    self._bench(member, e)
+                    last_error = e
+                    logger.warning(
+                        "Upstream call failed, failing over | endpoint=%s model=%s key=%s: %s",
+                        endpoint, model, member.name, e.__class__.__name__,
+                    )
+                else:
+                    metrics.UPSTREAM_ATTEMPTS.labels(endpoint, model, "ok").inc()
+                    return response
+                finally:
+                    member.in_flight -= 1
+        raise last_error
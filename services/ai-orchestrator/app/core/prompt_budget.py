@@ -0,0 +1,185 @@
+"""
+Token-budgeted prompt assembly.
+
+Routine prompts are built from sections of very different value per token.
+The instructions, profile, current routine and ranked catalog are required;
+workout history is useful but unbounded (a long-time user can send months of
+logs). Instead of interpolating raw logs and rejecting the request once the
+prompt passes MAX_PROMPT_CHARS, history is:
+
+1. compacted into one line per exercise — sessions, best set, volume trend,
+   last RPE — most recently trained first, and
+2. trimmed to whatever PROMPT_TOKEN_BUDGET leaves after the required
+   sections (and at most PROMPT_HISTORY_TOKEN_BUDGET), dropping the stalest
+   exercises first.
+
+Tokens are counted with tiktoken's encoding for OPENAI_MODEL. When tiktoken
+or its encoding files are unavailable (e.g. an offline host), a
+characters-per-token estimate is used instead.
+"""
+
+import logging
+import math
+from functools import lru_cache
+
+from app.core.config import (
+    MAX_PROMPT_CHARS,
+    OPENAI_MODEL,
+    PROMPT_HISTORY_TOKEN_BUDGET,
+    PROMPT_TOKEN_BUDGET,
+)
+
+logger = logging.getLogger("pulse.prompt_budget")
+
+# Version of the static prompt prefix in openai_client (system prompts, rules,
+# schema). It is part of every response-cache key, so bumping it stops
+# answers produced by an older prompt from being served.
+PROMPT_VERSION = "2"
+
+# Used when no tokenizer is available; English prose/JSON averages ~4.
+_FALLBACK_CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=1)
+def load_tokenizer():
+    """Return the tiktoken encoding for OPENAI_MODEL, or None to use the estimate."""
+    try:
+        import tiktoken
+    except ImportError:
+        logger.info("tiktoken not installed — estimating prompt tokens from length")
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(OPENAI_MODEL)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # The encoding files are downloaded on first use
+        logger.warning("tiktoken encoding unavailable — estimating prompt tokens: %s", e)
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Return the number of prompt tokens in text."""
+    encoding = load_tokenizer()
+    if encoding is None:
+        return math.ceil(len(text) / _FALLBACK_CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def fit_lines(lines: list[str], max_tokens: int, max_chars: int) -> list[str]:
+    """Return the longest prefix of lines that fits both limits (one newline each)."""
+    kept: list[str] = []
+    tokens = chars = 0
+    for line in lines:
+        tokens += count_tokens(line) + 1
+        chars += len(line) + 1
+        if tokens > max_tokens or chars > max_chars:
+            break
+        kept.append(line)
+    return kept
+
+
+def _num(value) -> float | None:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _fmt(value: float) -> str:
+    return f"{value:g}"
+
+
+def _sets(entry: dict) -> list[dict]:
+    sets = entry.get("sets") if entry.get("sets") is not None else entry.get("sets_data")
+    if isinstance(sets, list):
+        return [s for s in sets if isinstance(s, dict)]
+    # {"sets": 3, "reps": 10, "weight_kg": 50}
+    count = _num(sets)
+    return [entry] * int(count) if count else []
+
+
+def _aggregate(logs: list) -> dict[str, dict]:
+    """Fold chronologically ordered logs into per-exercise stats."""
+    stats: dict[str, dict] = {}
+    for log in logs:
+        for entry in log.get("exercises") or []:
+            if not isinstance(entry, dict):
+                continue
+            name = entry.get("name") or entry.get("exercise_name")
+            if not isinstance(name, str) or not name.strip():
+                continue
+
+            ex = stats.setdefault(name.strip(), {
+                "sessions": 0, "best": None, "volumes": [], "last_rpe": None, "last_date": None,
+            })
+            ex["sessions"] += 1
+            ex["last_date"] = log.get("date") or ex["last_date"]
+
+            volume = 0.0
+            for s in _sets(entry):
+                weight = _num(s.get("weight_kg", s.get("weight"))) or 0.0
+                reps = _num(s.get("reps", s.get("target_reps"))) or 0.0
+                volume += weight * reps
+                if reps and (ex["best"] is None or (weight, reps) > ex["best"]):
+                    ex["best"] = (weight, reps)
+                rpe = _num(s.get("rpe"))
+                if rpe is not None:
+                    ex["last_rpe"] = rpe
+            ex["volumes"].append(volume)
+    return stats
+
+
+def compact_logs(logs: list | None) -> list[str]:
+    """
+    Summarise workout logs as one prompt line per exercise, most recently
+    trained first (so trimming from the end drops the stalest exercises).
+    """
+    logs = [log for log in logs or [] if isinstance(log, dict)]
+    if any(log.get("date") for log in logs):
+        logs.sort(key=lambda log: str(log.get("date") or ""))
+
+    stats = _aggregate(logs)
+    ranked = sorted(
+        stats.items(),
+        key=lambda item: (str(item[1]["last_date"] or ""), item[1]["sessions"]),
+        reverse=True,
+    )
+
+    lines = []
+    for name, ex in ranked:
+        parts = [f"{ex['sessions']} session{'s' if ex['sessions'] != 1 else ''}"]
+        if ex["best"] is not None:
+            weight, reps = ex["best"]
+            parts.append(f"best {_fmt(weight)}kg x {_fmt(reps)}" if weight else f"best {_fmt(reps)} reps")
+        first, last = ex["volumes"][0], ex["volumes"][-1]
+        if len(ex["volumes"]) > 1 and first > 0:
+            parts.append(f"volume {(last - first) / first:+.0%}")
+        if ex["last_rpe"] is not None:
+            parts.append(f"last RPE {_fmt(ex['last_rpe'])}")
+        if ex["last_date"]:
+            parts.append(f"last {ex['last_date']}")
+        lines.append(f"- {name}: {', '.join(parts)}")
+    return lines
+
+
+def history_section(label: str, logs: list | None, prompt: str, system: str = "") -> str:
+    """
+    Render logs as a compacted prompt section sized to the budget left over by
+    the rest of the user prompt and the system prompt. Returns "" when nothing fits.
+    """
+    lines = compact_logs(logs)
+    if not lines:
+        return ""
+
+    header = f"\n{label} (per exercise, most recent first):\n"
+    used = count_tokens(system) + count_tokens(prompt)
+    token_room = min(PROMPT_HISTORY_TOKEN_BUDGET, PROMPT_TOKEN_BUDGET - used)
+    char_room = MAX_PROMPT_CHARS - len(prompt) - len(header)
+    kept = fit_lines(lines, token_room - count_tokens(header), char_room)
+    if not kept:
+        return ""
+    if len(kept) < len(lines):
+        logger.debug("Trimmed history | kept=%d dropped=%d", len(kept), len(lines) - len(kept))
+    return header + "\n".join(kept)
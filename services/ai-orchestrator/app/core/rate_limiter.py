@@ -1,58 +1,180 @@
 """
-Per-user sliding window rate limiter backed by Redis sorted sets (ZSETs).
+Per-user sliding window rate limiter backed by Redis.
 
-Algorithm: Each request adds a member (scored by timestamp) to a ZSET keyed
-by user + window. A Lua script atomically removes expired entries, counts
-the remaining, and conditionally adds the new entry — preventing race
-conditions across concurrent requests or multiple service instances.
+Two backends, selected by RATE_LIMIT_BACKEND:
+
+- "zset" (exact): Each request adds a member (scored by timestamp) to a ZSET
+  keyed by user + window, so memory grows with the number of requests in the
+  window.
+- "counter" (approximate, O(1) memory): each user + window is a small hash
+  holding the current fixed bucket's count and the previous bucket's count.
+  The sliding-window estimate is previous * (1 - elapsed fraction) + current,
+  which tracks the exact count closely for smooth traffic and errs towards
+  admitting at bucket boundaries.
+
+Either way a single Lua script checks every window atomically: it evaluates
+all windows first, and only if all of them admit the request does it record
+the hit in all of them. A request rejected by the day window therefore never
+consumes minute/hour budget. The same script first reads the user's token
+budgets (see usage), so a request over budget records no hit either. On
+rejection the script also returns the Retry-After, so a check is one round
+trip.
+
+The script is loaded at startup (load_rate_limit_script) and invoked by SHA;
+if Redis has lost it (restart, SCRIPT FLUSH) it is reloaded transparently.
+
+While Redis is unavailable (down at startup, or its circuit breaker open —
+see redis_client) the same windows are enforced in process with the
+"counter" estimate. That fallback is approximate: counts are per process and
+start from zero, so with N instances a user can get up to N times the limit
+for the length of the outage. Token budgets are not checked without Redis.
 
 Usage: Add `dependencies=[Depends(require_rate_limit)]` to FastAPI endpoints.
 """
 
+import hashlib
 import logging
+import math
 import time
 import uuid
+from collections import OrderedDict
 
 from fastapi import HTTPException, Request
+from redis.exceptions import NoScriptError
 
+from app.core import metrics
 from app.core.config import (
+    RATE_LIMIT_BACKEND,
+    RATE_LIMIT_LOCAL_MAX_USERS,
     RATE_LIMIT_PER_DAY,
     RATE_LIMIT_PER_HOUR,
     RATE_LIMIT_PER_MINUTE,
 )
-from app.core.redis_client import get_redis
+from app.core.redis_client import REDIS_ERRORS, get_redis, redis_available, redis_breaker
+from app.core.usage import current_user_id, token_budget_exceeded, token_budgets
 
 logger = logging.getLogger("pulse.rate_limiter")
 
-# Lua script for atomic sliding-window check.
-# KEYS[1] = sorted set key
-# ARGV[1] = window_start (now - window_seconds)
-# ARGV[2] = now (score for new member)
-# ARGV[3] = unique member id
-# ARGV[4] = max allowed count
-# ARGV[5] = key TTL (= window_seconds, for auto-cleanup)
-# Returns: [current_count, was_allowed (0|1)]
-_LUA_SLIDING_WINDOW = """
-local key = KEYS[1]
-local window_start = tonumber(ARGV[1])
-local now = tonumber(ARGV[2])
-local member = ARGV[3]
-local max_count = tonumber(ARGV[4])
-local ttl = tonumber(ARGV[5])
-
-redis.call('ZREMRANGEBYSCORE', key, '-inf', window_start)
-
-local count = redis.call('ZCARD', key)
-
-if count < max_count then
-    redis.call('ZADD', key, now, member)
-    redis.call('EXPIRE', key, ttl)
-    return {count + 1, 1}
+# Prelude of both window scripts: the token budgets, checked before any
+# window so that a request over budget records no hit.
+# KEYS[1..B]     = token budget keys (usage.token_budgets), B = ARGV[3]
+# ARGV[3+j]      = token budget j limit
+# Leaves `budgets` (B), `base` (3 + B) and `windows` (window key count) set.
+_LUA_TOKEN_BUDGETS = """
+local budgets = tonumber(ARGV[3])
+for j = 1, budgets do
+    local spent = tonumber(redis.call('GET', KEYS[j])) or 0
+    if spent >= tonumber(ARGV[3 + j]) then
+        return {0, -j, spent, '0'}
+    end
+end
+local base = 3 + budgets
+local windows = #KEYS - budgets
+"""
+
+# Lua script for an atomic multi-window sliding-window check.
+# KEYS[B+i]      = sorted set key for window i
+# ARGV[1]        = now (score for new member)
+# ARGV[2]        = unique member id
+# ARGV[3+B+2i-1] = window i length in seconds (also the key TTL)
+# ARGV[3+B+2i]   = window i max allowed count
+# Returns: {was_allowed (0|1), rejecting window index (1-based; -j for token
+#           budget j; 0 if allowed), count in that window (tokens spent for a
+#           budget), retry_after seconds (string — Lua numbers are truncated
+#           to integers on return)}
+_LUA_SLIDING_WINDOWS = _LUA_TOKEN_BUDGETS + """
+local now = tonumber(ARGV[1])
+local member = ARGV[2]
+
+for i = 1, windows do
+    local key = KEYS[budgets + i]
+    local window = tonumber(ARGV[base + 2 * i - 1])
+    local max_count = tonumber(ARGV[base + 2 * i])
+
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    local count = redis.call('ZCARD', key)
+
+    if count >= max_count then
+        -- The request fits once enough of the oldest entries have expired
+        local oldest = redis.call('ZRANGE', key, count - max_count, count - max_count, 'WITHSCORES')
+        local retry_after = window
+        if oldest[2] then
+            retry_after = tonumber(oldest[2]) + window - now
+        end
+        return {0, i, count, tostring(retry_after)}
+    end
+end
+
+for i = 1, windows do
+    redis.call('ZADD', KEYS[budgets + i], now, member)
+    redis.call('EXPIRE', KEYS[budgets + i], tonumber(ARGV[base + 2 * i - 1]))
 end
 
-return {count, 0}
+return {1, 0, 0, '0'}
 """
 
+# Lua script for the approximate, fixed-memory multi-window check. Takes the
+# same KEYS/ARGV and returns the same shape as _LUA_SLIDING_WINDOWS (ARGV[2],
+# the member id, is unused). Each key is a hash: b = current bucket number,
+# c = hits in bucket b, p = hits in bucket b - 1.
+_LUA_WINDOW_COUNTERS = _LUA_TOKEN_BUDGETS + """
+local now = tonumber(ARGV[1])
+local states = {}
+
+for i = 1, windows do
+    local window = tonumber(ARGV[base + 2 * i - 1])
+    local max_count = tonumber(ARGV[base + 2 * i])
+    local bucket = math.floor(now / window)
+
+    local data = redis.call('HMGET', KEYS[budgets + i], 'b', 'c', 'p')
+    local b = tonumber(data[1])
+    local c = tonumber(data[2]) or 0
+    local p = tonumber(data[3]) or 0
+    if b == nil or b < bucket - 1 then
+        c, p = 0, 0
+    elseif b == bucket - 1 then
+        c, p = 0, c
+    end
+
+    local elapsed = (now - bucket * window) / window
+    local estimate = p * (1 - elapsed) + c
+
+    if estimate + 1 > max_count then
+        -- Solve for the earliest time the estimate drops to max_count - 1
+        local retry_after
+        if c <= max_count - 1 and p > 0 then
+            retry_after = (1 - (max_count - 1 - c) / p - elapsed) * window
+        else
+            local fraction = math.max(0, 1 - (max_count - 1) / c)
+            retry_after = (bucket + 1) * window - now + fraction * window
+        end
+        return {0, i, math.floor(estimate), tostring(retry_after)}
+    end
+
+    states[i] = {bucket, c, p}
+end
+
+for i = 1, windows do
+    local window = tonumber(ARGV[base + 2 * i - 1])
+    local state = states[i]
+    redis.call('HSET', KEYS[budgets + i], 'b', state[1], 'c', state[2] + 1, 'p', state[3])
+    redis.call('EXPIRE', KEYS[budgets + i], 2 * window)
+end
+
+return {1, 0, 0, '0'}
+"""
+
+# backend -> (Lua source, key prefix)
+_BACKENDS = {
+    "zset": (_LUA_SLIDING_WINDOWS, "ratelimit"),
+    "counter": (_LUA_WINDOW_COUNTERS, "ratelimitc"),
+}
+
+_SCRIPT_SHAS = {
+    script: hashlib.sha1(script.encode("utf-8")).hexdigest()
+    for script, _ in _BACKENDS.values()
+}
+
 # (window_name, window_seconds, config_getter)
 _WINDOWS = [
     ("minute", 60, lambda: RATE_LIMIT_PER_MINUTE),
@@ -60,93 +182,178 @@ _WINDOWS = [
     ("day", 86400, lambda: RATE_LIMIT_PER_DAY),
 ]
 
+# In-process fallback state: user -> {window_name: (bucket, current, previous)},
+# least recently seen user first
+_local_counters: OrderedDict[str, dict[str, tuple[int, int, int]]] = OrderedDict()
+
+
+async def load_rate_limit_script(backend: str = RATE_LIMIT_BACKEND) -> None:
+    """Preload the rate-limit script so requests can call it by SHA."""
+    await get_redis().script_load(_BACKENDS[backend][0])
+
+
+async def _eval_windows(redis_client, script: str, keys: list[str], args: list[str]) -> list:
+    sha = _SCRIPT_SHAS[script]
+    try:
+        result = await redis_client.evalsha(sha, len(keys), *keys, *args)
+    except NoScriptError:
+        logger.info("Rate-limit script missing from Redis — reloading")
+        await redis_client.script_load(script)
+        result = await redis_client.evalsha(sha, len(keys), *keys, *args)
+    redis_breaker.record_success()
+    return result
+
 
-async def _check_rate_limit(user_id: str) -> None:
+def _eval_local(user_id: str, windows: list[tuple[str, int, int]], now: float) -> list:
+    """In-process counterpart of _LUA_WINDOW_COUNTERS: same estimate, same result shape."""
+    counters = _local_counters.get(user_id)
+    if counters is None:
+        counters = _local_counters[user_id] = {}
+        if len(_local_counters) > RATE_LIMIT_LOCAL_MAX_USERS:
+            _local_counters.popitem(last=False)
+    else:
+        _local_counters.move_to_end(user_id)
+
+    states = []
+    for i, (name, window, max_count) in enumerate(windows, start=1):
+        bucket = math.floor(now / window)
+        b, c, p = counters.get(name, (bucket, 0, 0))
+        if b < bucket - 1:
+            c, p = 0, 0
+        elif b == bucket - 1:
+            c, p = 0, c
+
+        elapsed = (now - bucket * window) / window
+        estimate = p * (1 - elapsed) + c
+        if estimate + 1 > max_count:
+            if c <= max_count - 1 and p > 0:
+                retry_after = (1 - (max_count - 1 - c) / p - elapsed) * window
+            else:
+                fraction = max(0, 1 - (max_count - 1) / c)
+                retry_after = (bucket + 1) * window - now + fraction * window
+            return [0, i, math.floor(estimate), str(retry_after)]
+        states.append((name, bucket, c, p))
+
+    for name, bucket, c, p in states:
+        counters[name] = (bucket, c + 1, p)
+    return [1, 0, 0, "0"]
+
+
+def _enabled_windows() -> list[tuple[str, int, int]]:
+    windows = [(name, seconds, get_limit()) for name, seconds, get_limit in _WINDOWS]
+    return [w for w in windows if w[2] > 0]  # 0 = disabled
+
+
+async def _check_rate_limit(
+    user_id: str,
+    backend: str = RATE_LIMIT_BACKEND,
+    now: float | None = None,
+) -> None:
     """
-    Check all sliding windows for the user. Raises 429 on first violation.
+    Check the user's token budgets and all sliding windows in one round
+    trip. Raises 429 on the first spent budget or violated window. `now` is
+    only overridden by benchmarks.
     """
-    redis_client = get_redis()
-    now = time.time()
+    script, key_prefix = _BACKENDS[backend]
+    now = time.time() if now is None else now
     member = f"{now}:{uuid.uuid4().hex[:8]}"
 
-    for window_name, window_seconds, get_limit in _WINDOWS:
-        limit = get_limit()
-        if limit <= 0:
-            continue  # 0 = disabled
-
-        key = f"ratelimit:{user_id}:{window_name}"
-        window_start = now - window_seconds
-
-        result = await redis_client.eval(
-            _LUA_SLIDING_WINDOW,
-            1,
-            key,
-            str(window_start),
-            str(now),
-            member,
-            str(limit),
-            str(window_seconds),
-        )
-
-        current_count, was_allowed = int(result[0]), int(result[1])
-
-        if not was_allowed:
-            # Calculate Retry-After from the oldest entry in the window
-            oldest = await redis_client.zrange(key, 0, 0, withscores=True)
-            if oldest:
-                retry_after = int(oldest[0][1] + window_seconds - now) + 1
-            else:
-                retry_after = window_seconds
-            retry_after = max(1, retry_after)
-
-            logger.warning(
-                "Rate limit exceeded | user=%s window=%s count=%d limit=%d retry_after=%ds",
-                user_id,
-                window_name,
-                current_count,
-                limit,
-                retry_after,
-            )
-
-            raise HTTPException(
-                status_code=429,
-                detail={
-                    "error": "rate_limit_exceeded",
-                    "message": (
-                        f"Too many requests. You have exceeded the "
-                        f"{window_name} limit of {limit} requests."
-                    ),
-                    "window": window_name,
-                    "limit": limit,
-                    "retry_after_seconds": retry_after,
-                },
-                headers={"Retry-After": str(retry_after)},
-            )
-
-        logger.debug(
-            "Rate limit OK | user=%s window=%s count=%d/%d",
-            user_id,
-            window_name,
-            current_count,
-            limit,
-        )
+    budgets = token_budgets(user_id, now)
+    windows = _enabled_windows()
+    if not budgets and not windows:
+        return
+
+    keys = [key for _, _, _, key in budgets]
+    keys += [f"{key_prefix}:{user_id}:{name}" for name, _, _ in windows]
+    args = [str(now), member, str(len(budgets))]
+    args += [str(limit) for _, _, limit, _ in budgets]
+    for _, seconds, limit in windows:
+        args += [str(seconds), str(limit)]
+
+    result = await _eval_windows(get_redis(), script, keys, args)
+    if int(result[1]) < 0:
+        raise token_budget_exceeded(user_id, budgets[-int(result[1]) - 1], int(result[2]), now)
+    _enforce(user_id, windows, result)
+
+
+def _check_local_rate_limit(user_id: str, now: float | None = None) -> None:
+    """Approximate, per-process check of the same windows while Redis is unavailable."""
+    windows = _enabled_windows()
+    if not windows:
+        return
+    result = _eval_local(user_id, windows, time.time() if now is None else now)
+    _enforce(user_id, windows, result, local=True)
+
+
+def _enforce(user_id: str, windows: list[tuple[str, int, int]], result: list, local: bool = False) -> None:
+    """Record a window check's result and raise 429 if it rejected the request."""
+    was_allowed, window_index, current_count = int(result[0]), int(result[1]), int(result[2])
+    prefix = "local_" if local else ""
+
+    if was_allowed:
+        metrics.RATE_LIMIT_DECISIONS.labels(f"{prefix}allowed", "").inc()
+        logger.debug("Rate limit OK | user=%s local=%s", user_id, local)
+        return
+
+    window_name, window_seconds, limit = windows[window_index - 1]
+    metrics.RATE_LIMIT_DECISIONS.labels(f"{prefix}limited", window_name).inc()
+    retry_after = max(1, int(float(result[3])) + 1)
+
+    logger.warning(
+        "Rate limit exceeded | user=%s window=%s count=%d limit=%d retry_after=%ds local=%s",
+        user_id,
+        window_name,
+        current_count,
+        limit,
+        retry_after,
+        local,
+    )
+
+    raise HTTPException(
+        status_code=429,
+        detail={
+            "error": "rate_limit_exceeded",
+            "message": (
+                f"Too many requests. You have exceeded the "
+                f"{window_name} limit of {limit} requests."
+            ),
+            "window": window_name,
+            "limit": limit,
+            "retry_after_seconds": retry_after,
+        },
+        headers={"Retry-After": str(retry_after)},
+    )
 
 
 async def require_rate_limit(request: Request) -> None:
     """
     FastAPI dependency extracts userId from the parsed request body
-    and enforces per-minute, per-hour, and per-day sliding-window limits.
+    and enforces per-minute, per-hour, and per-day sliding-window limits,
+    plus any configured token budgets. It also tags the request with the
+    user so OpenAI token usage is attributed to them.
     """
-    try:
-        get_redis()  # raises RuntimeError if not initialised
-    except RuntimeError:
-        logger.debug("Redis not available — skipping rate limit check")
-        return
-
     body = await request.json()
     user_id = body.get("userId")
 
     if not user_id:
+        metrics.RATE_LIMIT_DECISIONS.labels("skipped", "").inc()
         return
 
-    await _check_rate_limit(user_id)
+    current_user_id.set(user_id)
+    stage_endpoint = metrics.route_endpoint(request.url.path)
+
+    if not redis_available():
+        logger.debug("Redis not available — rate limiting in process")
+        _check_local_rate_limit(user_id)
+        return
+
+    try:
+        with metrics.stage_timer("rate_limit", stage_endpoint):
+            await _check_rate_limit(user_id)
+    except REDIS_ERRORS as e:
+        redis_breaker.record_failure()
+        logger.warning("Rate limit check failed — limiting in process | user=%s: %s", user_id, e)
+        _check_local_rate_limit(user_id)
+    except RuntimeError:
+        # Another request opened the Redis breaker since the check above
+        _check_local_rate_limit(user_id)
@@ -3,24 +3,82 @@ Async Redis connection pool for the AI orchestrator.
 
 The pool is created at app startup (init_redis) and closed at shutdown
 (close_redis). All modules import get_redis() to obtain the shared client.
+
+Redis health is tracked by a circuit breaker (redis_breaker):
+
+- The API's pool uses short socket timeouts and no retries, so a hung Redis
+  costs a request one REDIS_SOCKET_TIMEOUT_SECONDS per round trip rather
+  than redis-py's retries with backoff.
+- Hot-path failures (the rate limiter) and the background ping (watch_redis)
+  are reported to the breaker. Once it opens, get_redis() raises
+  RuntimeError at once, so every caller takes its existing "Redis not
+  available" path (no cache, in-process rate limits) without touching the
+  network.
+- After REDIS_BREAKER_RESET_SECONDS only the background ping probes Redis;
+  when it answers, the breaker closes and requests use Redis again. The
+  same loop brings the app up to Redis after a failed startup, which used
+  to leave it without Redis until a restart.
 """
 
+import asyncio
+import logging
+
 import redis.asyncio as redis
+from redis.asyncio.retry import Retry
+from redis.backoff import NoBackoff
+from redis.exceptions import ConnectionError as RedisConnectionError
+from redis.exceptions import TimeoutError as RedisTimeoutError
+
+from app.core.circuit_breaker import CLOSED, OPEN, CircuitBreaker
+from app.core.config import (
+    REDIS_BREAKER_FAILURES,
+    REDIS_BREAKER_RESET_SECONDS,
+    REDIS_CONNECT_TIMEOUT_SECONDS,
+    REDIS_HEALTH_CHECK_SECONDS,
+    REDIS_SOCKET_TIMEOUT_SECONDS,
+    REDIS_URL,
+)
+
+logger = logging.getLogger("pulse.redis")
+
+# Errors that mean Redis is unreachable or hung (as opposed to a command error)
+REDIS_ERRORS = (RedisConnectionError, RedisTimeoutError)
 
-from app.core.config import REDIS_URL
+redis_breaker = CircuitBreaker("redis", REDIS_BREAKER_FAILURES, REDIS_BREAKER_RESET_SECONDS)
 
 _pool: redis.Redis | None = None
 
 
-async def init_redis() -> redis.Redis:
-    """Create the shared async Redis connection pool."""
+async def init_redis(fail_fast: bool = True) -> redis.Redis:
+    """
+    Create the shared async Redis connection pool and ping it.
+
+    fail_fast (the API) sets the hot-path socket timeouts and disables
+    retries; the job worker blocks on XREADGROUP and keeps redis-py's
+    defaults. If the ping fails the pool is kept (connections are made on
+    demand, so watch_redis can bring it back), the breaker is opened and the
+    error re-raised.
+    """
     global _pool
+    options = {}
+    if fail_fast:
+        options = {
+            "socket_timeout": REDIS_SOCKET_TIMEOUT_SECONDS,
+            "socket_connect_timeout": REDIS_CONNECT_TIMEOUT_SECONDS,
+            "retry": Retry(NoBackoff(), 0),
+        }
     _pool = redis.from_url(
         REDIS_URL,
         decode_responses=True,
         max_connections=20,
+        **options,
     )
-    await _pool.ping()
+    try:
+        await _pool.ping()
+    except Exception:
+        redis_breaker.trip()
+        raise
+    redis_breaker.record_success()
     return _pool
 
 
@@ -32,8 +90,36 @@ async def close_redis() -> None:
         _pool = None
 
 
+def redis_available() -> bool:
+    """Whether Redis should be used right now (pool created and breaker closed)."""
+    return _pool is not None and redis_breaker.state == CLOSED
+
+
 def get_redis() -> redis.Redis:
-    """Return the active Redis client. Raises if not initialised."""
+    """Return the active Redis client. Raises if not initialised or unhealthy."""
     if _pool is None:
         raise RuntimeError("Redis pool not initialised — call init_redis() first")
+    if redis_breaker.state != CLOSED:
+        raise RuntimeError("Redis unavailable — circuit breaker open")
     return _pool
+
+
+async def watch_redis() -> None:
+    """
+    Ping Redis every REDIS_HEALTH_CHECK_SECONDS until cancelled.
+
+    While the breaker is closed this notices an outage without waiting for
+    traffic to fail; once it is half-open the ping is the trial call that
+    closes it (or opens it again).
+    """
+    while True:
+        await asyncio.sleep(REDIS_HEALTH_CHECK_SECONDS)
+        if _pool is None or redis_breaker.state == OPEN:
+            continue
+        try:
+            await _pool.ping()
+        except Exception as e:
+            logger.debug("Redis health check failed: %s", e)
+            redis_breaker.record_failure()
+        else:
+            redis_breaker.record_success()
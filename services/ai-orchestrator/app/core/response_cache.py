@@ -0,0 +1,167 @@
+"""
+Redis-backed response cache for AI endpoints.
+
+Responses are keyed by a canonical hash of the prompt inputs: dict keys are
+sorted, unordered lists (equipment) are sorted and the exercise catalog is
+reduced to its order-insensitive catalogId before hashing, so the same profile/catalog/history always maps to the
+same key regardless of how the client serialised it.
+
+Each endpoint has its own TTL and an LRU index (a ZSET scored by last access
+time) that bounds the number of cached entries — the least recently used
+entries are evicted when the index grows past CACHE_MAX_ENTRIES.
+
+If Redis is unavailable the cache is skipped and the call goes straight to
+OpenAI.
+"""
+
+import hashlib
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+from pydantic import BaseModel
+
+from app.core import fast_json, metrics
+from app.core.catalog_registry import compute_catalog_id
+from app.core.config import (
+    CACHE_MAX_ENTRIES,
+    CACHE_TTL_EXPLAIN_SECONDS,
+    CACHE_TTL_GENERATE_SECONDS,
+)
+from app.core.prompt_budget import PROMPT_VERSION
+from app.core.redis_client import get_redis
+
+logger = logging.getLogger("pulse.response_cache")
+
+# endpoint -> TTL getter (0 = caching disabled for that endpoint)
+_TTLS = {
+    "generate": lambda: CACHE_TTL_GENERATE_SECONDS,
+    "explain": lambda: CACHE_TTL_EXPLAIN_SECONDS,
+}
+
+# Fields whose list values are sets — element order carries no meaning.
+# (Exercise catalogs are reduced to an order-insensitive catalogId first.)
+_UNORDERED_FIELDS = {"equipment"}
+
+# Request fields that identify the caller or control caching, not the prompt.
+_NON_INPUT_FIELDS = {"userId", "bypassCache"}
+
+
+def _canonicalize(value: Any, field: str | None = None) -> Any:
+    """Return a copy of value with unordered lists sorted and empties dropped."""
+    if isinstance(value, dict):
+        return {
+            k: _canonicalize(v, k)
+            for k, v in value.items()
+            if v is not None and v != [] and v != {}
+        }
+    if isinstance(value, list):
+        items = [_canonicalize(v) for v in value]
+        if field in _UNORDERED_FIELDS:
+            items.sort(key=fast_json.canonical)
+        return items
+    return value
+
+
+def request_inputs(data: BaseModel, catalog_id: str | None = None) -> dict:
+    """
+    Return the prompt-relevant fields of a request model.
+
+    An inline available_exercises list is replaced by its catalogId, so inline
+    and uploaded catalogs fingerprint the same way. Pass catalog_id when it is
+    already known to skip re-hashing the list.
+    """
+    inputs = {name: getattr(data, name) for name in type(data).model_fields if name not in _NON_INPUT_FIELDS}
+
+    exercises = inputs.pop("available_exercises", None)
+    if catalog_id or exercises is not None:
+        inputs["catalogId"] = catalog_id or compute_catalog_id(exercises)
+    return inputs
+
+
+def fingerprint(endpoint: str, payload: dict) -> str:
+    """Return a stable SHA-256 hex digest of an endpoint's prompt inputs and prompt version."""
+    canonical = fast_json.canonical(_canonicalize({**payload, "promptVersion": PROMPT_VERSION}))
+    digest = hashlib.sha256(canonical).hexdigest()
+    return f"{endpoint}:{digest}"
+
+
+async def _cache_get(key: str) -> Any | None:
+    redis_client = get_redis()
+    endpoint = key.split(":", 1)[0]
+    # Read and touch the LRU index in one round trip. XX only updates members
+    # that already exist, so a miss leaves the index untouched.
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.get(f"aicache:{key}")
+        pipe.zadd(f"aicache:lru:{endpoint}", {key: time.time()}, xx=True)
+        raw, _ = await pipe.execute()
+    if raw is None:
+        return None
+    return fast_json.loads(raw)
+
+
+async def _cache_set(key: str, value: Any, ttl: int) -> None:
+    redis_client = get_redis()
+    endpoint = key.split(":", 1)[0]
+    lru_key = f"aicache:lru:{endpoint}"
+
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.set(f"aicache:{key}", fast_json.dumps(value), ex=ttl)
+        pipe.zadd(lru_key, {key: time.time()})
+        pipe.expire(lru_key, ttl)
+        pipe.zcard(lru_key)
+        results = await pipe.execute()
+
+    size = int(results[-1])
+    overflow = size - CACHE_MAX_ENTRIES
+    if CACHE_MAX_ENTRIES > 0 and overflow > 0:
+        evicted = await redis_client.zpopmin(lru_key, overflow)
+        if evicted:
+            await redis_client.delete(*(f"aicache:{member}" for member, _ in evicted))
+            logger.debug("Evicted %d cache entries | endpoint=%s", len(evicted), endpoint)
+
+
+async def get_or_compute(
+    key: str,
+    compute: Callable[[], Awaitable[Any]],
+    bypass: bool = False,
+) -> Any:
+    """
+    Return the cached response for a fingerprint() key, or await compute() and cache it.
+
+    bypass=True skips the lookup but still stores the fresh result, so a
+    client can force regeneration without poisoning later requests.
+    """
+    endpoint = key.split(":", 1)[0]
+    ttl = _TTLS.get(endpoint, lambda: 0)()
+    if ttl <= 0:
+        return await compute()
+
+    try:
+        get_redis()
+    except RuntimeError:
+        logger.debug("Redis not available — skipping response cache")
+        return await compute()
+
+    if bypass:
+        metrics.CACHE_REQUESTS.labels(endpoint, "bypass").inc()
+    else:
+        try:
+            cached = await _cache_get(key)
+        except Exception as e:
+            logger.warning("Cache read failed | endpoint=%s: %s", endpoint, e)
+            cached = None
+        if cached is not None:
+            metrics.CACHE_REQUESTS.labels(endpoint, "hit").inc()
+            logger.debug("Cache hit | endpoint=%s", endpoint)
+            return cached
+        metrics.CACHE_REQUESTS.labels(endpoint, "miss").inc()
+
+    result = await compute()
+
+    try:
+        await _cache_set(key, result, ttl)
+    except Exception as e:
+        logger.warning("Cache write failed | endpoint=%s: %s", endpoint, e)
+
+    return result
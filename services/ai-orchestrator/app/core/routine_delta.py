@@ -0,0 +1,217 @@
+"""
+Delta wire format for routine adaptation.
+
+Most adaptations change one or two exercises ("knee hurts" swaps the squat),
+yet in the full formats the model rewrites the whole routine. In delta mode
+the prompt shows the current routine as numbered rows and the model writes
+only the changes, one operation per line:
+
+    swap|3|41|Easier on the knees
+    sets|1|4|6
+    rest|2|120
+    remove|5
+    add|88|3|12|60|Finisher
+
+The server applies them to the current routine (apply_delta), then the
+merged routine goes through the usual catalog repair and validation. The
+caller gets the merged routine plus a structured diff of what changed.
+
+Operations that reference an unknown position or exercise id are skipped,
+like unknown rows in the compact format; a response with no usable line at
+all is an error (and re-asked by the caller).
+"""
+
+import copy
+import logging
+import re
+
+from app.core.catalog_registry import ExerciseCatalog
+
+logger = logging.getLogger("pulse.routine_delta")
+
+DELTA_OUTPUT_FORMAT = (
+    "Do NOT rewrite the routine. Return ONLY the changes, one operation per line — no JSON, no markdown fences:\n"
+    "swap|position|id|note — replace the exercise at that position with exercise id from the list\n"
+    "sets|position|sets|reps — change the number of sets and the reps per set\n"
+    "rest|position|rest_seconds — change the rest between sets\n"
+    "remove|position — drop the exercise\n"
+    "add|id|sets|reps|rest_seconds|note — append an exercise from the list\n"
+    "(position is the number of an exercise in the current routine; all numbers are whole numbers; "
+    "note is optional)\n"
+    "If nothing needs to change, reply with the single line: none\n"
+    "Example:\n"
+    "swap|3|41|Easier on the knees\n"
+    "sets|1|4|6"
+)
+
+_NO_CHANGES = "none"
+_INT = re.compile(r"\d+")
+
+_MAX_SETS = 10
+_DEFAULT_SETS = 3
+_DEFAULT_REST_SECONDS = 90
+
+
+def _int(field: str, default: int | None = None) -> int | None:
+    match = _INT.search(field)
+    return int(match.group()) if match else default
+
+
+def _exercises(routine: dict) -> list[dict]:
+    exercises = routine.get("exercises")
+    return [ex for ex in exercises if isinstance(ex, dict)] if isinstance(exercises, list) else []
+
+
+def _sets(ex: dict) -> list[dict]:
+    sets = ex.get("sets_data")
+    return [s for s in sets if isinstance(s, dict)] if isinstance(sets, list) else []
+
+
+def _reps(ex: dict) -> str:
+    reps = sorted({s.get("target_reps") for s in _sets(ex) if isinstance(s.get("target_reps"), (int, float))})
+    if not reps:
+        return ""
+    return str(reps[0]) if len(reps) == 1 else f"{reps[0]}-{reps[-1]}"
+
+
+def render_current_routine(routine: dict) -> str:
+    """The current routine as numbered position|id|name|sets|reps|rest_seconds rows for the prompt."""
+    rows = [
+        f"{position}|{ex.get('exercise_library_id', '')}|{ex.get('exercise_name', '')}|"
+        f"{len(_sets(ex))}|{_reps(ex)}|{ex.get('rest_seconds', '')}"
+        for position, ex in enumerate(_exercises(routine), start=1)
+    ]
+    return (
+        f"Current routine: {routine.get('name', '')}\n"
+        f"position|id|name|sets|reps|rest_seconds\n" + "\n".join(rows)
+    )
+
+
+def _summary(ex: dict) -> dict:
+    return {"exercise_name": ex.get("exercise_name"), "exercise_library_id": str(ex.get("exercise_library_id", ""))}
+
+
+def _set_count_and_reps(ex: dict) -> dict:
+    sets = _sets(ex)
+    return {"sets": len(sets), "reps": sets[0].get("target_reps") if sets else None}
+
+
+def _new_exercise(exercise: dict, sets: int, reps: int | None, rest: int, note: str) -> dict:
+    return {
+        "exercise_name": exercise["name"],
+        "exercise_library_id": str(exercise["rowid"]),
+        "sets_data": [
+            {"set_index": i, "target_reps": reps, "target_weight_kg": None} for i in range(1, sets + 1)
+        ],
+        "rest_seconds": rest,
+        "order_index": 0,
+        "notes": note,
+    }
+
+
+def parse_operations(text: str) -> list[list[str]]:
+    """Split a delta response into operations (lists of stripped fields, op lowercased)."""
+    operations = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("```") or "|" not in line:
+            continue
+        fields = [f.strip() for f in line.split("|")]
+        fields[0] = fields[0].lower()
+        operations.append(fields)
+    return operations
+
+
+def apply_delta(routine: dict, text: str, catalog: ExerciseCatalog) -> tuple[dict, list[dict], list[str]]:
+    """
+    Apply a delta response to routine.
+
+    Returns the merged routine (not yet repaired or validated), the diff of
+    applied operations and the operations that were skipped. Raises
+    ValueError if the response contains neither operations nor "none".
+    """
+    operations = parse_operations(text)
+    if not operations:
+        if text.strip().strip("`. ").lower() == _NO_CHANGES:
+            return copy.deepcopy(routine), [], []
+        raise ValueError("Delta response contains no operations")
+
+    # None marks a removed exercise, so positions keep referring to the original rows
+    slots: list[dict | None] = copy.deepcopy(_exercises(routine))
+    added: list[dict] = []
+    diff: list[dict] = []
+    skipped: list[str] = []
+
+    def at(fields: list[str]) -> tuple[int, dict] | None:
+        position = _int(fields[1]) if len(fields) > 1 else None
+        if position is None or not 1 <= position <= len(slots) or slots[position - 1] is None:
+            return None
+        return position, slots[position - 1]
+
+    for fields in operations:
+        op = fields[0]
+        fields += [""] * (6 - len(fields))
+        target = at(fields) if op in ("swap", "sets", "rest", "remove") else None
+
+        if op == "add":
+            exercise = catalog.by_rowid.get(fields[1])
+            if exercise is None:
+                skipped.append(f"add of unknown exercise id {fields[1]!r}")
+                continue
+            sets = max(1, min(_int(fields[2], _DEFAULT_SETS), _MAX_SETS))
+            new = _new_exercise(exercise, sets, _int(fields[3]), _int(fields[4], _DEFAULT_REST_SECONDS), fields[5])
+            added.append(new)
+            diff.append({"op": "add", "to": _summary(new), **_set_count_and_reps(new), "rest_seconds": new["rest_seconds"]})
+            continue
+        if op not in ("swap", "sets", "rest", "remove"):
+            skipped.append(f"unknown operation {op!r}")
+            continue
+        if target is None:
+            skipped.append(f"{op} at unknown position {fields[1]!r}")
+            continue
+        position, ex = target
+
+        if op == "swap":
+            exercise = catalog.by_rowid.get(fields[2])
+            if exercise is None:
+                skipped.append(f"swap to unknown exercise id {fields[2]!r}")
+                continue
+            before = _summary(ex)
+            ex["exercise_name"] = exercise["name"]
+            ex["exercise_library_id"] = str(exercise["rowid"])
+            ex["notes"] = fields[3]
+            diff.append({"op": "swap", "position": position, "from": before, "to": _summary(ex)})
+        elif op == "sets":
+            old_sets = _sets(ex)
+            before = _set_count_and_reps(ex)
+            count = max(1, min(_int(fields[2], len(old_sets) or _DEFAULT_SETS), _MAX_SETS))
+            reps = _int(fields[3], before["reps"])
+            ex["sets_data"] = [
+                {
+                    "set_index": i,
+                    "target_reps": reps,
+                    # Keep prescribed weights; added sets repeat the last one
+                    "target_weight_kg": old_sets[min(i, len(old_sets)) - 1].get("target_weight_kg") if old_sets else None,
+                }
+                for i in range(1, count + 1)
+            ]
+            diff.append({"op": "sets", "position": position, "exercise": _summary(ex), "from": before, "to": _set_count_and_reps(ex)})
+        elif op == "rest":
+            rest = _int(fields[2])
+            if rest is None:
+                skipped.append(f"rest at position {position} without a value")
+                continue
+            diff.append({"op": "rest", "position": position, "exercise": _summary(ex), "from": ex.get("rest_seconds"), "to": rest})
+            ex["rest_seconds"] = rest
+        else:
+            slots[position - 1] = None
+            diff.append({"op": "remove", "position": position, "from": _summary(ex)})
+
+    if skipped:
+        logger.warning("Skipped delta operations | count=%d: %s", len(skipped), "; ".join(skipped[:5]))
+    if not diff and len(skipped) == len(operations):
+        raise ValueError(f"No usable delta operations ({'; '.join(skipped[:3])})")
+
+    merged = {k: v for k, v in routine.items() if k != "exercises"}
+    merged["exercises"] = [ex for ex in slots if ex is not None] + added
+    return merged, diff, skipped
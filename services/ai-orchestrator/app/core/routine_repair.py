@@ -0,0 +1,218 @@
+"""
+Repair stage for AI routine output.
+
+Most invalid model responses are nearly right: a markdown fence around the
+JSON, a trailing comma, an exercise name with different casing or
+punctuation, a library id that does not match its name, or gaps in
+order_index. Rather than failing the request (and having the client pay for
+a whole new generation), responses are:
+
+1. extracted tolerantly (extract_json),
+2. matched against the catalog through its O(1) rowid/name indexes — each
+   exercise is corrected to the catalog's name and id, or dropped if it is not
+   in the catalog at all, and
+3. normalised into the ROUTINE_JSON_SCHEMA shape with order_index and
+   set_index renumbered.
+
+Only if nothing usable is left does the caller fall back to a re-ask (see
+openai_client._complete_routine).
+"""
+
+import json
+import logging
+import re
+from typing import Any
+
+from app.core import metrics
+from app.core.catalog_registry import ExerciseCatalog, normalize_name
+
+logger = logging.getLogger("pulse.routine_repair")
+
+MAX_ROUTINE_EXERCISES = 20
+_DEFAULT_SETS = 3
+_DEFAULT_REST_SECONDS = 90
+_DEFAULT_NAME = "Workout Routine"
+
+_FENCE = re.compile(r"^```[a-zA-Z]*\s*|\s*```$")
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_INT = re.compile(r"-?\d+")
+
+def record_outcome(outcome: str) -> None:
+    """Count a routine response by outcome: clean, repaired, reasked or failed."""
+    metrics.ROUTINE_OUTPUTS.labels(outcome).inc()
+
+
+def _outer_object(text: str) -> str | None:
+    """Return the first balanced {...} in text, skipping braces inside strings."""
+    start = text.find("{")
+    if start < 0:
+        return None
+    depth, in_string, escape = 0, False, False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+
+def extract_json(text: str) -> Any:
+    """
+    Parse a model response that should be one JSON object, tolerating
+    markdown fences, surrounding prose and trailing commas.
+    """
+    text = _FENCE.sub("", text.strip())
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        error = e
+
+    candidate = _outer_object(text)
+    if candidate is not None:
+        for attempt in (candidate, _TRAILING_COMMA.sub(r"\1", candidate)):
+            try:
+                return json.loads(attempt)
+            except json.JSONDecodeError:
+                continue
+    raise ValueError(f"AI response is not valid JSON: {error}")
+
+
+def _int(value, default: int | None = None) -> int | None:
+    if isinstance(value, bool):
+        return default
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = _INT.search(str(value)) if value is not None else None
+    return int(match.group()) if match else default
+
+
+def _weight(value) -> float | None:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _match(ex: dict, catalog: ExerciseCatalog) -> tuple[dict | None, str | None]:
+    """Find the catalog exercise an AI exercise refers to; returns (match, fix)."""
+    name = ex.get("exercise_name") or ex.get("name")
+    library_id = ex.get("exercise_library_id", ex.get("rowid"))
+    name = name.strip() if isinstance(name, str) else ""
+
+    by_id = catalog.by_rowid.get(str(library_id).strip()) if library_id is not None else None
+    by_name = catalog.by_name.get(name.lower()) if name else None
+
+    if by_name is not None:
+        if by_id is not by_name:
+            return by_name, f"corrected id of '{name}'"
+        return by_name, None if name == by_name["name"] else f"corrected name '{name}'"
+
+    by_normalized = catalog.by_normalized_name.get(normalize_name(name)) if name else None
+    if by_normalized is not None:
+        return by_normalized, f"matched '{name}' to '{by_normalized['name']}'"
+    if by_id is not None:
+        return by_id, f"replaced unknown name '{name}' using its id"
+    return None, f"dropped '{name or library_id}' (not in catalog)"
+
+
+def _sets(ex: dict) -> tuple[list[dict], bool]:
+    """Return normalised sets_data and whether anything had to be changed."""
+    raw = ex.get("sets_data")
+    if isinstance(raw, list) and raw and all(isinstance(s, dict) for s in raw):
+        sets = [
+            {
+                "set_index": i,
+                "target_reps": _int(s.get("target_reps", s.get("reps"))),
+                "target_weight_kg": _weight(s.get("target_weight_kg", s.get("weight_kg"))),
+            }
+            for i, s in enumerate(raw, start=1)
+        ]
+        return sets, sets != raw
+
+    # {"sets": 3, "reps": 10} or nothing usable
+    count = max(1, min(_int(ex.get("sets"), _DEFAULT_SETS), 10))
+    reps = _int(ex.get("reps", ex.get("target_reps")))
+    weight = _weight(ex.get("weight_kg", ex.get("target_weight_kg")))
+    return [
+        {"set_index": i, "target_reps": reps, "target_weight_kg": weight}
+        for i in range(1, count + 1)
+    ], True
+
+
+def repair_exercise(ex: Any, catalog: ExerciseCatalog, order_index: int) -> tuple[dict | None, list[str]]:
+    """Return the exercise corrected against the catalog (or None to drop it) and the fixes made."""
+    if not isinstance(ex, dict):
+        return None, [f"dropped non-object exercise at {order_index}"]
+
+    match, fix = _match(ex, catalog)
+    fixes = [fix] if fix else []
+    if match is None:
+        return None, fixes
+
+    sets_data, sets_fixed = _sets(ex)
+    if sets_fixed:
+        fixes.append(f"normalised sets of '{match['name']}'")
+
+    rest = _int(ex.get("rest_seconds"), _DEFAULT_REST_SECONDS)
+    notes = ex.get("notes") if isinstance(ex.get("notes"), str) else ""
+    if ex.get("order_index") != order_index:
+        fixes.append("renumbered order_index")
+
+    return {
+        "exercise_name": match["name"],
+        "exercise_library_id": str(match["rowid"]),
+        "sets_data": sets_data,
+        "rest_seconds": rest,
+        "order_index": order_index,
+        "notes": notes,
+    }, fixes
+
+
+def repair_routine(data: Any, catalog: ExerciseCatalog) -> tuple[dict, list[str]]:
+    """
+    Return the routine corrected against the catalog plus the fixes made.
+
+    Raises ValueError if no exercise in the response can be matched.
+    """
+    if isinstance(data, dict) and "exercises" not in data and isinstance(data.get("routine"), dict):
+        data = data["routine"]
+    if not isinstance(data, dict):
+        raise ValueError("AI response is not a JSON object")
+
+    fixes: list[str] = []
+    name = data.get("name")
+    if not isinstance(name, str) or not name.strip():
+        name = _DEFAULT_NAME
+        fixes.append("added missing routine name")
+    description = data.get("description") if isinstance(data.get("description"), str) else ""
+
+    raw_exercises = data.get("exercises")
+    if not isinstance(raw_exercises, list):
+        raise ValueError("Routine missing 'exercises' array")
+
+    exercises = []
+    for ex in raw_exercises:
+        repaired, ex_fixes = repair_exercise(ex, catalog, len(exercises))
+        fixes.extend(ex_fixes)
+        if repaired is not None:
+            exercises.append(repaired)
+
+    if not exercises:
+        raise ValueError("Routine contains no exercises from the provided catalog")
+    if len(exercises) > MAX_ROUTINE_EXERCISES:
+        fixes.append(f"truncated {len(exercises)} exercises to {MAX_ROUTINE_EXERCISES}")
+        exercises = exercises[:MAX_ROUTINE_EXERCISES]
+
+    return {"name": name, "description": description, "exercises": exercises}, fixes
@@ -0,0 +1,98 @@
+"""
+Deterministic rule-based routine generation.
+
+Builds a routine in the ROUTINE_JSON_SCHEMA shape from catalog metadata
+alone, in about a millisecond and without calling OpenAI:
+
+1. Exercises are picked with the prompt catalog ranking (catalog_ranking):
+   scored for the profile's goal, equipment and experience, then chosen
+   greedily with a per-muscle penalty so the routine covers several muscle
+   groups.
+2. Compound movements go first, then the rest in ranking order.
+3. Sets, reps and rest come from a per-goal template, adjusted for
+   experience (fewer exercises and sets for beginners, more for advanced).
+
+The same profile and catalog always give the same routine. It is served
+when a request asks for engine "rules", and as the fallback for
+/routine/generate while the upstream circuit breaker is open or when the
+model call fails (see routers.routine).
+"""
+
+from dataclasses import dataclass
+
+from app.core.catalog_ranking import profile_goal, profile_level, rank_exercises
+from app.core.catalog_registry import ExerciseCatalog
+
+
+@dataclass(frozen=True)
+class _Template:
+    title: str
+    sets: int
+    reps: int
+    rest_seconds: int
+    focus: str
+
+
+_TEMPLATES = {
+    "strength": _Template("Strength", 4, 5, 150, "heavy compound lifts with long rests"),
+    "hypertrophy": _Template("Hypertrophy", 3, 10, 90, "moderate loads in the hypertrophy rep range"),
+    "fat_loss": _Template("Conditioning", 3, 12, 60, "higher reps with short rests to keep the heart rate up"),
+    "endurance": _Template("Endurance", 3, 15, 60, "light loads for high reps"),
+    "general": _Template("General Fitness", 3, 10, 90, "a balanced mix of movements"),
+}
+
+# Experience level (-1 unknown, 0 beginner, 1 intermediate, 2 advanced) ->
+# (exercise count, sets adjustment, label)
+_LEVELS = {
+    -1: (7, 0, "intermediate"),
+    0: (6, -1, "beginner"),
+    1: (7, 0, "intermediate"),
+    2: (8, 1, "advanced"),
+}
+
+_MIN_SETS = 2
+_MAX_SETS = 5
+
+
+def _is_compound(ex: dict) -> bool:
+    return str(ex.get("mechanic") or "").strip().lower() == "compound"
+
+
+def build_routine(profile: dict, catalog: ExerciseCatalog) -> dict:
+    """
+    Build a routine for profile from catalog exercises.
+
+    Raises ValueError if the catalog is empty.
+    """
+    if not catalog.exercises:
+        raise ValueError("Exercise catalog is empty")
+
+    template = _TEMPLATES[profile_goal(profile)]
+    count, sets_adjustment, level = _LEVELS[profile_level(profile)]
+    sets = max(_MIN_SETS, min(template.sets + sets_adjustment, _MAX_SETS))
+
+    ranked = rank_exercises(catalog, profile, count, token_budget=float("inf"))
+    # sorted() is stable, so each group keeps its ranking order
+    picked = sorted((catalog.exercises[i] for i in ranked), key=lambda ex: not _is_compound(ex))
+
+    return {
+        "name": f"Full Body {template.title}",
+        "description": (
+            f"Full-body {template.title.lower()} session for {level} lifters: {template.focus}, "
+            f"compound movements first."
+        ),
+        "exercises": [
+            {
+                "exercise_name": ex["name"],
+                "exercise_library_id": str(ex["rowid"]),
+                "sets_data": [
+                    {"set_index": i, "target_reps": template.reps, "target_weight_kg": None}
+                    for i in range(1, sets + 1)
+                ],
+                "rest_seconds": template.rest_seconds,
+                "order_index": order,
+                "notes": "",
+            }
+            for order, ex in enumerate(picked)
+        ],
+    }
@@ -0,0 +1,238 @@
+"""
+Single-flight coalescing of identical in-flight OpenAI calls.
+
+Concurrent requests with the same fingerprint (see response_cache.fingerprint)
+share one upstream call:
+
+- In-process: the first caller starts a task and later callers await the
+  same task. The task is shielded, so a disconnecting leader does not cancel
+  the work for everyone else; it is only cancelled once every caller waiting
+  on it has gone away.
+- Across replicas: the leader takes a Redis lock (SET NX PX), clearing the
+  previous leader's result, and, when done, stores the outcome under a
+  short-lived result key and publishes it on a channel. Followers on other
+  instances subscribe and wait for the result instead of calling OpenAI
+  themselves. If the leader never answers within SINGLEFLIGHT_WAIT_SECONDS
+  (or abandons the call) the follower falls back to its own call.
+
+If Redis is unavailable only the in-process coalescing applies.
+
+Coalescing only saves upstream cost: every caller has already been counted
+by the rate limiter and token budgets, whether it leads or joins a call.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable
+
+from openai import APIError
+
+from app.core.concurrency_limiter import UpstreamOverloadedError
+from app.core.config import SINGLEFLIGHT_LOCK_TTL_MS, SINGLEFLIGHT_WAIT_SECONDS
+from app.core.deadline import DeadlineExceededError
+from app.core.redis_client import get_redis
+
+logger = logging.getLogger("pulse.singleflight")
+
+# Result keys only need to outlive the followers that are still waiting.
+_RESULT_TTL_SECONDS = 30
+
+# Lua script: take the lock and drop the previous leader's result, so that
+# followers of this call cannot read an outcome from before it started.
+# KEYS[1] = lock key, KEYS[2] = result key, ARGV[1] = owner token, ARGV[2] = TTL ms
+_LUA_ACQUIRE_LOCK = """
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    redis.call('DEL', KEYS[2])
+    return 1
+end
+return 0
+"""
+
+# Lua script: delete the lock only if we still own it.
+# KEYS[1] = lock key, ARGV[1] = owner token
+_LUA_RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_in_flight: dict[str, asyncio.Task] = {}
+# Callers currently awaiting each in-flight task
+_waiters: dict[asyncio.Task, int] = {}
+
+
+class _LeaderAbandoned(Exception):
+    """The leading instance was cancelled before it had an outcome."""
+
+
+class LeaderUpstreamError(RuntimeError):
+    """The leading instance's upstream call failed or ran out of time."""
+
+
+def _lock_key(key: str) -> str:
+    return f"singleflight:lock:{key}"
+
+
+def _result_key(key: str) -> str:
+    return f"singleflight:result:{key}"
+
+
+def _encode_outcome(result: Any = None, error: Exception | None = None) -> str:
+    if error is None:
+        return json.dumps({"ok": True, "result": result})
+    if isinstance(error, UpstreamOverloadedError):
+        return json.dumps({"ok": False, "kind": "overloaded", "error": str(error), "retryAfter": error.retry_after})
+    if isinstance(error, (APIError, DeadlineExceededError)):
+        kind = "upstream"
+    else:
+        kind = "value" if isinstance(error, ValueError) else "error"
+    return json.dumps({"ok": False, "kind": kind, "error": str(error)})
+
+
+def _decode_outcome(raw: str) -> Any:
+    """Return the leader's result, or re-raise its error locally."""
+    outcome = json.loads(raw)
+    if outcome["ok"]:
+        return outcome["result"]
+    if outcome["kind"] == "value":
+        raise ValueError(outcome["error"])
+    if outcome["kind"] == "abandoned":
+        raise _LeaderAbandoned()
+    if outcome["kind"] == "overloaded":
+        raise UpstreamOverloadedError(outcome["error"], outcome["retryAfter"])
+    if outcome["kind"] == "upstream":
+        raise LeaderUpstreamError(outcome["error"])
+    raise RuntimeError(outcome["error"])
+
+
+async def _lead(redis_client, key: str, token: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+    """Run compute() as the cluster-wide leader and publish the outcome."""
+    try:
+        result = await compute()
+        outcome = _encode_outcome(result)
+    except asyncio.CancelledError:
+        # Every local caller went away; let other instances' followers call
+        # upstream themselves rather than wait for the lock to expire.
+        await _abandon(redis_client, key, token)
+        raise
+    except Exception as e:
+        result, outcome = e, _encode_outcome(error=e)
+
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.set(_result_key(key), outcome, ex=_RESULT_TTL_SECONDS)
+            pipe.publish(_result_key(key), outcome)
+            pipe.eval(_LUA_RELEASE_LOCK, 1, _lock_key(key), token)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning("Failed to publish single-flight result | key=%s: %s", key, e)
+
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+async def _abandon(redis_client, key: str, token: str) -> None:
+    outcome = json.dumps({"ok": False, "kind": "abandoned"})
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.publish(_result_key(key), outcome)
+            pipe.eval(_LUA_RELEASE_LOCK, 1, _lock_key(key), token)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning("Failed to abandon single-flight call | key=%s: %s", key, e)
+
+
+async def _follow(redis_client, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+    """Wait for another instance's result, falling back to compute() on timeout."""
+    pubsub = redis_client.pubsub()
+    try:
+        # Subscribe before checking the result key so a publish between the
+        # two calls cannot be missed.
+        await pubsub.subscribe(_result_key(key))
+        raw = await redis_client.get(_result_key(key))
+        deadline = time.monotonic() + SINGLEFLIGHT_WAIT_SECONDS
+
+        while raw is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=remaining
+            )
+            if message is not None:
+                raw = message["data"]
+    finally:
+        await pubsub.aclose()
+
+    if raw is None:
+        logger.warning("Single-flight leader timed out — calling upstream | key=%s", key)
+        return await compute()
+
+    try:
+        result = _decode_outcome(raw)
+    except _LeaderAbandoned:
+        logger.debug("Single-flight leader abandoned the call — calling upstream | key=%s", key)
+        return await compute()
+    logger.debug("Single-flight result shared across instances | key=%s", key)
+    return result
+
+
+async def _run_distributed(key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+    try:
+        redis_client = get_redis()
+    except RuntimeError:
+        return await compute()
+
+    token = uuid.uuid4().hex
+    try:
+        acquired = await redis_client.eval(
+            _LUA_ACQUIRE_LOCK, 2, _lock_key(key), _result_key(key), token, SINGLEFLIGHT_LOCK_TTL_MS
+        )
+    except Exception as e:
+        logger.warning("Single-flight lock failed — calling upstream | key=%s: %s", key, e)
+        return await compute()
+
+    if acquired:
+        return await _lead(redis_client, key, token, compute)
+    return await _follow(redis_client, key, compute)
+
+
+def _discard(key: str, task: asyncio.Task) -> None:
+    if _in_flight.get(key) is task:
+        del _in_flight[key]
+    # Retrieve the exception so an abandoned task does not log a warning
+    if not task.cancelled():
+        task.exception()
+
+
+async def coalesce(key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Await compute() once per key across all concurrent callers.
+
+    key should be a response_cache.fingerprint() of the prompt inputs.
+    """
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_run_distributed(key, compute))
+        task.add_done_callback(lambda t: _discard(key, t))
+        _in_flight[key] = task
+    else:
+        logger.debug("Joining in-flight call | key=%s", key)
+
+    _waiters[task] = _waiters.get(task, 0) + 1
+    try:
+        return await asyncio.shield(task)
+    finally:
+        _waiters[task] -= 1
+        if not _waiters[task]:
+            del _waiters[task]
+            if not task.done():
+                # Every caller has disconnected — stop paying for the upstream call
+                logger.debug("All callers left, cancelling in-flight call | key=%s", key)
+                task.cancel()
+
@@ -0,0 +1,190 @@
+"""
+Per-user token usage accounting and token-budget quotas.
+
+Every OpenAI call reports its `usage` here. The tokens are written with one
+pipelined round trip into:
+
+- tokens:{user}:{window}:{bucket}  fixed-window totals that back the
+  TOKEN_LIMIT_PER_* budgets (checked in rate_limiter's script before each call)
+- usage:user:{user}:{YYYYMMDD}     per-endpoint prompt/cached/completion/calls hash
+- usage:all:{YYYYMMDD}             the same, summed over all users
+
+cached_tokens (prompt tokens served from the provider's prefix cache) is a
+subset of prompt_tokens; reports add the resulting cached_ratio per endpoint.
+
+The user is taken from current_user_id, which require_rate_limit sets for the
+request; calls made outside a user request (e.g. batch items without a
+context) only count towards the endpoint totals.
+"""
+
+import logging
+import time
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+
+from app.core import metrics
+from app.core.config import (
+    TOKEN_LIMIT_PER_DAY,
+    TOKEN_LIMIT_PER_HOUR,
+    TOKEN_LIMIT_PER_MINUTE,
+    USAGE_RETENTION_DAYS,
+)
+from app.core.redis_client import get_redis
+
+logger = logging.getLogger("pulse.usage")
+
+current_user_id: ContextVar[str | None] = ContextVar("current_user_id", default=None)
+
+# (window_name, window_seconds, config_getter)
+_TOKEN_WINDOWS = [
+    ("minute", 60, lambda: TOKEN_LIMIT_PER_MINUTE),
+    ("hour", 3600, lambda: TOKEN_LIMIT_PER_HOUR),
+    ("day", 86400, lambda: TOKEN_LIMIT_PER_DAY),
+]
+
+
+def _bucket_key(user_id: str, window_name: str, window_seconds: int, now: float) -> str:
+    return f"tokens:{user_id}:{window_name}:{int(now // window_seconds)}"
+
+
+def _usage_key(user_id: str | None, day: str) -> str:
+    """The usage hash for one user, or for all users when user_id is None."""
+    return f"usage:user:{user_id}:{day}" if user_id else f"usage:all:{day}"
+
+
+def _day(now: float) -> str:
+    return datetime.fromtimestamp(now, tz=timezone.utc).strftime("%Y%m%d")
+
+
+async def record_usage(endpoint: str, usage) -> None:
+    """Add one OpenAI response's token usage to the user and endpoint counters."""
+    if usage is None:
+        return
+
+    prompt_tokens = usage.prompt_tokens or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", None) or 0
+    completion_tokens = usage.completion_tokens or 0
+    metrics.UPSTREAM_TOKENS.labels(endpoint, "prompt").inc(prompt_tokens)
+    metrics.UPSTREAM_TOKENS.labels(endpoint, "cached").inc(cached_tokens)
+    metrics.UPSTREAM_TOKENS.labels(endpoint, "completion").inc(completion_tokens)
+
+    try:
+        redis_client = get_redis()
+    except RuntimeError:
+        return
+    total = prompt_tokens + completion_tokens
+    now = time.time()
+    day = _day(now)
+    retention = USAGE_RETENTION_DAYS * 86400
+    user_id = current_user_id.get()
+
+    hashes = [_usage_key(None, day)]
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            if user_id:
+                hashes.append(_usage_key(user_id, day))
+                for window_name, window_seconds, _ in _TOKEN_WINDOWS:
+                    key = _bucket_key(user_id, window_name, window_seconds, now)
+                    pipe.incrby(key, total)
+                    pipe.expire(key, 2 * window_seconds)
+            for key in hashes:
+                pipe.hincrby(key, f"{endpoint}:prompt_tokens", prompt_tokens)
+                pipe.hincrby(key, f"{endpoint}:cached_tokens", cached_tokens)
+                pipe.hincrby(key, f"{endpoint}:completion_tokens", completion_tokens)
+                pipe.hincrby(key, f"{endpoint}:calls", 1)
+                pipe.expire(key, retention)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning("Failed to record token usage | endpoint=%s: %s", endpoint, e)
+
+
+def token_budgets(user_id: str, now: float) -> list[tuple[str, int, int, str]]:
+    """(window_name, window_seconds, limit, key) of each enabled token budget for the user."""
+    windows = [(name, seconds, get_limit()) for name, seconds, get_limit in _TOKEN_WINDOWS]
+    return [
+        (name, seconds, limit, _bucket_key(user_id, name, seconds, now))
+        for name, seconds, limit in windows
+        if limit > 0  # 0 = disabled
+    ]
+
+
+def token_budget_exceeded(
+    user_id: str,
+    budget: tuple[str, int, int, str],
+    spent: int,
+    now: float,
+) -> HTTPException:
+    """Record a spent token budget and return the 429 to raise for it."""
+    window_name, window_seconds, limit, _ = budget
+    retry_after = max(1, int(window_seconds - now % window_seconds) + 1)
+    metrics.RATE_LIMIT_DECISIONS.labels("token_budget", window_name).inc()
+    logger.warning(
+        "Token budget exceeded | user=%s window=%s used=%d limit=%d retry_after=%ds",
+        user_id,
+        window_name,
+        spent,
+        limit,
+        retry_after,
+    )
+    return HTTPException(
+        status_code=429,
+        detail={
+            "error": "token_budget_exceeded",
+            "message": (
+                f"Too many tokens used. You have exceeded the "
+                f"{window_name} budget of {limit} tokens."
+            ),
+            "window": window_name,
+            "limit": limit,
+            "used": spent,
+            "retry_after_seconds": retry_after,
+        },
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+def _parse_usage_hash(raw: dict) -> dict[str, dict[str, float]]:
+    endpoints: dict[str, dict[str, float]] = {}
+    for field, value in raw.items():
+        endpoint, metric = field.split(":", 1)
+        endpoints.setdefault(endpoint, {})[metric] = int(value)
+    for totals in endpoints.values():
+        if totals.get("prompt_tokens"):
+            totals["cached_ratio"] = round(totals.get("cached_tokens", 0) / totals["prompt_tokens"], 4)
+    return endpoints
+
+
+async def usage_report(user_id: str | None, days: int) -> dict:
+    """
+    Return token usage for one user (or all users when user_id is None):
+    current budget windows plus per-endpoint totals for the last `days` days.
+    """
+    redis_client = get_redis()
+    now = time.time()
+    dates = [
+        (datetime.fromtimestamp(now, tz=timezone.utc) - timedelta(days=i)).strftime("%Y%m%d")
+        for i in range(days)
+    ]
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for date in dates:
+            pipe.hgetall(_usage_key(user_id, date))
+        if user_id:
+            pipe.mget([_bucket_key(user_id, name, seconds, now) for name, seconds, _ in _TOKEN_WINDOWS])
+        results = await pipe.execute()
+
+    report = {
+        "days": [
+            {"date": date, "endpoints": _parse_usage_hash(raw)}
+            for date, raw in zip(dates, results)
+        ],
+    }
+    if user_id:
+        report["userId"] = user_id
+        report["windows"] = {
+            name: {"used": int(spent or 0), "limit": get_limit()}
+            for (name, _, get_limit), spent in zip(_TOKEN_WINDOWS, results[-1])
+        }
+    return report
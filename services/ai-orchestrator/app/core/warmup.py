@@ -0,0 +1,85 @@
+"""
+Warm in-process state before serving.
+
+Loaded once per server rather than on the first requests:
+
+- the tiktoken encoding (may be downloaded on first use),
+- the rate-limit Lua script, loaded into Redis so requests can call it by
+  SHA (the SHAs themselves are computed at import),
+- the CATALOG_PRELOAD_ENTRIES most recently used catalogs from Redis, with
+  their prompt lines rendered and ranking features built. GETEX slides a
+  catalog's TTL on every use, so the longest TTLs are the most recent ones.
+
+Under gunicorn (gunicorn.conf.py) preload() runs in the master after the app
+is imported and before workers are forked, so the imports and this state
+are built once and every worker, including ones recycled later, starts with
+them. Redis is reached through a temporary pool that is closed again before
+the fork; each worker opens its own in the lifespan. A single uvicorn
+process does the same work in its lifespan (warm_catalogs) instead.
+
+Everything here is best effort: without Redis the server starts cold.
+"""
+
+import asyncio
+import logging
+import time
+
+from app.core.catalog_ranking import prepare_catalog
+from app.core.catalog_registry import get_catalog
+from app.core.config import CATALOG_PRELOAD_ENTRIES
+from app.core.prompt_budget import load_tokenizer
+from app.core.rate_limiter import load_rate_limit_script
+from app.core.redis_client import close_redis, get_redis, init_redis
+
+logger = logging.getLogger("pulse.warmup")
+
+_CATALOG_PREFIX = "catalog:"
+
+# Set once preload() has run in this process (or in the master it was forked from)
+preloaded = False
+
+
+async def warm_catalogs(limit: int = CATALOG_PRELOAD_ENTRIES) -> int:
+    """Load, render and index the most recently used catalogs; returns how many."""
+    if limit <= 0:
+        return 0
+    redis_client = get_redis()
+    keys = [key async for key in redis_client.scan_iter(match=f"{_CATALOG_PREFIX}*", count=1000)]
+    if not keys:
+        return 0
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.ttl(key)
+        ttls = await pipe.execute()
+
+    recent = sorted(zip(ttls, keys), reverse=True)[:limit]
+    # Oldest first, so the most recent end up at the hot end of the memory LRU
+    for _, key in reversed(recent):
+        try:
+            prepare_catalog(await get_catalog(key[len(_CATALOG_PREFIX):]))
+        except LookupError:
+            continue  # expired since the scan
+    return len(recent)
+
+
+async def _warm_redis() -> int:
+    await init_redis()
+    try:
+        await load_rate_limit_script()
+        return await warm_catalogs()
+    finally:
+        await close_redis()
+
+
+def preload() -> None:
+    """Build the warm state in this process (before forking workers)."""
+    global preloaded
+    start = time.perf_counter()
+    load_tokenizer()
+    catalogs = 0
+    try:
+        catalogs = asyncio.run(_warm_redis())
+    except Exception as e:
+        logger.warning("Redis unavailable while preloading — workers start without warm catalogs: %s", e)
+    preloaded = True
+    logger.info("Preloaded warm state | catalogs=%d seconds=%.2f", catalogs, time.perf_counter() - start)
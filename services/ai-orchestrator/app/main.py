@@ -1,11 +1,18 @@
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Response
+from fastapi.responses import ORJSONResponse
 
-from app.core.logging_config import setup_logging
-from app.core.redis_client import init_redis, close_redis
+from app.core import metrics, warmup
+from app.core.logging_config import RequestIdMiddleware, setup_logging
+from app.core.prompt_budget import load_tokenizer
+from app.core.rate_limiter import load_rate_limit_script
+from app.core.openai_client import upstream_breaker
+from app.core.redis_client import close_redis, init_redis, redis_breaker, watch_redis
 from app.routers.routine import router as routine_router
+from app.routers.usage import router as usage_router
 
 setup_logging()
 logger = logging.getLogger("pulse.app")
@@ -13,30 +20,57 @@ logger = logging.getLogger("pulse.app")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Manage startup/shutdown resources (Redis pool)."""
+    """
+    Manage startup/shutdown resources (Redis pool and health check, tokenizer,
+    warm catalogs). Under gunicorn the warm state was built in the master
+    before the fork (warmup.preload), so workers only open their Redis pool.
+    """
+    if not warmup.preloaded:
+        # May download the encoding on first run; keep that off the request path
+        await asyncio.to_thread(load_tokenizer)
     logger.info("Starting Pulse AI Orchestrator — connecting to Redis")
     try:
         await init_redis()
+        if not warmup.preloaded:
+            await load_rate_limit_script()
+            await warmup.warm_catalogs()
         logger.info("Redis connected")
     except Exception as e:
-        logger.warning("Redis unavailable — running without cache: %s", e)
+        logger.warning("Redis unavailable — running without cache, reconnecting in the background: %s", e)
+    background = [asyncio.create_task(watch_redis()), asyncio.create_task(metrics.refresh_gauges_forever())]
     yield
     logger.info("Shutting down — closing Redis pool")
+    for task in background:
+        task.cancel()
     await close_redis()
 
 
-app = FastAPI(title="Pulse AI Orchestrator", lifespan=lifespan)
-
-
-@app.middleware("http")
-async def cache_request_body(request: Request, call_next):
-    await request.body()
-    return await call_next(request)
+# Request bodies are decoded once per request by fast_json.ParseOnceRoute
+# (routers opt in via route_class); responses are encoded with orjson.
+app = FastAPI(
+    title="Pulse AI Orchestrator",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(RequestIdMiddleware)
 
 
 @app.get("/health")
 def health():
-    return {"status": "ok", "service": "ai-orchestrator"}
+    return {
+        "status": "ok",
+        "service": "ai-orchestrator",
+        "breakers": {"openai": upstream_breaker.snapshot(), "redis": redis_breaker.snapshot()},
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    # Sync, so rendering runs in the threadpool rather than on the event loop
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
 
 
 app.include_router(routine_router, prefix="/routine")
+app.include_router(usage_router, prefix="/usage")
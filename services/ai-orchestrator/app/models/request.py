@@ -1,24 +1,81 @@
-from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from pydantic import BaseModel, Field, field_validator, model_validator
+from typing import List, Dict, Any, Literal, Optional
 
 
-class GenerateRequest(BaseModel):
+def _check_exercises(exercises: Optional[List[Dict[str, Any]]]) -> Optional[List[Dict[str, Any]]]:
+    """The catalog indexes exercises by rowid and name, so every entry needs both."""
+    for i, ex in enumerate(exercises or []):
+        name = ex.get("name")
+        if ex.get("rowid") is None or not isinstance(name, str) or not name.strip():
+            raise ValueError(f"available_exercises[{i}] needs a rowid and a non-empty name")
+    return exercises
+
+
+class CatalogRequest(BaseModel):
+    """Requests that carry an exercise catalog inline or by catalogId."""
+    available_exercises: Optional[List[Dict[str, Any]]] = Field(default=None, description="Exercises from the library filtered by user equipment")
+    catalogId: Optional[str] = Field(default=None, description="Id of a catalog uploaded via POST /routine/catalog (replaces available_exercises)")
+
+    @model_validator(mode="after")
+    def require_catalog(self):
+        if self.available_exercises is None and not self.catalogId:
+            raise ValueError("Provide either available_exercises or catalogId")
+        return self
+
+    @field_validator("available_exercises")
+    @classmethod
+    def check_exercises(cls, exercises):
+        return _check_exercises(exercises)
+
+
+class CatalogUploadRequest(BaseModel):
+    available_exercises: List[Dict[str, Any]] = Field(..., min_length=1, description="Exercises from the library filtered by user equipment")
+
+    @field_validator("available_exercises")
+    @classmethod
+    def check_exercises(cls, exercises):
+        return _check_exercises(exercises)
+
+
+class GenerateRequest(CatalogRequest):
     userId: str = Field(..., description="Pulse user id")
     profile: Dict[str, Any] = Field(..., description="User profile incl. goal, experience, equipment, stats")
-    available_exercises: List[Dict[str, Any]] = Field(..., description="Exercises from the library filtered by user equipment")
     history: List[Dict[str, Any]] = Field(default_factory=list, description="Optional baseline workout logs")
+    bypassCache: bool = Field(default=False, description="Skip the cached response and force a fresh generation")
+    outputFormat: Optional[Literal["json", "compact"]] = Field(default=None, description="Model output format (response shape is the same); defaults to ROUTINE_OUTPUT_FORMAT")
+    engine: Optional[Literal["ai", "rules"]] = Field(default=None, description="\"rules\" builds the routine locally from catalog metadata without calling OpenAI; defaults to ROUTINE_ENGINE")
 
 
-class AdaptRequest(BaseModel):
+class AdaptRequest(CatalogRequest):
     userId: str = Field(..., description="Pulse user id")
     profile: Dict[str, Any] = Field(..., description="User profile incl. goal, experience, equipment, stats")
     currentRoutine: Dict[str, Any] = Field(..., description="Current routine to be adapted")
-    available_exercises: List[Dict[str, Any]] = Field(..., description="Exercises from the library filtered by user equipment")
     recentLogs: List[Dict[str, Any]] = Field(default_factory=list, description="Recent workout logs")
     feedback: Optional[str] = Field(default=None, max_length=500, description="Free-text feedback (fatigue, injury, preference)")
+    outputFormat: Optional[Literal["json", "compact"]] = Field(default=None, description="Model output format (response shape is the same); defaults to ROUTINE_OUTPUT_FORMAT")
+    mode: Optional[Literal["full", "delta"]] = Field(default=None, description="\"delta\" asks the model for changes only and adds a `diff` to the response (outputFormat is ignored); defaults to ADAPT_MODE")
 
 
 class ExplainRequest(BaseModel):
     routine: Dict[str, Any] = Field(..., description="Workout routine to explain")
     userId: Optional[str] = Field(default=None, description="Optional user id for context")
     profile: Optional[Dict[str, Any]] = Field(default=None, description="Optional user profile for personalized explanation")
+    bypassCache: bool = Field(default=False, description="Skip the cached response and force a fresh explanation")
+
+
+class SummarizeRequest(BaseModel):
+    routine: Dict[str, Any] = Field(..., description="Workout routine to summarise")
+    userId: Optional[str] = Field(default=None, description="Optional user id for context")
+    bypassCache: bool = Field(default=False, description="Skip the precomputed summary and force a fresh one")
+
+
+class BatchGenerateItem(BaseModel):
+    userId: str = Field(..., description="Pulse user id")
+    profile: Dict[str, Any] = Field(..., description="User profile incl. goal, experience, equipment, stats")
+    history: List[Dict[str, Any]] = Field(default_factory=list, description="Optional baseline workout logs")
+
+
+class BatchGenerateRequest(CatalogRequest):
+    items: List[BatchGenerateItem] = Field(..., min_length=1, description="Users to generate routines for")
+    concurrency: Optional[int] = Field(default=None, ge=1, description="Max concurrent OpenAI calls (capped by BATCH_MAX_CONCURRENCY)")
+    offline: bool = Field(default=False, description="Submit as an OpenAI Batch API job instead of generating inline")
@@ -9,3 +9,8 @@ class RoutineResponse(BaseModel):
 
 class ExplainResponse(BaseModel):
     explanation: str
+
+
+class CatalogResponse(BaseModel):
+    catalogId: str
+    exerciseCount: int
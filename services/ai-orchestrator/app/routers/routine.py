@@ -1,73 +1,490 @@
-from fastapi import APIRouter, Depends, HTTPException
-from app.models.request import GenerateRequest, AdaptRequest, ExplainRequest
-from app.core.openai_client import generate_routine, adapt_routine, explain_routine
+import logging
+from typing import AsyncIterator
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from openai import APIError
+from app.models.request import (
+    GenerateRequest,
+    AdaptRequest,
+    ExplainRequest,
+    SummarizeRequest,
+    BatchGenerateRequest,
+    CatalogRequest,
+    CatalogUploadRequest,
+)
+from app.models.response import CatalogResponse
+from app.core import fast_json, jobs, metrics
+from app.core.batch import BatchNotFoundError, generate_batch, submit_batch, collect_batch
+from app.core.catalog_registry import (
+    CatalogNotFoundError,
+    ExerciseCatalog,
+    get_catalog,
+    register_catalog,
+    resolve_catalog,
+)
+from app.core.concurrency_limiter import UpstreamOverloadedError, upstream_limiter
+from app.core.config import ADAPT_MODE, BATCH_MAX_ITEMS, ROUTINE_ENGINE, ROUTINE_RULES_FALLBACK
+from app.core.deadline import (
+    ClientDisconnectedError,
+    DeadlineExceededError,
+    apply_deadline,
+    cancel_on_disconnect,
+)
+from app.core.openai_client import (
+    generate_routine,
+    adapt_routine,
+    adapt_routine_delta,
+    explain_routine,
+    stream_generate_routine,
+    stream_adapt_routine,
+    stream_explain_routine,
+    summarize_routine_text,
+    upstream_breaker,
+)
 from app.core.rate_limiter import require_rate_limit
+from app.core.response_cache import fingerprint, get_or_compute, request_inputs
+from app.core.rule_engine import build_routine
+from app.core.singleflight import LeaderUpstreamError, coalesce
+
+router = APIRouter(tags=["routine"], route_class=fast_json.ParseOnceRoute)
+logger = logging.getLogger("pulse.routine")
+
+# The model call itself failed, here or on the replica that led a coalesced
+# call. Anything else is a bug in this service and surfaces as a 500.
+_UPSTREAM_ERRORS = (APIError, LeaderUpstreamError)
+
+
+def _sse(event: str, data) -> str:
+    """Format one Server-Sent Events message."""
+    return f"event: {event}\ndata: {fast_json.dumps(data)}\n\n"
+
+
+async def _sse_stream(events: AsyncIterator[tuple[str, object]]) -> AsyncIterator[str]:
+    """Relay (event, data) pairs as SSE, ending with 'done' or 'error'."""
+    try:
+        async for event, data in events:
+            yield _sse(event, data)
+    except UpstreamOverloadedError as e:
+        yield _sse("error", {"status": 503, "detail": str(e), "retryAfter": e.retry_after})
+        return
+    except DeadlineExceededError as e:
+        yield _sse("error", {"status": 504, "detail": str(e)})
+        return
+    except ValueError as e:
+        yield _sse("error", {"status": 400, "detail": str(e)})
+        return
+    except Exception as e:
+        logger.warning("Stream failed: %s", e)
+        yield _sse("error", {"status": 500, "detail": str(e)})
+        return
+    yield _sse("done", {})
+
+
+async def _precompute_after(
+    events: AsyncIterator[tuple[str, object]], profile: dict | None
+) -> AsyncIterator[tuple[str, object]]:
+    """Pass events through, enqueueing follow-up jobs for the streamed routine."""
+    async for event, data in events:
+        if event == "routine":
+            jobs.precompute(data, profile)
+        yield event, data
+
+
+async def _text_events(tokens: AsyncIterator[str]) -> AsyncIterator[tuple[str, str]]:
+    async for token in tokens:
+        yield "token", token
+
+
+def _event_stream_response(events: AsyncIterator[tuple[str, object]]) -> StreamingResponse:
+    return StreamingResponse(
+        _sse_stream(events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _overloaded(e: UpstreamOverloadedError) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+def _rules_engine_reason(req: GenerateRequest) -> str | None:
+    """Why this request should get a rule-based routine up front, if it should."""
+    if (req.engine or ROUTINE_ENGINE) == "rules":
+        return "requested"
+    if ROUTINE_RULES_FALLBACK and not upstream_breaker.allow():
+        return "breaker_open"
+    return None
+
+
+def _rules_routine(req: GenerateRequest, catalog: ExerciseCatalog, reason: str) -> dict:
+    routine = build_routine(req.profile, catalog)
+    metrics.ROUTINES.labels("rules", reason).inc()
+    if reason != "requested":
+        logger.warning("Serving rule-based routine | reason=%s", reason)
+    return routine
+
+
+async def _rules_events(routine: dict) -> AsyncIterator[tuple[str, dict]]:
+    for exercise in routine["exercises"]:
+        yield "exercise", exercise
+    yield "routine", routine
+
+
+async def _load_catalog(req: CatalogRequest) -> ExerciseCatalog:
+    """Resolve the request's catalog, mapping unknown ids to 404."""
+    try:
+        return await resolve_catalog(req.catalogId, req.available_exercises)
+    except CatalogNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.post("/catalog", response_model=CatalogResponse)
+async def upload_catalog_endpoint(req: CatalogUploadRequest):
+    """
+    Register an exercise catalog and return its content-hash id.
+
+    Send the returned `catalogId` instead of `available_exercises` on later
+    requests. Uploading the same exercises again returns the same id.
+    """
+    catalog = await register_catalog(req.available_exercises)
+    return {"catalogId": catalog.catalog_id, "exerciseCount": len(catalog.exercises)}
+
 
-router = APIRouter(tags=["routine"])
+@router.get("/catalog/{catalog_id}", response_model=CatalogResponse)
+async def get_catalog_endpoint(catalog_id: str):
+    """Check whether a catalog is registered (404 means upload it again)."""
+    try:
+        catalog = await get_catalog(catalog_id)
+    except CatalogNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"catalogId": catalog.catalog_id, "exerciseCount": len(catalog.exercises)}
 
 
-@router.post("/generate", dependencies=[Depends(require_rate_limit)])
-async def generate_routine_endpoint(req: GenerateRequest):
+@router.post("/generate", dependencies=[Depends(apply_deadline), Depends(require_rate_limit)])
+async def generate_routine_endpoint(req: GenerateRequest, request: Request):
     """
     Generate a new AI-powered workout routine.
 
     Uses OpenAI's GPT model to create a structured, personalised workout routine
     using only exercises from the provided exercise library.
+
+    With engine "rules" the routine is built locally by the rule engine. The
+    same happens, unless ROUTINE_RULES_FALLBACK is off, while the upstream
+    circuit breaker is open or when the model call fails; `engine` in the
+    response says which one answered.
     """
+    catalog = await _load_catalog(req)
+    reason = _rules_engine_reason(req)
+    if reason is not None:
+        try:
+            routine = _rules_routine(req, catalog, reason)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if reason == "requested":
+            jobs.precompute(routine, req.profile)
+        return {"routine": routine, "userId": req.userId, "engine": "rules"}
+
     try:
-        routine = await generate_routine(
-            profile=req.profile,
-            available_exercises=req.available_exercises,
-            history=req.history or [],
-        )
-        return {"routine": routine, "userId": req.userId}
+        key = fingerprint("generate", request_inputs(req, catalog.catalog_id))
+        routine = await cancel_on_disconnect(request, get_or_compute(
+            key,
+            lambda: coalesce(key, lambda: generate_routine(
+                profile=req.profile,
+                catalog=catalog,
+                history=req.history or [],
+                output_format=req.outputFormat,
+            )),
+            bypass=req.bypassCache,
+        ))
+        metrics.ROUTINES.labels("ai", "requested").inc()
+        jobs.precompute(routine, req.profile)
+        return {"routine": routine, "userId": req.userId, "engine": "ai"}
+    except ClientDisconnectedError:
+        # Nobody is listening; the status only shows up in access logs
+        raise HTTPException(status_code=499, detail="Client closed request")
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
+    except (UpstreamOverloadedError, DeadlineExceededError, *_UPSTREAM_ERRORS) as e:
+        # Overloaded, out of time or failing upstream: a rule-based routine
+        # now beats an error after a long wait
+        if ROUTINE_RULES_FALLBACK:
+            logger.warning("AI routine generation failed — falling back to rules: %s", e)
+            return {"routine": _rules_routine(req, catalog, "upstream_failed"), "userId": req.userId, "engine": "rules"}
+        if isinstance(e, UpstreamOverloadedError):
+            raise _overloaded(e)
+        if isinstance(e, DeadlineExceededError):
+            raise HTTPException(status_code=504, detail=str(e))
         raise HTTPException(
             status_code=500,
             detail=f"Failed to generate routine: {str(e)}"
         )
 
 
-@router.post("/adapt", dependencies=[Depends(require_rate_limit)])
-async def adapt_routine_endpoint(req: AdaptRequest):
+@router.post("/adapt", dependencies=[Depends(apply_deadline), Depends(require_rate_limit)])
+async def adapt_routine_endpoint(req: AdaptRequest, request: Request):
     """
     Adapt an existing workout routine based on user feedback and progress.
 
     Uses OpenAI's GPT model to intelligently modify the current routine
     using only exercises from the provided exercise library.
+
+    In delta mode the model returns only the changes; they are applied to
+    the current routine here and the response also carries the `diff`.
     """
+    catalog = await _load_catalog(req)
     try:
-        routine = await adapt_routine(
+        key = fingerprint("adapt", request_inputs(req, catalog.catalog_id))
+        if (req.mode or ADAPT_MODE) == "delta":
+            result = await cancel_on_disconnect(request, coalesce(key, lambda: adapt_routine_delta(
+                profile=req.profile,
+                current_routine=req.currentRoutine,
+                catalog=catalog,
+                feedback=req.feedback,
+                recent_logs=req.recentLogs or [],
+            )))
+            jobs.precompute(result["routine"], req.profile)
+            return {"routine": result["routine"], "diff": result["diff"], "userId": req.userId}
+
+        routine = await cancel_on_disconnect(request, coalesce(key, lambda: adapt_routine(
             profile=req.profile,
             current_routine=req.currentRoutine,
-            available_exercises=req.available_exercises,
+            catalog=catalog,
             feedback=req.feedback,
             recent_logs=req.recentLogs or [],
-        )
+            output_format=req.outputFormat,
+        )))
+        jobs.precompute(routine, req.profile)
         return {"routine": routine, "userId": req.userId}
+    except UpstreamOverloadedError as e:
+        raise _overloaded(e)
+    except DeadlineExceededError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ClientDisconnectedError:
+        # Nobody is listening; the status only shows up in access logs
+        raise HTTPException(status_code=499, detail="Client closed request")
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
+    except _UPSTREAM_ERRORS as e:
         raise HTTPException(
             status_code=500,
             detail=f"Failed to adapt routine: {str(e)}"
         )
 
 
-@router.post("/explain", dependencies=[Depends(require_rate_limit)])
-async def explain_routine_endpoint(req: ExplainRequest):
+@router.post("/explain", dependencies=[Depends(apply_deadline), Depends(require_rate_limit)])
+async def explain_routine_endpoint(req: ExplainRequest, request: Request):
     """
     Generate an AI-powered explanation of a workout routine.
+
+    Routines returned by /generate and /adapt are explained ahead of time by
+    the job workers; this returns that explanation (waiting for it if the
+    job is still running) unless bypassCache is set.
     """
     try:
-        explanation = await explain_routine(req.routine, req.profile)
+        key = fingerprint("explain", request_inputs(req))
+
+        def compute():
+            if req.bypassCache:
+                return explain_routine(req.routine, req.profile)
+            return jobs.precomputed_or(
+                "explain", req.routine, req.profile, lambda: explain_routine(req.routine, req.profile)
+            )
+
+        explanation = await cancel_on_disconnect(request, get_or_compute(
+            key,
+            lambda: coalesce(key, compute),
+            bypass=req.bypassCache,
+        ))
         return {"explanation": explanation}
+    except UpstreamOverloadedError as e:
+        raise _overloaded(e)
+    except DeadlineExceededError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ClientDisconnectedError:
+        # Nobody is listening; the status only shows up in access logs
+        raise HTTPException(status_code=499, detail="Client closed request")
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
+    except _UPSTREAM_ERRORS as e:
         raise HTTPException(
             status_code=500,
             detail=f"Failed to generate explanation: {str(e)}"
         )
+
+
+@router.post("/summarize", dependencies=[Depends(apply_deadline), Depends(require_rate_limit)])
+async def summarize_routine_endpoint(req: SummarizeRequest, request: Request):
+    """
+    Summarise a workout routine in a couple of sentences.
+
+    Like /explain, returns the summary precomputed by the job workers when
+    there is one.
+    """
+    try:
+        key = fingerprint("summarize", request_inputs(req))
+
+        def compute():
+            if req.bypassCache:
+                return summarize_routine_text(req.routine)
+            return jobs.precomputed_or("summarize", req.routine, None, lambda: summarize_routine_text(req.routine))
+
+        summary = await cancel_on_disconnect(request, coalesce(key, compute))
+        return {"summary": summary}
+    except UpstreamOverloadedError as e:
+        raise _overloaded(e)
+    except DeadlineExceededError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ClientDisconnectedError:
+        # Nobody is listening; the status only shows up in access logs
+        raise HTTPException(status_code=499, detail="Client closed request")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except _UPSTREAM_ERRORS as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to summarise routine: {str(e)}"
+        )
+
+
+@router.post("/generate/stream", dependencies=[Depends(apply_deadline), Depends(require_rate_limit)])
+async def generate_routine_stream_endpoint(req: GenerateRequest):
+    """
+    Streaming variant of /generate (Server-Sent Events).
+
+    Emits an `exercise` event for each exercise as soon as the model has
+    finished writing it, then a `routine` event with the validated routine
+    and a final `done` (or `error`) event.
+
+    Rule-based routines (see /generate) are sent as the same events at once.
+    Only a failure before the stream starts falls back to them.
+    """
+    catalog = await _load_catalog(req)
+    try:
+        reason = _rules_engine_reason(req)
+        if reason is None:
+            try:
+                upstream_limiter.ensure_capacity("generate")
+            except UpstreamOverloadedError:
+                if not ROUTINE_RULES_FALLBACK:
+                    raise
+                reason = "upstream_failed"
+        if reason is not None:
+            return _event_stream_response(_rules_events(_rules_routine(req, catalog, reason)))
+        events = stream_generate_routine(
+            profile=req.profile,
+            catalog=catalog,
+            history=req.history or [],
+            output_format=req.outputFormat,
+        )
+    except UpstreamOverloadedError as e:
+        raise _overloaded(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _event_stream_response(_precompute_after(events, req.profile))
+
+
+@router.post("/adapt/stream", dependencies=[Depends(apply_deadline), Depends(require_rate_limit)])
+async def adapt_routine_stream_endpoint(req: AdaptRequest):
+    """
+    Streaming variant of /adapt (Server-Sent Events), with the same events
+    as /generate/stream. Full mode only: delta mode, whether requested or
+    the ADAPT_MODE default, is rejected, so while ADAPT_MODE is "delta"
+    streaming clients must ask for mode "full".
+    """
+    if (req.mode or ADAPT_MODE) == "delta":
+        raise HTTPException(
+            status_code=400,
+            detail="Delta mode is not available for streaming; use /routine/adapt, or mode 'full' to stream",
+        )
+    catalog = await _load_catalog(req)
+    try:
+        upstream_limiter.ensure_capacity("adapt")
+        events = stream_adapt_routine(
+            profile=req.profile,
+            current_routine=req.currentRoutine,
+            catalog=catalog,
+            feedback=req.feedback,
+            recent_logs=req.recentLogs or [],
+            output_format=req.outputFormat,
+        )
+    except UpstreamOverloadedError as e:
+        raise _overloaded(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _event_stream_response(_precompute_after(events, req.profile))
+
+
+@router.post("/explain/stream", dependencies=[Depends(apply_deadline), Depends(require_rate_limit)])
+async def explain_routine_stream_endpoint(req: ExplainRequest):
+    """
+    Streaming variant of /explain (Server-Sent Events).
+
+    Emits a `token` event per text delta, then `done` (or `error`).
+    """
+    try:
+        upstream_limiter.ensure_capacity("explain")
+        tokens = stream_explain_routine(req.routine, req.profile)
+    except UpstreamOverloadedError as e:
+        raise _overloaded(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _event_stream_response(_text_events(tokens))
+
+
+@router.post("/generate/batch")
+async def generate_routine_batch_endpoint(req: BatchGenerateRequest):
+    """
+    Generate routines for many users against one shared exercise catalog.
+
+    Results stream back as NDJSON, one line per user in completion order, each
+    with `status` "ok" (and `routine`) or "error" (and `error`). With
+    `offline=true` the batch is submitted to the OpenAI Batch API instead and
+    the response carries a `batchId` to poll.
+    """
+    if len(req.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch exceeds maximum of {BATCH_MAX_ITEMS} items (got {len(req.items)})",
+        )
+
+    catalog = await _load_catalog(req)
+    items = [item.model_dump() for item in req.items]
+
+    if req.offline:
+        try:
+            return await submit_batch(items, catalog)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Failed to submit routine batch: {str(e)}"
+            )
+
+    async def ndjson() -> AsyncIterator[str]:
+        async for result in generate_batch(items, catalog, req.concurrency):
+            yield fast_json.dumps(result) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@router.get("/generate/batch/{batch_id}")
+async def get_routine_batch_endpoint(batch_id: str):
+    """
+    Poll an offline batch. Once it has completed, `results` holds one entry
+    per user in the same shape as the NDJSON lines from /generate/batch.
+    """
+    try:
+        return await collect_batch(batch_id)
+    except BatchNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to collect routine batch: {str(e)}"
+        )
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, HTTPException, Query
+from app.core.redis_client import REDIS_ERRORS, redis_breaker
+from app.core.usage import usage_report
+
+router = APIRouter(tags=["usage"])
+
+
+async def _report(user_id: str | None, days: int) -> dict:
+    """usage_report, with Redis being unavailable or failing mapped to 503."""
+    try:
+        return await usage_report(user_id, days)
+    except REDIS_ERRORS as e:
+        redis_breaker.record_failure()
+        raise HTTPException(status_code=503, detail=f"Redis unavailable: {e}")
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@router.get("")
+async def endpoint_usage_endpoint(days: int = Query(default=7, ge=1, le=35)):
+    """
+    Token usage per endpoint (prompt/completion tokens and calls), summed over
+    all users, for each of the last `days` days.
+    """
+    return await _report(None, days)
+
+
+@router.get("/{user_id}")
+async def user_usage_endpoint(user_id: str, days: int = Query(default=7, ge=1, le=35)):
+    """
+    Token usage for one user: spend in the current token-budget windows and
+    per-endpoint totals for each of the last `days` days.
+    """
+    return await _report(user_id, days)
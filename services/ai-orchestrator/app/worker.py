@@ -0,0 +1,257 @@
+"""
+Worker process for precomputed explain/summary jobs (see app.core.jobs).
+
+Run next to the API with the same Redis and OpenAI settings:
+
+    python -m app.worker
+
+One reader pulls jobs from the ai-workers consumer group and runs up to
+JOB_WORKER_CONCURRENCY of them at a time. A job is acked once it is done,
+or once it has failed JOB_MAX_ATTEMPTS times (it is then copied to the dead
+letter stream). A failed attempt is left unacked, and the reclaim loop
+claims such jobs — and those of workers that died mid-job — again after
+JOB_RETRY_IDLE_SECONDS.
+
+A heartbeat tells the API a worker is alive (it only enqueues while one is)
+and samples the stream's backlog into pulse_job_backlog / pulse_job_pending.
+Metrics are served on JOB_WORKER_METRICS_PORT.
+
+SIGTERM / SIGINT stop taking new jobs and wait for the running ones.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import socket
+import time
+
+from prometheus_client import start_http_server
+from redis.exceptions import ResponseError
+
+from app.core import fast_json, jobs, metrics
+from app.core.config import (
+    JOB_MAX_ATTEMPTS,
+    JOB_RESULT_TTL_SECONDS,
+    JOB_RETRY_IDLE_SECONDS,
+    JOB_STREAM_MAXLEN,
+    JOB_WORKER_CONCURRENCY,
+    JOB_WORKER_METRICS_PORT,
+)
+from app.core.logging_config import setup_logging
+from app.core.openai_client import explain_routine, summarize_routine_text
+from app.core.redis_client import close_redis, get_redis, init_redis
+from app.core.usage import current_user_id
+
+logger = logging.getLogger("pulse.worker")
+
+_HEARTBEAT_SECONDS = 5
+_HEARTBEAT_TTL_SECONDS = 15
+_READ_BLOCK_MS = 5000
+
+_RUNNERS = {
+    "explain": lambda payload: explain_routine(payload["routine"], payload.get("profile")),
+    "summarize": lambda payload: summarize_routine_text(payload["routine"]),
+}
+
+
+async def ensure_group() -> None:
+    """Create the stream and consumer group if they do not exist yet."""
+    try:
+        await get_redis().xgroup_create(jobs.STREAM, jobs.GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+class Worker:
+    def __init__(self, consumer: str, concurrency: int = JOB_WORKER_CONCURRENCY) -> None:
+        self.consumer = consumer
+        self.concurrency = concurrency
+        self._running: set[asyncio.Task] = set()
+
+    # --- jobs ---
+
+    async def process(self, msg_id: str, fields: dict) -> None:
+        """Run one job attempt and ack it unless it should be retried."""
+        redis_client = get_redis()
+        kind = fields.get("kind")
+        runner = _RUNNERS.get(kind)
+        if runner is None or "job" not in fields:
+            logger.warning("Dropping malformed job | id=%s kind=%s", msg_id, kind)
+            await redis_client.xack(jobs.STREAM, jobs.GROUP, msg_id)
+            return
+
+        key = jobs.job_key(fields["job"])
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping={"kind": kind, "status": "running"})
+            pipe.hincrby(key, "attempts", 1)
+            pipe.expire(key, JOB_RESULT_TTL_SECONDS)
+            _, attempts, _ = await pipe.execute()
+
+        payload = fast_json.loads(fields["payload"])
+        # Tokens spent precomputing count against the user the routine is for
+        current_user_id.set(payload.get("userId"))
+        start = time.perf_counter()
+        try:
+            result = await runner(payload)
+        except Exception as e:
+            metrics.JOB_SECONDS.labels(kind).observe(time.perf_counter() - start)
+            # A ValueError (e.g. an oversized prompt) fails the same way every time
+            if attempts < JOB_MAX_ATTEMPTS and not isinstance(e, ValueError):
+                metrics.JOBS_PROCESSED.labels(kind, "retry").inc()
+                logger.warning("Job failed — will retry | kind=%s id=%s attempt=%s: %s", kind, msg_id, attempts, e)
+                await redis_client.hset(key, mapping={"status": "queued", "error": str(e)})
+                return
+            metrics.JOBS_PROCESSED.labels(kind, "failed").inc()
+            logger.error("Job failed | kind=%s id=%s attempts=%s: %s", kind, msg_id, attempts, e)
+            async with redis_client.pipeline(transaction=False) as pipe:
+                pipe.hset(key, mapping={"status": "failed", "error": str(e)})
+                pipe.expire(key, JOB_RESULT_TTL_SECONDS)
+                pipe.publish(key, "failed")
+                pipe.xadd(
+                    jobs.DEAD_LETTER_STREAM,
+                    {**fields, "error": str(e), "attempts": attempts},
+                    maxlen=JOB_STREAM_MAXLEN,
+                    approximate=True,
+                )
+                pipe.xack(jobs.STREAM, jobs.GROUP, msg_id)
+                await pipe.execute()
+            return
+
+        metrics.JOB_SECONDS.labels(kind).observe(time.perf_counter() - start)
+        metrics.JOBS_PROCESSED.labels(kind, "done").inc()
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping={"status": "done", "result": fast_json.dumps(result)})
+            pipe.hdel(key, "error")
+            pipe.expire(key, JOB_RESULT_TTL_SECONDS)
+            pipe.publish(key, "done")
+            pipe.xack(jobs.STREAM, jobs.GROUP, msg_id)
+            await pipe.execute()
+        logger.debug("Job done | kind=%s id=%s", kind, msg_id)
+
+    def _start(self, msg_id: str, fields: dict) -> None:
+        task = asyncio.create_task(self._run(msg_id, fields))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, msg_id: str, fields: dict) -> None:
+        try:
+            await self.process(msg_id, fields)
+        except Exception as e:
+            # Redis trouble mid-job; the message stays pending and is reclaimed
+            logger.warning("Job bookkeeping failed | id=%s: %s", msg_id, e)
+
+    async def _free_slots(self) -> int:
+        """Wait until at least one job slot is free and return how many are."""
+        while len(self._running) >= self.concurrency:
+            await asyncio.wait(self._running, return_when=asyncio.FIRST_COMPLETED)
+        return self.concurrency - len(self._running)
+
+    # --- loops ---
+
+    async def read_loop(self) -> None:
+        """Take new jobs from the group as slots free up."""
+        redis_client = get_redis()
+        while True:
+            free = await self._free_slots()
+            try:
+                entries = await redis_client.xreadgroup(
+                    jobs.GROUP, self.consumer, {jobs.STREAM: ">"}, count=free, block=_READ_BLOCK_MS
+                )
+            except Exception as e:
+                logger.warning("Reading jobs failed: %s", e)
+                await asyncio.sleep(1)
+                continue
+            for _, messages in entries or []:
+                for msg_id, fields in messages:
+                    self._start(msg_id, fields)
+
+    async def reclaim_loop(self) -> None:
+        """Claim jobs left unacked for JOB_RETRY_IDLE_SECONDS and run them again."""
+        redis_client = get_redis()
+        idle_ms = int(JOB_RETRY_IDLE_SECONDS * 1000)
+        while True:
+            await asyncio.sleep(max(JOB_RETRY_IDLE_SECONDS / 2, 1))
+            free = await self._free_slots()
+            try:
+                _, messages, _ = await redis_client.xautoclaim(
+                    jobs.STREAM, jobs.GROUP, self.consumer, min_idle_time=idle_ms, start_id="0-0", count=free
+                )
+            except Exception as e:
+                logger.warning("Reclaiming jobs failed: %s", e)
+                continue
+            for msg_id, fields in messages:
+                # Entries trimmed from the stream come back without fields
+                if fields:
+                    logger.info("Retrying job | id=%s", msg_id)
+                    self._start(msg_id, fields)
+
+    async def heartbeat_loop(self) -> None:
+        """Advertise a live worker and sample the stream backlog."""
+        redis_client = get_redis()
+        while True:
+            try:
+                await redis_client.set(jobs.HEARTBEAT_KEY, self.consumer, ex=_HEARTBEAT_TTL_SECONDS)
+                for group in await redis_client.xinfo_groups(jobs.STREAM):
+                    if group["name"] == jobs.GROUP:
+                        # lag is unknown (None) for a while after a trim
+                        if group.get("lag") is not None:
+                            metrics.JOB_BACKLOG.set(group["lag"])
+                        metrics.JOB_PENDING.set(group["pending"])
+            except Exception as e:
+                logger.warning("Worker heartbeat failed: %s", e)
+            await asyncio.sleep(_HEARTBEAT_SECONDS)
+
+    async def drain(self) -> None:
+        """Wait for running jobs, then leave the group if nothing is left pending."""
+        if self._running:
+            logger.info("Waiting for %s running job(s)", len(self._running))
+            await asyncio.gather(*self._running, return_exceptions=True)
+        try:
+            redis_client = get_redis()
+            pending = await redis_client.xpending_range(
+                jobs.STREAM, jobs.GROUP, min="-", max="+", count=1, consumername=self.consumer
+            )
+            if not pending:
+                await redis_client.xgroup_delconsumer(jobs.STREAM, jobs.GROUP, self.consumer)
+        except Exception as e:
+            logger.warning("Leaving the consumer group failed: %s", e)
+
+
+async def run() -> None:
+    await init_redis(fail_fast=False)
+    await ensure_group()
+    worker = Worker(f"{socket.gethostname()}-{os.getpid()}")
+    logger.info("Job worker started | consumer=%s concurrency=%s", worker.consumer, worker.concurrency)
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+
+    loops = [
+        asyncio.create_task(worker.read_loop()),
+        asyncio.create_task(worker.reclaim_loop()),
+        asyncio.create_task(worker.heartbeat_loop()),
+    ]
+    try:
+        await stopping.wait()
+        logger.info("Stopping job worker")
+    finally:
+        for task in loops:
+            task.cancel()
+        await asyncio.gather(*loops, return_exceptions=True)
+        await worker.drain()
+        await close_redis()
+
+
+def main() -> None:
+    setup_logging()
+    if JOB_WORKER_METRICS_PORT:
+        start_http_server(JOB_WORKER_METRICS_PORT)
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
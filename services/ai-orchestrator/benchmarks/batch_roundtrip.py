@@ -0,0 +1,138 @@
+"""
+End-to-end check of /routine/generate/batch against the fake upstream.
+
+Starts benchmarks.fake_openai in this process and calls the app through
+httpx's ASGI transport (fakeredis behind it), with --items users sharing
+one inline catalog:
+
+1. online: the NDJSON stream, one result line per user.
+2. offline: the batch is submitted to the fake's Batch API (file upload and
+   batch creation through the OpenAI SDK), then GET /routine/generate/batch/{id}
+   is polled until it has completed and its results are collected.
+3. an unknown batchId, which must be a 404.
+
+Reports the time and ok/error counts of each mode and exits 1 if a result
+is missing, a routine did not come back valid, or the status codes are
+wrong. With --error-rate some items fail upstream; they must come back as
+"error" results rather than failing the batch.
+
+Usage (from services/ai-orchestrator):
+    python -m benchmarks.batch_roundtrip
+    python -m benchmarks.batch_roundtrip --items 200 --ttft-ms 50 --error-rate 0.05
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+
+import httpx
+import orjson
+import uvicorn
+
+from benchmarks.fake_openai import FakeOpenAI, add_profile_arguments, profile_from_args
+
+
+def _body(args, offline: bool) -> dict:
+    from benchmarks.fixtures import exercise_catalog, profile, workout_history
+
+    rng = random.Random(args.seed)
+    return {
+        "available_exercises": exercise_catalog(args.exercises, args.seed),
+        "items": [
+            {
+                "userId": f"batch-{i}",
+                "profile": profile(rng),
+                "history": workout_history(args.exercises, args.sessions, rng),
+            }
+            for i in range(args.items)
+        ],
+        "offline": offline,
+    }
+
+
+def _check(name: str, args, results: list[dict], seconds: float, problems: list[str]) -> None:
+    ok = [r for r in results if r["status"] == "ok"]
+    print(f"{name:>8}: {len(results)} results in {seconds:6.2f}s | ok {len(ok)}, error {len(results) - len(ok)}")
+    if sorted(r["userId"] for r in results) != sorted(f"batch-{i}" for i in range(args.items)):
+        problems.append(f"{name}: expected one result per user, got {len(results)}")
+    if not args.error_rate and len(ok) != len(results):
+        errors = {r["error"] for r in results if r["status"] != "ok"}
+        problems.append(f"{name}: {len(results) - len(ok)} errors without injected failures: {sorted(errors)[:3]}")
+    if any(not r["routine"]["exercises"] for r in ok):
+        problems.append(f"{name}: ok result without exercises")
+
+
+async def _run(args) -> list[str]:
+    # Imported here, once the environment points at the fake upstream
+    from app.main import app
+    from benchmarks.fixtures import redis_fixture
+
+    logging.getLogger("pulse").setLevel(logging.ERROR)
+    problems: list[str] = []
+    fake = FakeOpenAI(profile_from_args(args))
+    server = uvicorn.Server(uvicorn.Config(fake.app, host="127.0.0.1", port=args.upstream_port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with redis_fixture(), httpx.AsyncClient(transport=transport, base_url="http://batch", timeout=300) as client:
+            start = time.perf_counter()
+            resp = await client.post("/routine/generate/batch", json=_body(args, offline=False))
+            results = [orjson.loads(line) for line in resp.text.splitlines() if line]
+            _check("online", args, results, time.perf_counter() - start, problems)
+
+            start = time.perf_counter()
+            resp = await client.post("/routine/generate/batch", json=_body(args, offline=True))
+            if resp.status_code != 200:
+                return problems + [f"offline submit: {resp.status_code} {resp.text}"]
+            batch_id = resp.json()["batchId"]
+            while True:
+                resp = await client.get(f"/routine/generate/batch/{batch_id}")
+                if resp.status_code != 200 or resp.json()["status"] == "completed":
+                    break
+                await asyncio.sleep(args.poll_seconds)
+            if resp.status_code != 200:
+                return problems + [f"offline collect: {resp.status_code} {resp.text}"]
+            _check("offline", args, resp.json()["results"], time.perf_counter() - start, problems)
+            print(f"{'':>10}upstream: {fake.stats['batches']} batch, {fake.stats['calls']} calls in total")
+
+            resp = await client.get("/routine/generate/batch/batch_missing")
+            print(f"{'unknown':>8}: {resp.status_code}")
+            if resp.status_code != 404:
+                problems.append(f"unknown batch id: expected 404, got {resp.status_code}")
+    finally:
+        server.should_exit = True
+        await serving
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=20)
+    parser.add_argument("--exercises", type=int, default=300, help="exercises in the shared catalog")
+    parser.add_argument("--sessions", type=int, default=4, help="history sessions per item")
+    parser.add_argument("--poll-seconds", type=float, default=0.2)
+    parser.add_argument("--upstream-port", type=int, default=8089)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    # App config is read at import time, so point it at the fake first
+    os.environ.setdefault("OPENAI_BASE_URL", f"http://127.0.0.1:{args.upstream_port}/v1")
+    os.environ.setdefault("OPENAI_API_KEY", "unused")
+
+    problems = asyncio.run(_run(args))
+    if problems:
+        print("\nFAILED:")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+    print("\nok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Microbenchmark: ingestion cost of a large routine request.
+
+Builds a /routine/generate body with a 500-exercise inline catalog and a few
+weeks of history, then times the per-request work done before the model is
+called:
+
+- legacy:  stdlib json.loads, stdlib sort_keys encoding for the catalogId
+           and the cache key
+- current: orjson decode (ParseOnceRequest), orjson canonical encoding
+
+Both paths validate the same GenerateRequest. The end-to-end section posts
+the same body to POST /routine/catalog (decode, validate, hash, register; no
+OpenAI call) through the real app.
+
+Usage (from services/ai-orchestrator; the key is never used):
+    OPENAI_API_KEY=unused python -m benchmarks.bench_body_parsing
+    OPENAI_API_KEY=unused python -m benchmarks.bench_body_parsing --exercises 2000
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import statistics
+import time
+from typing import Any, Callable
+
+import fakeredis
+import httpx
+
+from app.core import fast_json
+from app.core import redis_client as redis_module
+from app.core.catalog_registry import compute_catalog_id
+from app.core.response_cache import _canonicalize, fingerprint, request_inputs
+from app.main import app
+from app.models.request import GenerateRequest
+from benchmarks.fixtures import generate_body
+
+
+def _legacy_catalog_id(exercises: list[dict]) -> str:
+    encoded = sorted(json.dumps(ex, sort_keys=True, separators=(",", ":"), default=str) for ex in exercises)
+    return hashlib.sha256("\n".join(encoded).encode("utf-8")).hexdigest()
+
+
+def _legacy_fingerprint(endpoint: str, payload: dict) -> str:
+    canonical = json.dumps(_canonicalize(payload), sort_keys=True, separators=(",", ":"), default=str)
+    return f"{endpoint}:{hashlib.sha256(canonical.encode('utf-8')).hexdigest()}"
+
+
+def _legacy_ingest(raw: bytes) -> None:
+    body = json.loads(raw)
+    # endpoint: validation, catalog resolution, cache key
+    req = GenerateRequest.model_validate(body)
+    catalog_id = _legacy_catalog_id(req.available_exercises)
+    _legacy_fingerprint("generate", request_inputs(req, catalog_id))
+
+
+def _current_ingest(raw: bytes) -> None:
+    body = fast_json.loads(raw)
+    req = GenerateRequest.model_validate(body)
+    catalog_id = compute_catalog_id(req.available_exercises)
+    fingerprint("generate", request_inputs(req, catalog_id))
+
+
+def _time(fn: Callable[[], Any], iterations: int) -> list[float]:
+    fn()  # warm up
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _report(label: str, samples: list[float]) -> float:
+    mean = statistics.mean(samples)
+    p95 = sorted(samples)[int(len(samples) * 0.95) - 1]
+    print(f"  {label:<28} mean {mean:7.3f} ms   p95 {p95:7.3f} ms")
+    return mean
+
+
+async def _end_to_end(raw: bytes, requests: int) -> None:
+    redis_module._pool = fakeredis.FakeAsyncRedis(decode_responses=True)
+    transport = httpx.ASGITransport(app=app)
+    headers = {"content-type": "application/json"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/routine/catalog", content=raw, headers=headers)
+        samples = []
+        start = time.perf_counter()
+        for _ in range(requests):
+            t0 = time.perf_counter()
+            resp = await client.post("/routine/catalog", content=raw, headers=headers)
+            samples.append((time.perf_counter() - t0) * 1000)
+            resp.raise_for_status()
+        elapsed = time.perf_counter() - start
+    _report("POST /routine/catalog", samples)
+    print(f"  throughput                   {requests / elapsed:7.1f} req/s (single client)")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--exercises", type=int, default=500)
+    parser.add_argument("--sessions", type=int, default=20, help="history sessions in the payload")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=100, help="end-to-end requests")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    logging.getLogger("pulse").setLevel(logging.ERROR)
+
+    raw = json.dumps(generate_body(args.exercises, args.sessions, args.seed)).encode("utf-8")
+    print(f"payload: {args.exercises} exercises, {args.sessions} sessions, {len(raw) / 1024:.0f} KiB\n")
+
+    print("ingestion (decode + validate + catalog hash + fingerprints):")
+    legacy = _report("legacy (stdlib json)", _time(lambda: _legacy_ingest(raw), args.iterations))
+    current = _report("current (orjson, parse once)", _time(lambda: _current_ingest(raw), args.iterations))
+    print(f"  speedup                      {legacy / current:7.2f}x\n")
+
+    print("decode only:")
+    _report("json.loads", _time(lambda: json.loads(raw), args.iterations))
+    _report("orjson.loads", _time(lambda: fast_json.loads(raw), args.iterations))
+    _report("model_validate_json", _time(lambda: GenerateRequest.model_validate_json(raw), args.iterations))
+    print()
+
+    print("end to end (ASGI, fakeredis):")
+    await _end_to_end(raw, args.requests)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
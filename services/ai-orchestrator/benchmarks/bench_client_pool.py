@@ -0,0 +1,106 @@
+"""
+Benchmark: aggregate throughput of the OpenAI client pool as keys are added.
+
+Each key is backed by its own local fake upstream (see
+sim_concurrency_limiter.FakeUpstream) that answers 429 above --key-rps calls
+per second, like a per-key rate limit. Closed-loop workers call
+openai_client._complete through a ModelRouter with 1..--max-keys keys, and the
+report shows completed calls per second, 429s absorbed by failover and
+errors that reached the caller. The concurrency limiter is bypassed so only
+the pool is measured.
+
+It also checks that each endpoint is sent its configured model and that a
+call fails over to OPENAI_FALLBACK_MODEL once every key is throttled.
+
+Usage (from services/ai-orchestrator; the key is never used):
+    OPENAI_API_KEY=unused python -m benchmarks.bench_client_pool
+    OPENAI_API_KEY=unused python -m benchmarks.bench_client_pool --max-keys 4 --workers 64
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+import types
+
+from openai import RateLimitError
+
+from app.core import openai_client
+from app.core.concurrency_limiter import AdaptiveConcurrencyLimiter
+from app.core.model_router import ModelRouter
+from benchmarks.sim_concurrency_limiter import FakeUpstream
+
+
+def _fake_client(upstream: FakeUpstream):
+    return types.SimpleNamespace(chat=types.SimpleNamespace(completions=upstream))
+
+
+async def _throughput(keys: int, args) -> None:
+    upstreams = [FakeUpstream(capacity=1000, rps=args.key_rps, jitter=0, seed=i) for i in range(keys)]
+    openai_client.router = ModelRouter([_fake_client(u) for u in upstreams])
+    completed = surfaced = 0
+    stop = time.monotonic() + args.seconds
+
+    async def worker() -> None:
+        nonlocal completed, surfaced
+        while time.monotonic() < stop:
+            try:
+                await openai_client._complete("explain", [{"role": "system", "content": "explain"}])
+                completed += 1
+            except RateLimitError:
+                surfaced += 1
+                await asyncio.sleep(0.05)
+
+    await asyncio.gather(*(worker() for _ in range(args.workers)))
+    absorbed = sum(u.throttled for u in upstreams) - surfaced
+    print(
+        f"  {keys} key{'s' if keys > 1 else ' '}: {completed / args.seconds:7.1f} calls/s | "
+        f"429s absorbed by failover {absorbed:5d} | errors surfaced {surfaced:5d}"
+    )
+
+
+async def _check_routing() -> None:
+    upstream = FakeUpstream(capacity=1000, jitter=0)
+    seen = []
+    create = upstream.create
+
+    async def recording_create(**body):
+        seen.append((body["messages"][0]["content"], body["model"]))
+        return await create(**body)
+
+    upstream.create = recording_create
+    openai_client.router = ModelRouter(
+        [_fake_client(upstream)],
+        endpoint_models={"explain": "small-model"},
+        default_model="large-model",
+        fallback_model="fallback-model",
+    )
+    for endpoint in ("generate", "explain"):
+        await openai_client._complete(endpoint, [{"role": "system", "content": endpoint}])
+    assert seen == [("generate", "large-model"), ("explain", "small-model")], seen
+
+    upstream.fail_next = 1
+    seen.clear()
+    await openai_client._complete("generate", [{"role": "system", "content": "generate"}])
+    assert [model for _, model in seen] == ["large-model", "fallback-model"], seen
+    print("routing: per-endpoint models and fallback-model failover OK\n")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-keys", type=int, default=3)
+    parser.add_argument("--key-rps", type=float, default=50, help="calls per second per key before 429")
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=3)
+    args = parser.parse_args()
+    logging.getLogger("pulse").setLevel(logging.ERROR)
+    openai_client.upstream_limiter = AdaptiveConcurrencyLimiter(initial=10_000, minimum=10_000, maximum=10_000)
+
+    await _check_routing()
+    print(f"throughput ({args.workers} workers, {args.key_rps:.0f} calls/s per key):")
+    for keys in range(1, args.max_keys + 1):
+        await _throughput(keys, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,161 @@
+"""
+Benchmark: JSON vs compact routine output — completion tokens and wall time.
+
+Offline (default): renders the same routines in both wire formats, counts
+their completion tokens with the prompt tokenizer, and models wall time as
+time-to-first-token + tokens / decode rate. Server-side parse/expand time is
+measured for real.
+
+Live (--live): sends the same generate prompts to the configured model in
+both formats and reports actual usage.completion_tokens and wall time.
+
+Usage (from services/ai-orchestrator):
+    OPENAI_API_KEY=unused python -m benchmarks.bench_compact_output
+    OPENAI_API_KEY=sk-... python -m benchmarks.bench_compact_output --live --runs 5
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import statistics
+import time
+
+from app.core import openai_client
+from app.core.catalog_registry import catalog_from_exercises
+from app.core.compact_routine import parse_compact_routine
+from app.core.prompt_budget import count_tokens, load_tokenizer
+
+_NOTES = ["Control the eccentric", "Keep elbows tucked", "Brace before each rep", "", "", "Full range of motion"]
+
+
+def _catalog(size: int, rng: random.Random):
+    categories = ["strength", "cardio", "plyometrics"]
+    return catalog_from_exercises([
+        {
+            "rowid": 1000 + i,
+            "name": f"{rng.choice(['Barbell', 'Dumbbell', 'Cable', 'Machine'])} Exercise Variation {i}",
+            "category": rng.choice(categories),
+            "equipment": "barbell",
+            "primaryMuscles": ["chest"],
+        }
+        for i in range(size)
+    ])
+
+
+def _routine_pair(catalog, exercises: int, rng: random.Random) -> tuple[str, str]:
+    """
+    The same routine in each format. The JSON side is written without
+    indentation, which understates what the model usually emits.
+    """
+    rows = []
+    for _ in range(exercises):
+        ex = rng.choice(catalog.exercises)
+        rows.append((ex, rng.randint(2, 5), rng.choice([5, 6, 8, 10, 12]), rng.choice([60, 90, 120, 180]), rng.choice(_NOTES)))
+
+    routine = {
+        "name": "Upper Body Strength",
+        "description": "Compound pressing and pulling, heaviest lifts first.",
+        "exercises": [
+            {
+                "exercise_name": ex["name"],
+                "exercise_library_id": str(ex["rowid"]),
+                "sets_data": [
+                    {"set_index": i, "target_reps": reps, "target_weight_kg": None}
+                    for i in range(1, sets + 1)
+                ],
+                "rest_seconds": rest,
+                "order_index": order,
+                "notes": note,
+            }
+            for order, (ex, sets, reps, rest, note) in enumerate(rows)
+        ],
+    }
+    compact = "\n".join(
+        [routine["name"], routine["description"]]
+        + [f"{ex['rowid']}|{sets}|{reps}|{rest}|{note}" for ex, sets, reps, rest, note in rows]
+    )
+    return json.dumps(routine), compact
+
+
+def _offline(args) -> None:
+    rng = random.Random(args.seed)
+    catalog = _catalog(300, rng)
+    tokenizer = "tiktoken" if load_tokenizer() is not None else "length estimate (tiktoken unavailable)"
+    print(f"tokens counted with: {tokenizer}")
+    print(f"wall time model: {args.ttft_ms:.0f} ms TTFT + tokens / {args.tokens_per_second:.0f} tok/s\n")
+
+    json_tokens, compact_tokens, json_parse, compact_parse = [], [], [], []
+    for _ in range(args.runs):
+        as_json, as_compact = _routine_pair(catalog, args.exercises, rng)
+        json_tokens.append(count_tokens(as_json))
+        compact_tokens.append(count_tokens(as_compact))
+
+        start = time.perf_counter()
+        expected = openai_client._validate_routine_json(json.loads(as_json))
+        json_parse.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        expanded = openai_client._validate_routine_json(parse_compact_routine(as_compact, catalog))
+        compact_parse.append((time.perf_counter() - start) * 1000)
+        assert expanded == expected, "compact expansion differs from the JSON routine"
+
+    def wall_ms(tokens: float) -> float:
+        return args.ttft_ms + tokens / args.tokens_per_second * 1000
+
+    for label, tokens, parse in (("json", json_tokens, json_parse), ("compact", compact_tokens, compact_parse)):
+        mean_tokens = statistics.mean(tokens)
+        print(
+            f"{label:>8}: {mean_tokens:6.0f} completion tokens | "
+            f"~{wall_ms(mean_tokens):6.0f} ms modelled wall time | "
+            f"parse+validate {statistics.mean(parse):.3f} ms"
+        )
+    saved = 1 - statistics.mean(compact_tokens) / statistics.mean(json_tokens)
+    print(f"\ncompact saves {saved:.0%} of completion tokens; expansions matched the JSON routines exactly")
+
+
+async def _live(args) -> None:
+    rng = random.Random(args.seed)
+    catalog = _catalog(300, rng)
+    profile = {"goal": "strength", "experience": "intermediate", "equipment": ["full_gym"]}
+
+    for output_format in ("json", "compact"):
+        messages = openai_client._generate_messages(profile, catalog, None, output_format)
+        tokens, walls, failures = [], [], 0
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            resp = await openai_client.router.create(
+                "generate", openai_client._completion_body("generate", messages)
+            )
+            walls.append((time.perf_counter() - start) * 1000)
+            tokens.append(resp.usage.completion_tokens)
+            try:
+                openai_client._parse_routine(resp.choices[0].message.content.strip(), catalog, output_format)
+            except ValueError:
+                failures += 1
+        print(
+            f"{output_format:>8}: {statistics.mean(tokens):6.0f} completion tokens | "
+            f"mean {statistics.mean(walls):6.0f} ms | p50 {statistics.median(walls):6.0f} ms | "
+            f"invalid {failures}/{args.runs}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--live", action="store_true", help="call the configured OpenAI endpoint")
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--exercises", type=int, default=8, help="exercises per routine (offline)")
+    parser.add_argument("--ttft-ms", type=float, default=400)
+    parser.add_argument("--tokens-per-second", type=float, default=80)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    logging.getLogger("pulse").setLevel(logging.ERROR)
+
+    if args.live:
+        asyncio.run(_live(args))
+    else:
+        _offline(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Benchmark: full vs delta-mode adaptation — tokens and wall time.
+
+Offline (default): for the same current routine and a typical small
+adaptation (one or two swaps, a sets change), compares what the model has
+to write in each mode — the full routine as JSON, the full routine in the
+compact format, or just the delta operations — and the prompt each mode
+sends. Wall time is modelled as time-to-first-token + completion tokens /
+decode rate. Applying, repairing and validating the delta is measured for
+real, and the merged routine is checked against the one the full answer
+describes.
+
+Live (--live): sends the same adapt request to the configured model in
+full JSON and delta mode and reports actual usage and wall time.
+
+Usage (from services/ai-orchestrator):
+    OPENAI_API_KEY=unused python -m benchmarks.bench_delta_adapt
+    OPENAI_API_KEY=sk-... python -m benchmarks.bench_delta_adapt --live --runs 5
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import logging
+import random
+import statistics
+import time
+
+from app.core import openai_client
+from app.core.catalog_registry import catalog_from_exercises
+from app.core.prompt_budget import count_tokens, load_tokenizer
+from benchmarks.fixtures import exercise_catalog, profile, routine_from
+
+_FEEDBACK = "My left knee hurts on squats and lunges. Upper body feels strong, happy to push harder there."
+
+
+def _adaptation(routine: dict, catalog, rng: random.Random) -> tuple[dict, str]:
+    """A small adaptation of routine: the full adapted routine and the same change as delta operations."""
+    adapted = copy.deepcopy(routine)
+    exercises = adapted["exercises"]
+    ops = []
+    in_use = {ex["exercise_library_id"] for ex in exercises}
+    for position in rng.sample(range(1, len(exercises) + 1), rng.choice((1, 2))):
+        new = rng.choice([ex for ex in catalog.exercises if str(ex["rowid"]) not in in_use])
+        in_use.add(str(new["rowid"]))
+        ex = exercises[position - 1]
+        ex["exercise_name"], ex["exercise_library_id"], ex["notes"] = new["name"], str(new["rowid"]), "Easier on the knees"
+        ops.append(f"swap|{position}|{new['rowid']}|Easier on the knees")
+    position = rng.randrange(1, len(exercises) + 1)
+    exercises[position - 1]["sets_data"] = [
+        {"set_index": i, "target_reps": 6, "target_weight_kg": None} for i in range(1, 5)
+    ]
+    ops.append(f"sets|{position}|4|6")
+    return adapted, "\n".join(ops)
+
+
+def _compact(routine: dict) -> str:
+    return "\n".join(
+        [routine["name"], routine["description"]]
+        + [
+            f"{ex['exercise_library_id']}|{len(ex['sets_data'])}|{ex['sets_data'][0]['target_reps']}|"
+            f"{ex['rest_seconds']}|{ex['notes']}"
+            for ex in routine["exercises"]
+        ]
+    )
+
+
+def _offline(args) -> None:
+    rng = random.Random(args.seed)
+    catalog = catalog_from_exercises(exercise_catalog(args.catalog, args.seed))
+    tokenizer = "tiktoken" if load_tokenizer() is not None else "length estimate (tiktoken unavailable)"
+    print(f"tokens counted with: {tokenizer}")
+    print(f"wall time model: {args.ttft_ms:.0f} ms TTFT + tokens / {args.tokens_per_second:.0f} tok/s\n")
+
+    completion = {"json": [], "compact": [], "delta": []}
+    prompt = {"json": [], "compact": [], "delta": []}
+    apply_ms = []
+    for _ in range(args.runs):
+        user_profile = profile(rng)
+        current = routine_from(catalog.exercises, rng, args.exercises)
+        adapted, delta = _adaptation(current, catalog, rng)
+
+        completion["json"].append(count_tokens(json.dumps(adapted)))
+        completion["compact"].append(count_tokens(_compact(adapted)))
+        completion["delta"].append(count_tokens(delta))
+        for mode in prompt:
+            messages = openai_client._adapt_messages(user_profile, current, catalog, _FEEDBACK, None, mode)
+            prompt[mode].append(sum(count_tokens(m["content"]) for m in messages))
+
+        start = time.perf_counter()
+        result, _ = openai_client._parse_delta(delta, current, catalog)
+        apply_ms.append((time.perf_counter() - start) * 1000)
+        expected, _ = openai_client._parse_routine(json.dumps(adapted), catalog, "json")
+        assert result["routine"] == expected, "merged delta differs from the full adapted routine"
+
+    def wall_ms(tokens: float) -> float:
+        return args.ttft_ms + tokens / args.tokens_per_second * 1000
+
+    for mode in ("json", "compact", "delta"):
+        tokens = statistics.mean(completion[mode])
+        print(
+            f"{mode:>8}: {tokens:6.0f} completion tokens | ~{wall_ms(tokens):6.0f} ms modelled wall time | "
+            f"{statistics.mean(prompt[mode]):6.0f} prompt tokens"
+        )
+    print(f"\ndelta apply+repair+validate: {statistics.mean(apply_ms):.3f} ms mean")
+    print(
+        f"delta writes {statistics.mean(completion['json']) / statistics.mean(completion['delta']):.1f}x fewer "
+        f"completion tokens than full JSON ({statistics.mean(completion['compact']) / statistics.mean(completion['delta']):.1f}x "
+        f"fewer than compact); merged routines matched the full answers exactly"
+    )
+
+
+async def _live(args) -> None:
+    rng = random.Random(args.seed)
+    catalog = catalog_from_exercises(exercise_catalog(args.catalog, args.seed))
+    user_profile = profile(rng)
+    current = routine_from(catalog.exercises, rng, args.exercises)
+
+    for mode in ("json", "delta"):
+        messages = openai_client._adapt_messages(user_profile, current, catalog, _FEEDBACK, None, mode)
+        tokens, walls, failures = [], [], 0
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            resp = await openai_client.router.create("adapt", openai_client._completion_body("adapt", messages))
+            walls.append((time.perf_counter() - start) * 1000)
+            tokens.append(resp.usage.completion_tokens)
+            raw = resp.choices[0].message.content.strip()
+            try:
+                if mode == "delta":
+                    openai_client._parse_delta(raw, current, catalog)
+                else:
+                    openai_client._parse_routine(raw, catalog, mode)
+            except ValueError:
+                failures += 1
+        print(
+            f"{mode:>8}: {statistics.mean(tokens):6.0f} completion tokens | "
+            f"mean {statistics.mean(walls):6.0f} ms | p50 {statistics.median(walls):6.0f} ms | "
+            f"invalid {failures}/{args.runs}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--live", action="store_true", help="call the configured OpenAI endpoint")
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--exercises", type=int, default=8, help="exercises in the current routine")
+    parser.add_argument("--catalog", type=int, default=300, help="catalog size")
+    parser.add_argument("--ttft-ms", type=float, default=400)
+    parser.add_argument("--tokens-per-second", type=float, default=80)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    logging.getLogger("pulse").setLevel(logging.ERROR)
+
+    if args.live:
+        asyncio.run(_live(args))
+    else:
+        _offline(args)
+
+
+if __name__ == "__main__":
+    main()
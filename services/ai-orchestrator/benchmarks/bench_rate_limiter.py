@@ -0,0 +1,134 @@
+"""
+Microbenchmark: per-request cost of the rate-limit check.
+
+Compares the previous implementation (one EVAL per window, full Lua source
+sent each time, extra ZRANGE on rejection) against the current single EVALSHA
+multi-window check. Reports Redis round trips and latency per request.
+
+Usage (from services/ai-orchestrator):
+    REDIS_URL=redis://localhost:6379/15 python -m benchmarks.bench_rate_limiter
+    python -m benchmarks.bench_rate_limiter --fake   # fakeredis, no network
+
+Use a scratch Redis database — the benchmark writes ratelimit:bench-* keys.
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+import uuid
+
+import redis.asyncio as redis
+from fastapi import HTTPException
+
+from app.core import rate_limiter
+from app.core import redis_client as redis_module
+from app.core.config import REDIS_URL
+
+# The pre-EVALSHA script and check loop, kept here as the baseline.
+_LEGACY_LUA = """
+local key = KEYS[1]
+local window_start = tonumber(ARGV[1])
+local now = tonumber(ARGV[2])
+local member = ARGV[3]
+local max_count = tonumber(ARGV[4])
+local ttl = tonumber(ARGV[5])
+
+redis.call('ZREMRANGEBYSCORE', key, '-inf', window_start)
+
+local count = redis.call('ZCARD', key)
+
+if count < max_count then
+    redis.call('ZADD', key, now, member)
+    redis.call('EXPIRE', key, ttl)
+    return {count + 1, 1}
+end
+
+return {count, 0}
+"""
+
+
+async def _legacy_check(client: redis.Redis, user_id: str) -> None:
+    now = time.time()
+    member = f"{now}:{uuid.uuid4().hex[:8]}"
+    for window_name, window_seconds, get_limit in rate_limiter._WINDOWS:
+        limit = get_limit()
+        if limit <= 0:
+            continue
+        key = f"ratelimit:{user_id}:{window_name}"
+        result = await client.eval(
+            _LEGACY_LUA, 1, key, str(now - window_seconds), str(now), member,
+            str(limit), str(window_seconds),
+        )
+        if not int(result[1]):
+            await client.zrange(key, 0, 0, withscores=True)
+            raise HTTPException(status_code=429)
+
+
+class _CountingClient:
+    """Counts commands sent through execute_command (one per round trip here)."""
+
+    def __init__(self, client: redis.Redis) -> None:
+        self.calls = 0
+        original = client.execute_command
+
+        async def counted(*args, **kwargs):
+            self.calls += 1
+            return await original(*args, **kwargs)
+
+        client.execute_command = counted
+
+
+async def _run(name: str, check, client: redis.Redis, users: int, requests: int) -> None:
+    counter = _CountingClient(client)
+    latencies, rejected = [], 0
+    await client.delete(*[f"ratelimit:bench-{name}-{u}:{w}" for u in range(users) for w in ("minute", "hour", "day")])
+
+    for i in range(requests):
+        user_id = f"bench-{name}-{i % users}"
+        start = time.perf_counter()
+        try:
+            await check(user_id)
+        except HTTPException:
+            rejected += 1
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    latencies.sort()
+    print(
+        f"{name:>8}: {counter.calls / requests:.2f} round trips/req | "
+        f"mean {statistics.mean(latencies):.3f} ms | "
+        f"p50 {latencies[len(latencies) // 2]:.3f} ms | "
+        f"p99 {latencies[int(len(latencies) * 0.99) - 1]:.3f} ms | "
+        f"rejected {rejected}/{requests}"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fake", action="store_true", help="use fakeredis instead of REDIS_URL")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+    logging.getLogger("pulse").setLevel(logging.ERROR)  # rejections log a warning each
+
+    if args.fake:
+        import fakeredis
+        legacy_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        current_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    else:
+        legacy_client = redis.from_url(REDIS_URL, decode_responses=True)
+        current_client = redis.from_url(REDIS_URL, decode_responses=True)
+
+    redis_module._pool = current_client
+    await rate_limiter.load_rate_limit_script()
+
+    await _run("legacy", lambda u: _legacy_check(legacy_client, u), legacy_client, args.users, args.requests)
+    await _run("evalsha", rate_limiter._check_rate_limit, current_client, args.users, args.requests)
+
+    await legacy_client.aclose()
+    await current_client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,55 @@
+"""
+Benchmark: rule-based routine generation latency.
+
+Builds routines with rule_engine.build_routine for random profiles over
+catalogs of several sizes and checks each one passes _validate_routine_json.
+The first routine for a catalog also builds its ranking features (cached on
+the catalog afterwards), so cold and warm times are reported separately.
+
+Usage (from services/ai-orchestrator):
+    OPENAI_API_KEY=unused python -m benchmarks.bench_rule_engine
+"""
+
+import argparse
+import logging
+import random
+import statistics
+import time
+
+from app.core.catalog_registry import catalog_from_exercises
+from app.core.openai_client import _validate_routine_json
+from app.core.rule_engine import build_routine
+from benchmarks.fixtures import exercise_catalog, profile
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000], help="catalog sizes")
+    parser.add_argument("--runs", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    logging.getLogger("pulse").setLevel(logging.ERROR)
+
+    rng = random.Random(args.seed)
+    for size in args.sizes:
+        catalog = catalog_from_exercises(exercise_catalog(size, args.seed))
+        start = time.perf_counter()
+        _validate_routine_json(build_routine(profile(rng), catalog))
+        cold = (time.perf_counter() - start) * 1000
+
+        times = []
+        for _ in range(args.runs):
+            user_profile = profile(rng)
+            start = time.perf_counter()
+            routine = build_routine(user_profile, catalog)
+            times.append((time.perf_counter() - start) * 1000)
+            _validate_routine_json(routine)
+        times.sort()
+        print(
+            f"{size:>6} exercises: cold {cold:7.2f} ms | warm p50 {statistics.median(times):.3f} ms "
+            f"p99 {times[int(len(times) * 0.99) - 1]:.3f} ms | {args.runs} routines valid"
+        )
+
+
+if __name__ == "__main__":
+    main()
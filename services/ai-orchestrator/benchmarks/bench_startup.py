@@ -0,0 +1,107 @@
+"""
+Benchmark: API cold start per serving mode, and what the imports cost.
+
+1. Imports: `python -X importtime -c "import app.main"` in fresh
+   interpreters, reporting the cumulative time of the heaviest packages and
+   of the app as a whole (median of --runs).
+2. Time to ready: each serving mode (fixtures.SERVING_MODES) is started
+   --runs times and timed from exec until every worker has logged
+   "Application startup complete":
+   - uvicorn: one process, as start.sh with WEB_CONCURRENCY=1,
+   - uvicorn-workers: uvicorn's supervisor spawning --workers interpreters,
+     each importing the app on its own,
+   - gunicorn: start.sh's default; the app is imported and warmed once in
+     the master and the workers are forked from it.
+3. Worker replacement: a worker is sent SIGTERM, as a recycled worker exits,
+   and timed until its replacement is serving (multi-process modes only).
+
+Redis is an unreachable address by default, so startup includes failing to
+connect, as a cold deploy without Redis would; pass --redis-url to warm
+catalogs from a real one.
+
+Usage (from services/ai-orchestrator):
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --workers 4 --runs 5 --redis-url redis://localhost:6379/15
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.fixtures import SERVING_MODES, STARTUP_COMPLETE, serve
+
+_PACKAGES = ["fastapi", "openai", "redis", "numpy", "tiktoken", "prometheus_client", "app.main"]
+_IMPORT_LINE = re.compile(r"import time:\s+\d+\s+\|\s+(\d+)\s+\|\s*(\S+)")
+
+
+def _import_times(runs: int) -> dict[str, float]:
+    """Median cumulative import time in ms of each top-level package."""
+    samples: dict[str, list[float]] = {name: [] for name in _PACKAGES}
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import app.main"],
+            capture_output=True, text=True, check=True, env={**os.environ, "PYTHONPATH": "."},
+        )
+        seen = set()
+        for line in result.stderr.splitlines():
+            match = _IMPORT_LINE.match(line)
+            # The first (outermost) import of a package carries its whole cost
+            if match and match.group(2) in samples and match.group(2) not in seen:
+                seen.add(match.group(2))
+                samples[match.group(2)].append(int(match.group(1)) / 1000)
+    return {name: statistics.median(times) for name, times in samples.items() if times}
+
+
+async def _start(mode: str, args, env: dict[str, str], port: int) -> tuple[float, float | None]:
+    """Seconds to ready, and to replace one worker (None for a single process)."""
+    async with serve(mode, args.workers, port, env) as served:
+        ready = await served.wait_for(STARTUP_COMPLETE, served.workers) - served.started
+        if served.workers == 1:
+            return ready, None
+        victim = served.worker_pids()[0]
+        os.kill(victim, signal.SIGTERM)
+        killed = time.perf_counter()
+        return ready, await served.wait_for(STARTUP_COMPLETE, served.workers + 1) - killed
+
+
+async def _run(args) -> None:
+    print(f"imports (median of {args.runs}, cumulative ms):")
+    for name, ms in _import_times(args.runs).items():
+        print(f"  {name:<18} {ms:7.0f}")
+
+    env = {
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "unused"),
+        "REDIS_URL": args.redis_url or "redis://127.0.0.1:1/0",
+    }
+    print(f"\nstartup ({args.workers} workers where applicable, median of {args.runs}):")
+    for mode in args.modes:
+        ready, replaced = [], []
+        for _ in range(args.runs):
+            r, w = await _start(mode, args, env, args.port)
+            ready.append(r)
+            if w is not None:
+                replaced.append(w)
+        line = f"  {mode:<16} ready {statistics.median(ready):6.2f}s"
+        if replaced:
+            line += f" | worker replaced in {statistics.median(replaced):6.2f}s"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=max(2, os.cpu_count() or 1))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--modes", nargs="+", choices=SERVING_MODES, default=list(SERVING_MODES))
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--redis-url", help="Redis to warm catalogs from (default: none reachable)")
+    asyncio.run(_run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
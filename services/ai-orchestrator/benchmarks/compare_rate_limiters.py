@@ -0,0 +1,118 @@
+"""
+Harness: compare the "counter" rate-limit backend against the exact "zset" one.
+
+Replays the same synthetic trace (bursty per-user traffic over a simulated
+clock) through both backends and reports how often their admit/reject
+decisions agree, plus the Redis memory each one holds at the end.
+
+Usage (from services/ai-orchestrator):
+    REDIS_URL=redis://localhost:6379/15 python -m benchmarks.compare_rate_limiters
+    python -m benchmarks.compare_rate_limiters --fake   # fakeredis, no network
+
+With --fake, MEMORY USAGE is unavailable, so stored members/fields are
+reported instead. Use a scratch Redis database — keys are flushed per run.
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+
+import redis.asyncio as redis
+from fastapi import HTTPException
+from redis.exceptions import ResponseError
+
+from app.core import rate_limiter
+from app.core import redis_client as redis_module
+from app.core.config import REDIS_URL
+
+
+def _trace(users: int, hours: float, seed: int) -> list[tuple[float, str]]:
+    """Return (timestamp, user_id) events: steady traffic plus occasional bursts."""
+    rng = random.Random(seed)
+    start = 1_700_000_000.0
+    events = []
+    for u in range(users):
+        user_id = f"cmp-{u}"
+        t = start + rng.uniform(0, 300)
+        while t < start + hours * 3600:
+            events.append((t, user_id))
+            if rng.random() < 0.1:
+                # Burst: a handful of taps/retries within a few seconds
+                for _ in range(rng.randint(2, 8)):
+                    t += rng.uniform(0.2, 3)
+                    events.append((t, user_id))
+            t += rng.expovariate(1 / rng.choice([20, 60, 240]))
+    events.sort()
+    return events
+
+
+async def _decide(backend: str, user_id: str, now: float) -> bool:
+    try:
+        await rate_limiter._check_rate_limit(user_id, backend=backend, now=now)
+        return True
+    except HTTPException:
+        return False
+
+
+async def _memory(client: redis.Redis, pattern: str) -> str:
+    keys = [k async for k in client.scan_iter(match=pattern)]
+    try:
+        total = 0
+        for key in keys:
+            total += await client.memory_usage(key) or 0
+        return f"{total / 1024:.1f} KiB across {len(keys)} keys"
+    except ResponseError:
+        entries = 0
+        for key in keys:
+            kind = await client.type(key)
+            entries += await (client.zcard(key) if kind == "zset" else client.hlen(key))
+        return f"{entries} stored members/fields across {len(keys)} keys"
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fake", action="store_true", help="use fakeredis instead of REDIS_URL")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--hours", type=float, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    logging.getLogger("pulse").setLevel(logging.ERROR)
+
+    if args.fake:
+        import fakeredis
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    else:
+        client = redis.from_url(REDIS_URL, decode_responses=True)
+    redis_module._pool = client
+    for pattern in ("ratelimit:cmp-*", "ratelimitc:cmp-*"):
+        keys = [k async for k in client.scan_iter(match=pattern)]
+        if keys:
+            await client.delete(*keys)
+
+    events = _trace(args.users, args.hours, args.seed)
+    agree = false_admit = false_reject = 0
+    admitted = {"zset": 0, "counter": 0}
+    for now, user_id in events:
+        exact = await _decide("zset", user_id, now)
+        approx = await _decide("counter", user_id, now)
+        admitted["zset"] += exact
+        admitted["counter"] += approx
+        if exact == approx:
+            agree += 1
+        elif approx:
+            false_admit += 1
+        else:
+            false_reject += 1
+
+    n = len(events)
+    print(f"events: {n} from {args.users} users over {args.hours}h")
+    print(f"admitted: zset {admitted['zset']} | counter {admitted['counter']}")
+    print(f"agreement: {agree / n:.2%} | counter admitted extra: {false_admit} | counter rejected extra: {false_reject}")
+    print(f"zset memory:    {await _memory(client, 'ratelimit:cmp-*')}")
+    print(f"counter memory: {await _memory(client, 'ratelimitc:cmp-*')}")
+    await client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+"""
+Throughput of the serving modes: one uvicorn process vs several workers.
+
+Each mode (fixtures.SERVING_MODES) is started as a real server pointed at
+load_test's fake upstream, then `python -m benchmarks.load_test --target`
+replays the same request mix against it (any arguments after `--` are
+passed on). The modes share one Redis, as replicas do in production: a
+fakeredis TCP server in this process by default, or --redis-url (use a
+scratch database — keys are written, never flushed).
+
+Reports ok throughput and latency percentiles per mode, relative to the
+first one. The orchestrator is CPU-bound on body parsing and prompt
+building while the upstream is slow only in wall time, so with
+`--ttft-ms 0 --tokens-per-second 0` the gain from more workers approaches
+the number of cores the server gets; load_test itself and fakeredis also
+need CPU, so leave some free or use --redis-url.
+
+Usage (from services/ai-orchestrator):
+    python -m benchmarks.compare_serving
+    python -m benchmarks.compare_serving --workers 4 --modes uvicorn gunicorn -- \\
+        --requests 3000 --concurrency 128 --ttft-ms 0 --tokens-per-second 0
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+
+from benchmarks.fixtures import SERVING_MODES, STARTUP_COMPLETE, serve
+
+
+async def _measure(mode: str, args, env: dict[str, str], extra: list[str]) -> dict:
+    async with serve(mode, args.workers, args.port, env) as served:
+        await served.wait_for(STARTUP_COMPLETE, served.workers)
+        with tempfile.NamedTemporaryFile(suffix=".json") as results:
+            load = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", "benchmarks.load_test",
+                "--target", f"http://127.0.0.1:{args.port}", "--upstream-port", str(args.upstream_port),
+                "--save", results.name, *extra,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+            )
+            output, _ = await load.communicate()
+            if load.returncode != 0:
+                raise RuntimeError(f"load_test failed against {mode}:\n{output.decode(errors='replace')}")
+            with open(results.name) as f:
+                summary = json.load(f)
+        summary["workers"] = served.workers
+        return summary
+
+
+async def _run(args, extra: list[str]) -> None:
+    server = None
+    redis_url = args.redis_url
+    if not redis_url:
+        import fakeredis
+        server = fakeredis.TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = server.server_address
+        redis_url = f"redis://{host}:{port}/0"
+
+    env = {
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.upstream_port}/v1",
+        "OPENAI_API_KEY": "unused",
+        "REDIS_URL": redis_url,
+    }
+    # High enough that no request is rejected, so every one runs the full check
+    for name in ("RATE_LIMIT_PER_MINUTE", "RATE_LIMIT_PER_HOUR", "RATE_LIMIT_PER_DAY"):
+        env[name] = os.getenv(name, "1000000")
+
+    print(f"{'mode':<18}{'workers':>8}{'ok req/s':>10}{'vs first':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    first = None
+    try:
+        for mode in args.modes:
+            summary = await _measure(mode, args, env, extra)
+            first = first or summary["okThroughput"]
+            total = summary["endpoints"]["all"]
+            failed = total["requests"] - total["ok"]
+            print(
+                f"{mode:<18}{summary['workers']:>8}{summary['okThroughput']:>10.1f}"
+                f"{summary['okThroughput'] / first:>9.2f}x{total['p50']:>9.0f}{total['p95']:>9.0f}"
+                f"{total['p99']:>9.0f}{failed:>8}"
+            )
+    finally:
+        if server is not None:
+            server.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        usage="%(prog)s [options] [-- load_test options]",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="for the multi-process modes")
+    parser.add_argument("--modes", nargs="+", choices=SERVING_MODES, default=["uvicorn", "gunicorn"])
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--upstream-port", type=int, default=8089)
+    parser.add_argument("--redis-url", help="shared Redis (default: fakeredis TCP server)")
+    argv = sys.argv[1:]
+    split = argv.index("--") if "--" in argv else len(argv)
+    args = parser.parse_args(argv[:split])
+    asyncio.run(_run(args, argv[split + 1:]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,432 @@
+"""
+Fake OpenAI-compatible server for offline benchmarks and load tests.
+
+Serves POST /v1/chat/completions (plain and streaming, with the final usage
+chunk when stream_options.include_usage is set) over real HTTP, so the
+orchestrator's OpenAI SDK client, connection pool and retries are exercised
+exactly as in production. Answers are valid for the orchestrator:
+
+- routine prompts (an AVAILABLE EXERCISES list) get a routine built from the
+  listed exercises, in the compact line format when the system prompt asks
+  for it and JSON otherwise
+- delta-mode adapt prompts get a swap and a sets change for the current
+  routine's rows
+- anything else gets --text-tokens of plain text
+
+Timing: time to first token is drawn from a log-normal distribution
+(--ttft-ms median, --ttft-sigma spread), then tokens arrive at
+--tokens-per-second (0 = all at once). Streams deliver the content in
+chunks at that rate.
+
+Failure injection: --throttle-rate answers that fraction of calls with 429,
+--rps-limit answers 429 once more calls than that started within a second
+(like a real per-key limit), --error-rate answers 500. Throttled calls carry
+retry-after-ms (--retry-after-ms).
+
+Batch API: POST /v1/files stores an uploaded JSONL file and POST
+/v1/batches runs the chat.completions requests in it in the background,
+after one time-to-first-token delay, with the same answers and --error-rate
+as live calls. GET /v1/batches/{id} reports its status and, once completed,
+the output and error file ids, read back with GET /v1/files/{id}/content.
+Unknown ids are 404s, as upstream.
+
+GET /stats returns call, stream, 429/500 and token counts plus peak
+concurrency; POST /stats/reset zeroes them.
+
+Usage (from services/ai-orchestrator):
+    python -m benchmarks.fake_openai --port 8089 --ttft-ms 400 --tokens-per-second 150
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=unused uvicorn app.main:app --port 8001
+"""
+
+import argparse
+import asyncio
+import email.parser
+import itertools
+import json
+import math
+import random
+import re
+import time
+from collections import deque
+from dataclasses import dataclass, fields
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+# '- "Name" (id: 12, ...' as rendered by catalog_registry
+_CATALOG_LINE = re.compile(r'^- "(.+?)" \(id: (\d+),', re.MULTILINE)
+_COMPACT_MARKER = "compact line format"
+_DELTA_MARKER = "Return ONLY the changes"
+# Current routine rows in a delta-mode prompt: position|id|name|...
+_ROUTINE_ROW = re.compile(r"^(\d+)\|\d*\|", re.MULTILINE)
+_CHARS_PER_TOKEN = 4
+_STREAM_TICK_SECONDS = 0.02
+_WORDS = "keep the core braced and drive through the heels while controlling the lowering phase".split()
+
+
+@dataclass
+class UpstreamProfile:
+    ttft_ms: float = 400.0
+    ttft_sigma: float = 0.5
+    tokens_per_second: float = 150.0
+    text_tokens: int = 250
+    routine_exercises: int = 6
+    throttle_rate: float = 0.0
+    rps_limit: float = 0.0
+    error_rate: float = 0.0
+    retry_after_ms: int = 200
+    seed: int = 7
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the UpstreamProfile options to parser (shared with load_test)."""
+    group = parser.add_argument_group("fake upstream")
+    group.add_argument("--ttft-ms", type=float, default=400.0, help="median time to first token")
+    group.add_argument("--ttft-sigma", type=float, default=0.5, help="log-normal spread of time to first token")
+    group.add_argument("--tokens-per-second", type=float, default=150.0, help="output token rate (0 = instant)")
+    group.add_argument("--text-tokens", type=int, default=250, help="length of non-routine answers")
+    group.add_argument("--routine-exercises", type=int, default=6)
+    group.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of calls answered with 429")
+    group.add_argument("--rps-limit", type=float, default=0.0, help="429 above this many calls/s (0 = off)")
+    group.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with 500")
+    group.add_argument("--retry-after-ms", type=int, default=200)
+    group.add_argument("--seed", type=int, default=7)
+
+
+def profile_from_args(args: argparse.Namespace) -> UpstreamProfile:
+    return UpstreamProfile(**{f.name: getattr(args, f.name) for f in fields(UpstreamProfile)})
+
+
+def profile_argv(profile: UpstreamProfile) -> list[str]:
+    """Command-line flags reproducing profile, for starting the server in a subprocess."""
+    argv = []
+    for f in fields(UpstreamProfile):
+        argv += [f"--{f.name.replace('_', '-')}", str(getattr(profile, f.name))]
+    return argv
+
+
+class FakeOpenAI:
+    def __init__(self, profile: UpstreamProfile) -> None:
+        self.profile = profile
+        self.rng = random.Random(profile.seed)
+        self._ids = itertools.count(1)
+        self._starts: deque[float] = deque()
+        self.files: dict[str, bytes] = {}
+        self.batches: dict[str, dict] = {}
+        self._batch_tasks: set[asyncio.Task] = set()
+        self.reset()
+
+    def reset(self) -> None:
+        self.stats = {
+            "calls": 0,
+            "streamed": 0,
+            "throttled": 0,
+            "errors": 0,
+            "promptTokens": 0,
+            "completionTokens": 0,
+            "active": 0,
+            "peakActive": 0,
+            "batches": 0,
+            "models": {},
+        }
+
+    # --- content ---
+
+    def _routine(self, listed: list[tuple[str, str]], compact: bool) -> str:
+        picked = self.rng.sample(listed, min(self.profile.routine_exercises, len(listed)))
+        if compact:
+            rows = [f"{rowid}|3|{self.rng.choice((5, 8, 10, 12))}|90|" for _, rowid in picked]
+            return "\n".join(["Benchmark Routine", "Full-body strength session.", *rows])
+        return json.dumps({
+            "name": "Benchmark Routine",
+            "description": "Full-body strength session.",
+            "exercises": [
+                {
+                    "exercise_name": name,
+                    "exercise_library_id": rowid,
+                    "sets_data": [
+                        {"set_index": s, "target_reps": self.rng.choice((5, 8, 10, 12)), "target_weight_kg": None}
+                        for s in range(1, 4)
+                    ],
+                    "rest_seconds": 90,
+                    "order_index": i,
+                    "notes": "",
+                }
+                for i, (name, rowid) in enumerate(picked)
+            ],
+        })
+
+    def _delta(self, listed: list[tuple[str, str]], positions: list[str]) -> str:
+        if not positions:
+            return "none"
+        _, rowid = self.rng.choice(listed)
+        return f"swap|{self.rng.choice(positions)}|{rowid}|Easier on the joints\nsets|{positions[0]}|4|6"
+
+    def _content(self, messages: list[dict]) -> str:
+        text = "\n".join(str(m.get("content") or "") for m in messages)
+        listed = _CATALOG_LINE.findall(text)
+        if listed and _DELTA_MARKER in str(messages[0].get("content")):
+            return self._delta(listed, _ROUTINE_ROW.findall(text))
+        if listed:
+            return self._routine(listed, _COMPACT_MARKER in str(messages[0].get("content")))
+        words = max(1, self.profile.text_tokens * _CHARS_PER_TOKEN // 6)
+        return " ".join(self.rng.choice(_WORDS) for _ in range(words)).capitalize() + "."
+
+    # --- timing and failures ---
+
+    def _ttft(self) -> float:
+        if self.profile.ttft_ms <= 0:
+            return 0.0
+        return self.profile.ttft_ms / 1000 * math.exp(self.rng.gauss(0, self.profile.ttft_sigma))
+
+    def _failure(self) -> JSONResponse | None:
+        now = time.monotonic()
+        while self._starts and self._starts[0] < now - 1:
+            self._starts.popleft()
+        limited = self.profile.rps_limit > 0 and len(self._starts) >= self.profile.rps_limit
+        if limited or self.rng.random() < self.profile.throttle_rate:
+            self.stats["throttled"] += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status_code=429,
+                headers={"retry-after-ms": str(self.profile.retry_after_ms)},
+            )
+        if self.rng.random() < self.profile.error_rate:
+            self.stats["errors"] += 1
+            return JSONResponse({"error": {"message": "Injected failure", "type": "server_error"}}, status_code=500)
+        self._starts.append(now)
+        return None
+
+    # --- handlers ---
+
+    def _call(self, body: dict) -> None:
+        self.stats["calls"] += 1
+        model = body.get("model", "")
+        self.stats["models"][model] = self.stats["models"].get(model, 0) + 1
+
+    def _answer(self, body: dict) -> tuple[dict, str, dict]:
+        """Response fields shared by every chunk, content and usage for a call."""
+        model = body.get("model", "")
+        content = self._content(body.get("messages", []))
+        prompt_tokens = sum(len(str(m.get("content") or "")) for m in body.get("messages", [])) // _CHARS_PER_TOKEN
+        completion_tokens = max(1, len(content) // _CHARS_PER_TOKEN)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+        base = {"id": f"chatcmpl-fake-{next(self._ids)}", "created": int(time.time()), "model": model}
+        return base, content, usage
+
+    @staticmethod
+    def _completion(base: dict, content: str, usage: dict) -> dict:
+        return {
+            **base,
+            "object": "chat.completion",
+            "choices": [
+                {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+            ],
+            "usage": usage,
+        }
+
+    async def completions(self, request: Request):
+        body = await request.json()
+        self._call(body)
+        failure = self._failure()
+        if failure is not None:
+            return failure
+
+        base, content, usage = self._answer(body)
+
+        if body.get("stream"):
+            self.stats["streamed"] += 1
+            include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+            return StreamingResponse(
+                self._stream(base, content, usage if include_usage else None),
+                media_type="text/event-stream",
+            )
+
+        self._enter()
+        try:
+            await asyncio.sleep(self._ttft() + self._generation_seconds(usage["completion_tokens"]))
+        finally:
+            self._exit()
+        self._count(usage)
+        return JSONResponse(self._completion(base, content, usage))
+
+    async def _stream(self, base: dict, content: str, usage: dict | None):
+        def chunk(delta: dict, finish_reason: str | None = None) -> str:
+            choice = {"index": 0, "delta": delta, "finish_reason": finish_reason}
+            return f"data: {json.dumps({**base, 'object': 'chat.completion.chunk', 'choices': [choice]})}\n\n"
+
+        self._enter()
+        try:
+            await asyncio.sleep(self._ttft())
+            yield chunk({"role": "assistant", "content": ""})
+            rate = self.profile.tokens_per_second
+            step = len(content) if rate <= 0 else max(1, int(rate * _STREAM_TICK_SECONDS * _CHARS_PER_TOKEN))
+            for i in range(0, len(content), step):
+                yield chunk({"content": content[i:i + step]})
+                if rate > 0:
+                    await asyncio.sleep(_STREAM_TICK_SECONDS)
+            yield chunk({}, "stop")
+            if usage is not None:
+                yield f"data: {json.dumps({**base, 'object': 'chat.completion.chunk', 'choices': [], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+            self._count(usage)
+        finally:
+            self._exit()
+
+    def _generation_seconds(self, tokens: int) -> float:
+        rate = self.profile.tokens_per_second
+        return tokens / rate if rate > 0 else 0.0
+
+    def _enter(self) -> None:
+        self.stats["active"] += 1
+        self.stats["peakActive"] = max(self.stats["peakActive"], self.stats["active"])
+
+    def _exit(self) -> None:
+        self.stats["active"] -= 1
+
+    def _count(self, usage: dict | None) -> None:
+        if usage is not None:
+            self.stats["promptTokens"] += usage["prompt_tokens"]
+            self.stats["completionTokens"] += usage["completion_tokens"]
+
+    # --- Batch API ---
+
+    @staticmethod
+    def _not_found(kind: str, object_id: str) -> JSONResponse:
+        return JSONResponse(
+            {"error": {"message": f"No such {kind}: {object_id}", "type": "invalid_request_error"}}, status_code=404
+        )
+
+    def _store_file(self, content: bytes, filename: str, purpose: str) -> dict:
+        file_id = f"file-fake-{next(self._ids)}"
+        self.files[file_id] = content
+        return {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        }
+
+    async def upload_file(self, request: Request):
+        # multipart/form-data is a MIME message; no form-parsing dependency needed
+        header = f"Content-Type: {request.headers['content-type']}\r\n\r\n".encode()
+        message = email.parser.BytesParser().parsebytes(header + await request.body())
+        parts = {part.get_param("name", header="content-disposition"): part for part in message.get_payload()}
+        upload = parts["file"]
+        return JSONResponse(self._store_file(
+            upload.get_payload(decode=True),
+            upload.get_filename() or "upload.jsonl",
+            parts["purpose"].get_payload(decode=True).decode() if "purpose" in parts else "batch",
+        ))
+
+    async def file_content(self, request: Request):
+        file_id = request.path_params["file_id"]
+        if file_id not in self.files:
+            return self._not_found("file", file_id)
+        return Response(self.files[file_id], media_type="application/octet-stream")
+
+    async def create_batch(self, request: Request):
+        body = await request.json()
+        if body.get("input_file_id") not in self.files:
+            return self._not_found("file", str(body.get("input_file_id")))
+        batch = {
+            "id": f"batch_fake-{next(self._ids)}",
+            "object": "batch",
+            "endpoint": body.get("endpoint", "/v1/chat/completions"),
+            "input_file_id": body["input_file_id"],
+            "completion_window": body.get("completion_window", "24h"),
+            "status": "validating",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        self.batches[batch["id"]] = batch
+        self.stats["batches"] += 1
+        task = asyncio.create_task(self._run_batch(batch))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+        return JSONResponse(batch)
+
+    async def _run_batch(self, batch: dict) -> None:
+        requests = [json.loads(line) for line in self.files[batch["input_file_id"]].splitlines() if line.strip()]
+        batch["status"] = "in_progress"
+        batch["request_counts"]["total"] = len(requests)
+        await asyncio.sleep(self._ttft())
+
+        output, errors = [], []
+        for request in requests:
+            line = {"id": f"batch_req_fake-{next(self._ids)}", "custom_id": request["custom_id"], "error": None}
+            self._call(request["body"])
+            if self.rng.random() < self.profile.error_rate:
+                self.stats["errors"] += 1
+                line["response"] = {
+                    "status_code": 500,
+                    "body": {"error": {"message": "Injected failure", "type": "server_error"}},
+                }
+                errors.append(line)
+                continue
+            base, content, usage = self._answer(request["body"])
+            self._count(usage)
+            line["response"] = {"status_code": 200, "body": self._completion(base, content, usage)}
+            output.append(line)
+
+        def jsonl(lines: list[dict]) -> bytes:
+            return "".join(json.dumps(line) + "\n" for line in lines).encode()
+
+        if output:
+            batch["output_file_id"] = self._store_file(jsonl(output), "batch_output.jsonl", "batch_output")["id"]
+        if errors:
+            batch["error_file_id"] = self._store_file(jsonl(errors), "batch_errors.jsonl", "batch_output")["id"]
+        batch["request_counts"].update(completed=len(output), failed=len(errors))
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+
+    async def get_batch(self, request: Request):
+        batch_id = request.path_params["batch_id"]
+        if batch_id not in self.batches:
+            return self._not_found("batch", batch_id)
+        return JSONResponse(self.batches[batch_id])
+
+    async def get_stats(self, request: Request):
+        return JSONResponse(self.stats)
+
+    async def reset_stats(self, request: Request):
+        self.reset()
+        return JSONResponse(self.stats)
+
+    @property
+    def app(self) -> Starlette:
+        return Starlette(routes=[
+            Route("/v1/chat/completions", self.completions, methods=["POST"]),
+            Route("/v1/files", self.upload_file, methods=["POST"]),
+            Route("/v1/files/{file_id}/content", self.file_content, methods=["GET"]),
+            Route("/v1/batches", self.create_batch, methods=["POST"]),
+            Route("/v1/batches/{batch_id}", self.get_batch, methods=["GET"]),
+            Route("/stats", self.get_stats, methods=["GET"]),
+            Route("/stats/reset", self.reset_stats, methods=["POST"]),
+        ])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(FakeOpenAI(profile_from_args(args)).app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
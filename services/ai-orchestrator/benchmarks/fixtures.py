@@ -0,0 +1,230 @@
+"""
+Shared benchmark fixtures: realistic request bodies and a local Redis.
+
+- exercise_catalog / workout_history / generate_body build the large inline
+  catalogs and histories the web app sends.
+- routine_from builds a valid routine over a catalog, for adapt and explain
+  bodies.
+- redis_fixture installs fakeredis (or a scratch Redis at a URL) as the
+  app's Redis pool and preloads the rate-limit script, so the rate limiter,
+  response cache and single-flight run their real code paths with no network.
+- serve runs the API as a subprocess in one of the production serving modes
+  (SERVING_MODES) and tracks its log lines, for startup and throughput
+  comparisons across modes.
+
+fakeredis and the other benchmark dependencies are in requirements-dev.txt.
+"""
+
+import asyncio
+import os
+import random
+import re
+import signal
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import redis.asyncio as redis
+
+from app.core import rate_limiter
+from app.core import redis_client as redis_module
+
+_MUSCLES = ["chest", "triceps", "shoulders", "lats", "biceps", "quadriceps", "hamstrings", "glutes", "calves", "abdominals"]
+_EQUIPMENT = ["barbell", "dumbbell", "cable", "machine", "body only", "kettlebells"]
+_GOALS = ["strength", "hypertrophy", "fat_loss", "endurance", "general"]
+
+
+def exercise_catalog(exercises: int, seed: int = 7) -> list[dict]:
+    rng = random.Random(seed)
+    return [
+        {
+            "rowid": i,
+            "name": f"Exercise {i}",
+            "category": rng.choice(["strength", "cardio", "plyometrics", "stretching"]),
+            "equipment": rng.choice(_EQUIPMENT),
+            "level": rng.choice(["beginner", "intermediate", "expert"]),
+            "mechanic": rng.choice(["compound", "isolation"]),
+            "force": rng.choice(["push", "pull", "static"]),
+            "primaryMuscles": rng.sample(_MUSCLES, 2),
+            "secondaryMuscles": rng.sample(_MUSCLES, 1),
+            "instructions": [f"Step {n}: keep a neutral spine and control the tempo." for n in range(4)],
+        }
+        for i in range(exercises)
+    ]
+
+
+def workout_history(exercises: int, sessions: int, rng: random.Random) -> list[dict]:
+    return [
+        {
+            "date": f"2024-01-{day % 28 + 1:02d}",
+            "duration_minutes": 60,
+            "exercises": [
+                {
+                    "name": f"Exercise {rng.randrange(exercises)}",
+                    "sets": [{"weight_kg": 60 + 2.5 * s, "reps": 8, "rpe": 8} for s in range(4)],
+                }
+                for _ in range(6)
+            ],
+        }
+        for day in range(sessions)
+    ]
+
+
+def profile(rng: random.Random) -> dict:
+    return {
+        "goal": rng.choice(_GOALS),
+        "experience": rng.choice(["beginner", "intermediate", "advanced"]),
+        "equipment": ["full_gym"],
+        "days_per_week": rng.randint(2, 6),
+    }
+
+
+def generate_body(exercises: int, sessions: int, seed: int) -> dict:
+    """A /routine/generate body with an inline catalog and history."""
+    rng = random.Random(seed)
+    return {
+        "userId": "bench-user",
+        "profile": {"goal": "strength", "experience": "intermediate", "equipment": ["full_gym"]},
+        "history": workout_history(exercises, sessions, rng),
+        "available_exercises": exercise_catalog(exercises, seed),
+    }
+
+
+def routine_from(catalog: list[dict], rng: random.Random, count: int = 6) -> dict:
+    """A routine in the shape the generate endpoint returns, over catalog exercises."""
+    picked = rng.sample(catalog, min(count, len(catalog)))
+    return {
+        "name": "Benchmark Routine",
+        "description": "Full-body strength session.",
+        "exercises": [
+            {
+                "exercise_name": ex["name"],
+                "exercise_library_id": str(ex["rowid"]),
+                "sets_data": [{"set_index": s, "target_reps": 8, "target_weight_kg": None} for s in range(1, 4)],
+                "rest_seconds": 90,
+                "order_index": i,
+                "notes": "",
+            }
+            for i, ex in enumerate(picked)
+        ],
+    }
+
+
+@asynccontextmanager
+async def redis_fixture(url: str | None = None) -> AsyncIterator[redis.Redis]:
+    """
+    Install a Redis client as the app's pool for the duration of the block:
+    fakeredis by default, or the Redis at url (use a scratch database — keys
+    are written, never flushed). The rate-limit script is preloaded as in
+    the app's lifespan.
+    """
+    if url:
+        client = redis.from_url(url, decode_responses=True)
+    else:
+        import fakeredis
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    previous = redis_module._pool
+    redis_module._pool = client
+    try:
+        await rate_limiter.load_rate_limit_script()
+        yield client
+    finally:
+        redis_module._pool = previous
+        await client.aclose()
+
+
+# "uvicorn" is start.sh with WEB_CONCURRENCY=1; "uvicorn-workers" is uvicorn's
+# own supervisor (each worker a freshly spawned interpreter importing the
+# app); "gunicorn" is start.sh's default (app preloaded, workers forked).
+SERVING_MODES = ("uvicorn", "uvicorn-workers", "gunicorn")
+
+STARTUP_COMPLETE = "Application startup complete"
+_STARTED = re.compile(r"Started server process \[(\d+)\]")
+
+
+class ServedApp:
+    """An API subprocess started by serve(), with its log lines as they arrive."""
+
+    def __init__(self, process: asyncio.subprocess.Process, workers: int, started: float) -> None:
+        self.process = process
+        self.workers = workers
+        self.started = started
+        self.lines: list[tuple[float, str]] = []
+        self._changed = asyncio.Event()
+        # Drained continuously, or a chatty server would block on a full pipe
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self) -> None:
+        async for raw in self.process.stdout:
+            self.lines.append((time.perf_counter(), raw.decode(errors="replace").rstrip()))
+            self._changed.set()
+
+    def worker_pids(self) -> list[int]:
+        """Pids of the serving processes started so far, in start order."""
+        return [int(m.group(1)) for _, line in self.lines if (m := _STARTED.search(line))]
+
+    async def wait_for(self, text: str, count: int = 1, timeout: float = 60) -> float:
+        """Wait until text has been logged count times; returns when the last one was (perf_counter)."""
+        deadline = time.perf_counter() + timeout
+        while True:
+            seen = [when for when, line in self.lines if text in line]
+            if len(seen) >= count:
+                return seen[count - 1]
+            if self._reader.done():
+                tail = "\n".join(line for _, line in self.lines[-20:])
+                raise RuntimeError(f"server exited before logging {text!r} x{count}:\n{tail}")
+            self._changed.clear()
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise TimeoutError(f"{text!r} logged {len(seen)}/{count} times after {timeout}s")
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+
+@asynccontextmanager
+async def serve(mode: str, workers: int, port: int, env: dict[str, str] | None = None) -> AsyncIterator[ServedApp]:
+    """
+    Run the API (from the service directory) in a serving mode on port until
+    the block exits, then stop it with SIGTERM as a deploy would. env is
+    added to the current environment; Prometheus multiprocess mode gets a
+    fresh directory when there is more than one process. Waiting for the
+    server to be ready is left to the caller (wait_for(STARTUP_COMPLETE,
+    workers)), so it can be timed.
+    """
+    if mode not in SERVING_MODES:
+        raise ValueError(f"unknown serving mode {mode!r}, expected one of {SERVING_MODES}")
+    service_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    full_env = {**os.environ, "PYTHONPATH": service_dir, "PYTHONUNBUFFERED": "1", **(env or {})}
+    with tempfile.TemporaryDirectory(prefix="pulse-metrics-") as metrics_dir:
+        if mode == "uvicorn":
+            workers = 1
+            args = ["-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port)]
+        elif mode == "uvicorn-workers":
+            full_env["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+            args = ["-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)]
+        else:
+            full_env.update(PROMETHEUS_MULTIPROC_DIR=metrics_dir, PORT=str(port), WEB_CONCURRENCY=str(workers))
+            args = ["-m", "gunicorn", "app.main:app", "--config", "gunicorn.conf.py"]
+
+        started = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, *args, cwd=service_dir, env=full_env,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+        )
+        served = ServedApp(process, workers, started)
+        try:
+            yield served
+        finally:
+            if process.returncode is None:
+                process.send_signal(signal.SIGTERM)
+                try:
+                    await asyncio.wait_for(process.wait(), 30)
+                except asyncio.TimeoutError:
+                    process.kill()
+                    await process.wait()
+            await served._reader
@@ -0,0 +1,428 @@
+"""
+Load test: replay a realistic request mix against the orchestrator, offline.
+
+Starts benchmarks.fake_openai in a subprocess (or uses --upstream) and sends
+a generate/adapt/explain mix with large inline catalogs, some of it
+streamed and some of it repeating an earlier request (cache hits and
+single-flight joins), from --users users; --output-format asks generate and
+adapt for the compact routine format instead of JSON:
+
+- in-process (default): the app is called through httpx's ASGI transport
+  with fakeredis (or --redis-url) behind the rate limiter, cache and
+  single-flight. Nothing leaves the machine.
+- --target URL: an orchestrator you started yourself, e.g. with
+      OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=unused \\
+          uvicorn app.main:app --port 8001
+  (it must point at the fake upstream's port).
+
+Closed loop with --concurrency clients by default; --rate switches to open
+loop (Poisson arrivals). The report has per-endpoint status counts and
+p50/p95/p99, throughput, upstream call/429/token counts from the fake and
+the orchestrator's own per-stage means from /metrics (body_parse,
+rate_limit, prompt_build, ...).
+
+Regression gate: --save FILE writes the results as JSON; --baseline FILE
+compares against a saved run and exits 1 if throughput drops, or any
+endpoint's p95 or stage mean grows, by more than --tolerance. Compare runs
+on the same machine with the same options. With --ttft-ms 0
+--tokens-per-second 0 the upstream is instant, so the numbers are the
+orchestrator's own overhead (parsing, rate limiting, prompt building).
+
+The in-process run raises the per-user rate limits (unless set in the
+environment) so the full check runs on every request without rejecting it.
+
+Usage (from services/ai-orchestrator):
+    python -m benchmarks.load_test
+    python -m benchmarks.load_test --requests 2000 --concurrency 64 --stream-fraction 0.5
+    python -m benchmarks.load_test --mix generate=1 --stream-fraction 1 --output-format compact
+    python -m benchmarks.load_test --ttft-ms 0 --tokens-per-second 0 --save baseline.json
+    python -m benchmarks.load_test --ttft-ms 0 --tokens-per-second 0 --baseline baseline.json
+    python -m benchmarks.load_test --throttle-rate 0.2 --rps-limit 50
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import random
+import sys
+import time
+import uuid
+from dataclasses import dataclass
+
+import httpx
+import orjson
+from prometheus_client.parser import text_string_to_metric_families
+
+from benchmarks.fake_openai import add_profile_arguments, profile_argv, profile_from_args
+
+_DEFAULT_MIX = "generate=0.45,adapt=0.2,explain=0.35"
+_CATALOG_ENDPOINTS = ("generate", "adapt")
+# Stages measured inside the orchestrator; upstream_* are the fake's time
+_LOCAL_STAGES = ("body_parse", "rate_limit", "prompt_build", "validation")
+
+
+@dataclass
+class _Spec:
+    endpoint: str
+    stream: bool
+    user: int
+    catalog: int
+    seed: int
+
+
+@dataclass
+class _Result:
+    label: str
+    status: int
+    seconds: float
+    first_byte: float | None = None
+
+
+def _parse_mix(mix: str) -> dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ("generate", "adapt", "explain"):
+            raise SystemExit(f"Unknown endpoint in --mix: {name!r}")
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+def _specs(args, rng: random.Random) -> list[_Spec]:
+    weights = _parse_mix(args.mix)
+    specs: list[_Spec] = []
+    for i in range(args.requests):
+        if specs and rng.random() < args.repeat_fraction:
+            # Same inputs from another user: served by the cache or a running call
+            previous = rng.choice(specs)
+            specs.append(_Spec(previous.endpoint, previous.stream, rng.randrange(args.users), previous.catalog, previous.seed))
+            continue
+        endpoint = rng.choices(list(weights), weights=list(weights.values()))[0]
+        specs.append(_Spec(
+            endpoint,
+            rng.random() < args.stream_fraction,
+            rng.randrange(args.users),
+            rng.randrange(args.catalogs),
+            args.seed * 100_003 + i,
+        ))
+    return specs
+
+
+class _Bodies:
+    """Builds request bodies on demand; catalogs are built once and shared."""
+
+    def __init__(self, args, run_id: str) -> None:
+        from benchmarks.fixtures import exercise_catalog
+
+        self.args = args
+        self.run_id = run_id
+        self.catalogs = [exercise_catalog(args.exercises, seed=args.seed + i) for i in range(args.catalogs)]
+
+    def build(self, spec: _Spec) -> bytes:
+        from benchmarks.fixtures import profile, routine_from, workout_history
+
+        rng = random.Random(spec.seed)
+        catalog = self.catalogs[spec.catalog]
+        user_profile = {**profile(rng), "benchmarkRun": self.run_id}
+        body = {"userId": f"load-{self.run_id}-{spec.user}", "profile": user_profile}
+        if spec.endpoint == "generate":
+            body["history"] = workout_history(len(catalog), self.args.sessions, rng)
+        elif spec.endpoint == "adapt":
+            body["currentRoutine"] = routine_from(catalog, rng)
+            body["recentLogs"] = workout_history(len(catalog), 3, rng)
+            body["feedback"] = rng.choice(["Too easy", "Shoulder feels sore", "Short on time this week"])
+        else:
+            body["routine"] = routine_from(catalog, rng)
+        if spec.endpoint in _CATALOG_ENDPOINTS:
+            body["available_exercises"] = catalog
+            if self.args.output_format:
+                body["outputFormat"] = self.args.output_format
+        return orjson.dumps(body)
+
+
+async def _send(client: httpx.AsyncClient, bodies: _Bodies, spec: _Spec) -> _Result:
+    path = f"/routine/{spec.endpoint}" + ("/stream" if spec.stream else "")
+    label = path.removeprefix("/routine/")
+    content = bodies.build(spec)
+    headers = {"content-type": "application/json"}
+    start = time.perf_counter()
+    if not spec.stream:
+        resp = await client.post(path, content=content, headers=headers)
+        return _Result(label, resp.status_code, time.perf_counter() - start)
+
+    first_byte = None
+    tail = b""
+    async with client.stream("POST", path, content=content, headers=headers) as resp:
+        async for chunk in resp.aiter_bytes():
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            tail = (tail + chunk)[-4096:]
+    status = resp.status_code
+    if status == 200 and b"event: error" in tail:
+        # Errors after the stream started arrive as an SSE event carrying the status
+        data = tail.rsplit(b"event: error", 1)[1].split(b"data: ", 1)[1].split(b"\n", 1)[0]
+        status = orjson.loads(data).get("status", 500)
+    return _Result(label, status, time.perf_counter() - start, first_byte)
+
+
+async def _closed_loop(client, bodies: _Bodies, specs: list[_Spec], concurrency: int) -> list[_Result]:
+    results: list[_Result] = []
+    pending = iter(specs)
+
+    async def worker() -> None:
+        for spec in pending:
+            results.append(await _send(client, bodies, spec))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+async def _open_loop(client, bodies: _Bodies, specs: list[_Spec], rate: float, rng: random.Random) -> list[_Result]:
+    tasks = []
+    next_at = time.monotonic()
+    for spec in specs:
+        next_at += rng.expovariate(rate)
+        await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+        tasks.append(asyncio.ensure_future(_send(client, bodies, spec)))
+    return list(await asyncio.gather(*tasks))
+
+
+# --- upstream and metrics ---
+
+
+async def _start_upstream(args) -> asyncio.subprocess.Process:
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "benchmarks.fake_openai", "--port", str(args.upstream_port),
+        *profile_argv(profile_from_args(args)),
+    )
+    async with httpx.AsyncClient() as client:
+        for _ in range(100):
+            try:
+                await client.get(f"{args.upstream}/stats")
+                return process
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    process.terminate()
+    raise SystemExit(f"Fake upstream did not start on port {args.upstream_port}")
+
+
+def _stage_totals(text: str) -> dict[str, tuple[float, float]]:
+    """(sum, count) of pulse_stage_duration_seconds per stage, over all endpoints."""
+    totals: dict[str, list[float]] = {}
+    for family in text_string_to_metric_families(text):
+        if family.name != "pulse_stage_duration_seconds":
+            continue
+        for sample in family.samples:
+            if sample.name.endswith(("_sum", "_count")):
+                entry = totals.setdefault(sample.labels["stage"], [0.0, 0.0])
+                entry[0 if sample.name.endswith("_sum") else 1] += sample.value
+    return {stage: (s, c) for stage, (s, c) in totals.items()}
+
+
+async def _stages(client: httpx.AsyncClient) -> dict[str, tuple[float, float]]:
+    resp = await client.get("/metrics")
+    return _stage_totals(resp.text) if resp.status_code == 200 else {}
+
+
+# --- report ---
+
+
+def _pct(ordered: list[float], p: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000 if ordered else float("nan")
+
+
+def _summarize(
+    results: list[_Result], elapsed: float, upstream: dict, before: dict, after: dict, first_byte: bool
+) -> dict:
+    endpoints = {}
+    for label in sorted({r.label for r in results}) + ["all"]:
+        group = [r for r in results if label in ("all", r.label)]
+        ok = sorted(r.seconds for r in group if r.status < 400)
+        first_bytes = sorted(r.first_byte for r in group if first_byte and r.status < 400 and r.first_byte is not None)
+        endpoints[label] = {
+            "requests": len(group),
+            "ok": len(ok),
+            "429": sum(r.status == 429 for r in group),
+            "503": sum(r.status == 503 for r in group),
+            "errors": sum(r.status >= 400 and r.status not in (429, 503) for r in group),
+            "p50": _pct(ok, 0.50),
+            "p95": _pct(ok, 0.95),
+            "p99": _pct(ok, 0.99),
+            "firstByteP50": _pct(first_bytes, 0.50) if first_bytes else None,
+        }
+    stages = {}
+    for stage, (total, count) in after.items():
+        prev_total, prev_count = before.get(stage, (0.0, 0.0))
+        if count > prev_count:
+            stages[stage] = (total - prev_total) / (count - prev_count) * 1000
+    return {
+        "seconds": elapsed,
+        "throughput": len(results) / elapsed,
+        "okThroughput": endpoints["all"]["ok"] / elapsed,
+        "endpoints": endpoints,
+        "upstream": upstream,
+        "stageMeansMs": stages,
+    }
+
+
+def _print_report(summary: dict) -> None:
+    print(f"{'endpoint':<18}{'n':>6}{'ok':>6}{'429':>6}{'503':>6}{'err':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for label, e in summary["endpoints"].items():
+        line = (
+            f"{label:<18}{e['requests']:>6}{e['ok']:>6}{e['429']:>6}{e['503']:>6}{e['errors']:>6}"
+            f"{e['p50']:>9.0f}{e['p95']:>9.0f}{e['p99']:>9.0f}"
+        )
+        if e["firstByteP50"] is not None:
+            line += f"   first byte p50 {e['firstByteP50']:.0f} ms"
+        print(line)
+
+    upstream = summary["upstream"]
+    ok = summary["endpoints"]["all"]["ok"]
+    print(
+        f"\nthroughput: {summary['throughput']:.1f} req/s ({summary['okThroughput']:.1f} ok/s) "
+        f"over {summary['seconds']:.1f} s"
+    )
+    print(
+        f"upstream:   {upstream['calls']} calls ({upstream['streamed']} streamed, "
+        f"{upstream['calls'] / max(ok, 1):.2f} per ok request) | 429 {upstream['throttled']} | "
+        f"500 {upstream['errors']} | tokens {upstream['promptTokens']} in / {upstream['completionTokens']} out | "
+        f"peak concurrency {upstream['peakActive']}"
+    )
+    if summary["stageMeansMs"]:
+        stages = " | ".join(f"{stage} {ms:.2f}" for stage, ms in sorted(summary["stageMeansMs"].items()))
+        print(f"stages (mean ms): {stages}")
+
+
+def _regressions(summary: dict, baseline: dict, tolerance: float) -> list[str]:
+    found = []
+    if summary["okThroughput"] < baseline["okThroughput"] * (1 - tolerance):
+        found.append(f"ok throughput {baseline['okThroughput']:.1f} -> {summary['okThroughput']:.1f} req/s")
+    for label, e in summary["endpoints"].items():
+        before = baseline["endpoints"].get(label)
+        if before and e["p95"] > before["p95"] * (1 + tolerance):
+            found.append(f"{label} p95 {before['p95']:.0f} -> {e['p95']:.0f} ms")
+    for stage in _LOCAL_STAGES:
+        now, before = summary["stageMeansMs"].get(stage), baseline["stageMeansMs"].get(stage)
+        if now is not None and before and now > before * (1 + tolerance):
+            found.append(f"stage {stage} mean {before:.3f} -> {now:.3f} ms")
+    return found
+
+
+# --- main ---
+
+
+async def _run(args) -> dict:
+    rng = random.Random(args.seed)
+    run_id = uuid.uuid4().hex[:8]
+    specs = _specs(args, rng)
+    bodies = _Bodies(args, run_id)
+
+    upstream_process = None if args.upstream_given else await _start_upstream(args)
+    try:
+        async with httpx.AsyncClient() as control:
+            await control.post(f"{args.upstream}/stats/reset")
+
+            async with contextlib.AsyncExitStack() as stack:
+                if args.target:
+                    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+                    client = httpx.AsyncClient(base_url=args.target, timeout=120, limits=limits)
+                else:
+                    # App config is read at import time, so only import it once
+                    # the environment points at the fake upstream
+                    from app.main import app
+                    from benchmarks.fixtures import redis_fixture
+
+                    logging.getLogger("pulse").setLevel(logging.ERROR)
+
+                    await stack.enter_async_context(redis_fixture(args.redis_url))
+                    transport = httpx.ASGITransport(app=app)
+                    client = httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=120)
+                client = await stack.enter_async_context(client)
+
+                before = await _stages(client)
+                start = time.perf_counter()
+                if args.rate:
+                    results = await _open_loop(client, bodies, specs, args.rate, rng)
+                else:
+                    results = await _closed_loop(client, bodies, specs, args.concurrency)
+                elapsed = time.perf_counter() - start
+                after = await _stages(client)
+
+            upstream = (await control.get(f"{args.upstream}/stats")).json()
+    finally:
+        if upstream_process is not None:
+            upstream_process.terminate()
+            await upstream_process.wait()
+
+    # httpx's ASGI transport buffers whole responses, so streams only show
+    # their first byte early against a real server
+    return _summarize(results, elapsed, upstream, before, after, first_byte=bool(args.target))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    load = parser.add_argument_group("load")
+    load.add_argument("--requests", type=int, default=300)
+    load.add_argument("--concurrency", type=int, default=32, help="closed-loop clients")
+    load.add_argument("--rate", type=float, default=0, help="open-loop arrivals per second (overrides --concurrency)")
+    load.add_argument("--mix", default=_DEFAULT_MIX, help="endpoint weights")
+    load.add_argument("--stream-fraction", type=float, default=0.3)
+    load.add_argument(
+        "--output-format", choices=["json", "compact"], help="outputFormat for generate/adapt (default: server's)"
+    )
+    load.add_argument("--repeat-fraction", type=float, default=0.1, help="requests repeating an earlier one")
+    load.add_argument("--users", type=int, default=200)
+    load.add_argument("--exercises", type=int, default=500, help="exercises per catalog")
+    load.add_argument("--catalogs", type=int, default=3, help="distinct catalogs (equipment filters)")
+    load.add_argument("--sessions", type=int, default=20, help="history sessions per generate body")
+    target = parser.add_argument_group("target")
+    target.add_argument("--target", help="orchestrator base URL (default: in-process)")
+    target.add_argument("--upstream", help="running fake_openai base URL (default: start one)")
+    target.add_argument("--upstream-port", type=int, default=8089)
+    target.add_argument("--redis-url", help="scratch Redis for the in-process app (default: fakeredis)")
+    gate = parser.add_argument_group("regression gate")
+    gate.add_argument("--save", help="write results as JSON")
+    gate.add_argument("--baseline", help="compare against results saved with --save")
+    gate.add_argument("--tolerance", type=float, default=0.15)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    args.upstream_given = bool(args.upstream)
+    args.upstream = (args.upstream or f"http://127.0.0.1:{args.upstream_port}").rstrip("/")
+    os.environ.setdefault("OPENAI_BASE_URL", f"{args.upstream}/v1")
+    os.environ.setdefault("OPENAI_API_KEY", "unused")
+    for name in ("RATE_LIMIT_PER_MINUTE", "RATE_LIMIT_PER_HOUR", "RATE_LIMIT_PER_DAY"):
+        os.environ.setdefault(name, "1000000")
+
+    shape = f"concurrency {args.concurrency}" if not args.rate else f"{args.rate:.0f} req/s open loop"
+    print(
+        f"load: {args.requests} requests, {shape}, mix {args.mix}, {args.stream_fraction:.0%} streamed, "
+        f"{args.repeat_fraction:.0%} repeats, {args.catalogs} catalogs x {args.exercises} exercises, "
+        f"output format {args.output_format or 'default'}"
+    )
+    print(
+        f"upstream: ttft {args.ttft_ms:.0f} ms (sigma {args.ttft_sigma}), {args.tokens_per_second:.0f} tok/s, "
+        f"429 {args.throttle_rate:.0%} + above {args.rps_limit or 'no'} calls/s, 500 {args.error_rate:.0%}\n"
+    )
+    summary = asyncio.run(_run(args))
+    _print_report(summary)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(summary, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = _regressions(summary, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\nREGRESSION (tolerance {args.tolerance:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nno regression against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Outage drill: rate-limit latency and breaker state while Redis dies and comes back.
+
+The app's Redis pool (init_redis, with the API's socket timeouts) connects
+through a TCP proxy in this process, so the script can kill Redis without
+root or Docker. Behind the proxy is fakeredis's TCP server by default, or
+the Redis at --redis-url (use a scratch database — ratelimit:outage-* keys
+are written). The background health check (watch_redis) runs as in the app.
+
+Requests go through require_rate_limit on a one-route app over httpx's ASGI
+transport, at a steady --rate from a few users, in three phases:
+
+1. up: Redis healthy, limits checked in Redis.
+2. outage: --mode down drops every connection, as a crashed Redis does;
+   --mode hang keeps them open but never answers (a partition or a stuck
+   server), so every round trip costs a full socket timeout.
+3. recovered: the proxy forwards again; the health check closes the breaker.
+
+Per phase it reports latency percentiles, how many decisions were made in
+Redis vs in process, and when the breaker opened and closed.
+
+Usage (from services/ai-orchestrator):
+    python -m benchmarks.redis_outage
+    python -m benchmarks.redis_outage --mode hang --outage-seconds 10
+    python -m benchmarks.redis_outage --redis-url redis://localhost:6379/15
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import threading
+import time
+from urllib.parse import urlparse
+
+import httpx
+from fastapi import Depends, FastAPI
+from prometheus_client import REGISTRY
+
+
+class _Proxy:
+    """TCP proxy to Redis that can drop or black-hole its connections."""
+
+    def __init__(self, upstream_host: str, upstream_port: int) -> None:
+        self.upstream = (upstream_host, upstream_port)
+        self.mode = "up"
+        self._writers: set[asyncio.StreamWriter] = set()
+        self._handlers: set[asyncio.Task] = set()
+
+    async def start(self) -> int:
+        self._server = await asyncio.start_server(self._accept, "127.0.0.1", 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    def set_mode(self, mode: str) -> None:
+        self.mode = mode
+        # Dropped connections are gone; black-holed ones are broken mid-reply
+        for writer in list(self._writers):
+            writer.close()
+
+    async def close(self) -> None:
+        self._server.close()
+        self.set_mode("down")
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+
+    async def _accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        if self.mode == "down":
+            writer.close()
+            return
+        self._writers.add(writer)
+        self._handlers.add(asyncio.current_task())
+        try:
+            if self.mode == "hang":
+                while await reader.read(65536):
+                    pass
+                return
+            up_reader, up_writer = await asyncio.open_connection(*self.upstream)
+            self._writers.add(up_writer)
+            try:
+                await asyncio.gather(self._pipe(reader, up_writer), self._pipe(up_reader, writer))
+            finally:
+                self._writers.discard(up_writer)
+                up_writer.close()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            self._handlers.discard(asyncio.current_task())
+            writer.close()
+
+    async def _pipe(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        while data := await reader.read(65536):
+            if self.mode != "up":
+                continue  # black hole
+            writer.write(data)
+            await writer.drain()
+        writer.close()
+
+
+def _decisions() -> dict[str, float]:
+    return {
+        outcome: REGISTRY.get_sample_value("pulse_rate_limit_decisions_total", {"outcome": outcome, "window": ""}) or 0
+        for outcome in ("allowed", "local_allowed")
+    }
+
+
+async def _phase(name: str, seconds: float, client: httpx.AsyncClient, args, events: list) -> None:
+    latencies, statuses = [], {}
+    before = _decisions()
+    start = time.monotonic()
+    i = 0
+
+    async def one(user: str) -> None:
+        sent = time.perf_counter()
+        resp = await client.post("/probe", json={"userId": user})
+        latencies.append((time.perf_counter() - sent) * 1000)
+        statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+
+    tasks = []
+    while time.monotonic() - start < seconds:
+        tasks.append(asyncio.create_task(one(f"outage-{i % args.users}")))
+        i += 1
+        await asyncio.sleep(1 / args.rate)
+    await asyncio.gather(*tasks)
+
+    after = _decisions()
+    latencies.sort()
+    print(
+        f"{name:>10}: {len(latencies):5d} requests | p50 {statistics.median(latencies):7.2f} ms "
+        f"p99 {latencies[int(len(latencies) * 0.99) - 1]:7.2f} ms max {latencies[-1]:7.2f} ms | "
+        f"in Redis {after['allowed'] - before['allowed']:.0f}, in process "
+        f"{after['local_allowed'] - before['local_allowed']:.0f} | status {dict(sorted(statuses.items()))}"
+    )
+    for when, state in events:
+        print(f"{'':>12}breaker {state} after {when - start:.2f}s")
+    events.clear()
+
+
+async def _watch_breaker(breaker, events: list) -> None:
+    state = breaker.state
+    while True:
+        await asyncio.sleep(0.005)
+        if breaker.state != state:
+            state = breaker.state
+            events.append((time.monotonic(), state))
+
+
+async def _run(args) -> None:
+    # Imported here so the rate limits set in main() apply
+    from app.core import rate_limiter
+    from app.core import redis_client as redis_module
+
+    server = None
+    if args.redis_url:
+        url = urlparse(args.redis_url)
+        upstream, db = (url.hostname or "localhost", url.port or 6379), url.path.lstrip("/") or "0"
+    else:
+        import fakeredis
+        server = fakeredis.TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        upstream, db = server.server_address, "0"
+
+    proxy = _Proxy(*upstream)
+    port = await proxy.start()
+    redis_module.REDIS_URL = f"redis://127.0.0.1:{port}/{db}"
+    await redis_module.init_redis()
+    await rate_limiter.load_rate_limit_script()
+
+    app = FastAPI()
+
+    @app.post("/probe", dependencies=[Depends(rate_limiter.require_rate_limit)])
+    async def probe():
+        return {}
+
+    events: list = []
+    background = [
+        asyncio.create_task(redis_module.watch_redis()),
+        asyncio.create_task(_watch_breaker(redis_module.redis_breaker, events)),
+    ]
+    print(
+        f"socket timeout {redis_module.REDIS_SOCKET_TIMEOUT_SECONDS}s | breaker opens after "
+        f"{redis_module.redis_breaker.failure_threshold} failures, probes after "
+        f"{redis_module.redis_breaker.reset_seconds}s | health check every {redis_module.REDIS_HEALTH_CHECK_SECONDS}s\n"
+    )
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://probe") as client:
+            await _phase("up", args.up_seconds, client, args, events)
+            proxy.set_mode(args.mode)
+            await _phase("outage", args.outage_seconds, client, args, events)
+            proxy.set_mode("up")
+            await _phase("recovered", args.recover_seconds, client, args, events)
+    finally:
+        for task in background:
+            task.cancel()
+        await redis_module.close_redis()
+        await proxy.close()
+        if server is not None:
+            server.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["down", "hang"], default="down")
+    parser.add_argument("--redis-url", help="real Redis behind the proxy (default: fakeredis TCP server)")
+    parser.add_argument("--rate", type=float, default=200, help="requests per second")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--up-seconds", type=float, default=3)
+    parser.add_argument("--outage-seconds", type=float, default=8)
+    parser.add_argument("--recover-seconds", type=float, default=8)
+    args = parser.parse_args()
+    # High enough that no request is rejected, so every one runs the full check
+    for name in ("RATE_LIMIT_PER_MINUTE", "RATE_LIMIT_PER_HOUR", "RATE_LIMIT_PER_DAY"):
+        os.environ.setdefault(name, "1000000")
+    os.environ.setdefault("OPENAI_API_KEY", "unused")
+    logging.getLogger("pulse").setLevel(logging.ERROR)
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
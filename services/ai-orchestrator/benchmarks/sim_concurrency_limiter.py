@@ -0,0 +1,205 @@
+"""
+Simulation: the adaptive upstream concurrency limiter under a traffic spike.
+
+Drives openai_client._complete against a local fake upstream that serves
+--capacity calls at full speed, slows down proportionally beyond that
+(processor sharing, so an overloaded upstream gets slow rather than failing)
+and answers 429 once more than --upstream-rps calls start within a second.
+Open-loop arrivals — steady traffic, a spike, steady again — with a
+generate/explain mix are replayed twice:
+
+- unbounded: every call goes straight to the upstream (the old behaviour)
+- adaptive:  calls go through AdaptiveConcurrencyLimiter
+
+and the report compares completed calls, shed calls (503), upstream 429s,
+calls that finished after the client had already given up (tokens paid for
+nothing), latency percentiles and upstream call counts.
+
+The limiter's behaviour (priority order, shedding, queue timeout, AIMD
+decrease/increase, 503 + Retry-After) is covered by
+tests/test_concurrency_limiter.py.
+
+Usage (from services/ai-orchestrator; the key is never used):
+    OPENAI_API_KEY=unused python -m benchmarks.sim_concurrency_limiter
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import time
+import types
+from collections import deque
+
+import httpx
+from openai import RateLimitError
+
+from app.core import openai_client
+from app.core.concurrency_limiter import AdaptiveConcurrencyLimiter, UpstreamOverloadedError
+from app.core.model_router import ModelRouter
+
+# Seconds of upstream work per call at or below capacity
+_BASE_LATENCY = {"generate": 0.2, "explain": 0.05}
+
+
+def _rate_limit_error() -> RateLimitError:
+    response = httpx.Response(429, request=httpx.Request("POST", "http://fake-openai/v1/chat/completions"))
+    return RateLimitError("Rate limit reached", response=response, body=None)
+
+
+class FakeUpstream:
+    """Stands in for client.chat.completions; latency grows with concurrency past capacity."""
+
+    def __init__(self, capacity: int, rps: float = 1000, jitter: float = 0.1, seed: int = 7) -> None:
+        self.capacity = capacity
+        self.rps = rps
+        self.jitter = jitter
+        self.starts: deque[float] = deque()
+        self.rng = random.Random(seed)
+        self.active = 0
+        self.calls = 0
+        self.throttled = 0
+        self.fail_next = 0
+
+    async def create(self, **body):
+        self.calls += 1
+        endpoint = body["messages"][0]["content"]
+        now = time.monotonic()
+        while self.starts and self.starts[0] < now - 1:
+            self.starts.popleft()
+        if self.fail_next or len(self.starts) >= self.rps:
+            self.fail_next = max(0, self.fail_next - 1)
+            self.throttled += 1
+            await asyncio.sleep(0.005)
+            raise _rate_limit_error()
+
+        self.starts.append(now)
+        self.active += 1
+        try:
+            base = _BASE_LATENCY.get(endpoint, 0.1) * (1 + self.rng.uniform(-self.jitter, self.jitter))
+            # Processor sharing: work advances at capacity/active of full speed
+            remaining = base
+            while remaining > 0:
+                step = min(remaining, 0.01)
+                await asyncio.sleep(step * max(1.0, self.active / self.capacity))
+                remaining -= step
+        finally:
+            self.active -= 1
+        usage = types.SimpleNamespace(prompt_tokens=1000, completion_tokens=200, prompt_tokens_details=None)
+        message = types.SimpleNamespace(content="ok")
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=usage)
+
+
+def _install(upstream: FakeUpstream, limiter: AdaptiveConcurrencyLimiter) -> None:
+    from app.routers import routine
+
+    openai_client.router = ModelRouter([types.SimpleNamespace(chat=types.SimpleNamespace(completions=upstream))])
+    # Swap the process-wide limiter everywhere it is used
+    openai_client.upstream_limiter = limiter
+    routine.upstream_limiter = limiter
+
+
+async def _call(endpoint: str) -> None:
+    # The fake reads the endpoint from the first message
+    await openai_client._complete(endpoint, [{"role": "system", "content": endpoint}])
+
+
+def _arrivals(args, rng: random.Random) -> list[tuple[float, str]]:
+    """(offset, endpoint) pairs: steady rate, a spike, steady again."""
+    phases = [(args.duration / 3, args.rate), (args.spike_seconds, args.spike_rate), (args.duration / 3, args.rate)]
+    events, t = [], 0.0
+    for length, rate in phases:
+        end = t + length
+        while True:
+            t += rng.expovariate(rate)
+            if t >= end:
+                t = end
+                break
+            events.append((t, "generate" if rng.random() < 0.6 else "explain"))
+    return events
+
+
+async def _run(label: str, args, limiter: AdaptiveConcurrencyLimiter) -> None:
+    rng = random.Random(args.seed)
+    upstream = FakeUpstream(args.capacity, rps=args.upstream_rps, seed=args.seed)
+    _install(upstream, limiter)
+    outcomes = {"ok": [], "late": 0, "shed": 0, "throttled": 0}
+    limits = []
+
+    async def one(endpoint: str) -> None:
+        start = time.monotonic()
+        try:
+            await _call(endpoint)
+        except UpstreamOverloadedError:
+            outcomes["shed"] += 1
+            return
+        except RateLimitError:
+            outcomes["throttled"] += 1
+            return
+        elapsed = time.monotonic() - start
+        if elapsed > args.client_timeout:
+            outcomes["late"] += 1
+        else:
+            outcomes["ok"].append(elapsed * 1000)
+
+    async def sample_limit() -> None:
+        while True:
+            limits.append(int(limiter.limit))
+            await asyncio.sleep(0.05)
+
+    sampler = asyncio.ensure_future(sample_limit())
+    start = time.monotonic()
+    tasks = []
+    for offset, endpoint in _arrivals(args, rng):
+        await asyncio.sleep(max(0.0, start + offset - time.monotonic()))
+        tasks.append(asyncio.ensure_future(one(endpoint)))
+    await asyncio.gather(*tasks)
+    sampler.cancel()
+
+    ok = sorted(outcomes["ok"])
+
+    def pct(p: float) -> float:
+        return ok[min(len(ok) - 1, int(len(ok) * p))] if ok else float("nan")
+
+    print(
+        f"{label:>9}: {len(tasks)} calls | ok {len(ok)} | late {outcomes['late']} | "
+        f"shed {outcomes['shed']} | 429 {outcomes['throttled']} | upstream calls {upstream.calls}"
+    )
+    print(
+        f"{'':>9}  p50 {pct(0.5):6.0f} ms | p95 {pct(0.95):6.0f} ms | p99 {pct(0.99):6.0f} ms | "
+        f"limit min/max {min(limits)}/{max(limits)}"
+    )
+
+
+async def _simulate(args) -> None:
+    print(
+        f"fake upstream: capacity {args.capacity} concurrent, 429 above {args.upstream_rps:.0f} calls/s; "
+        f"client gives up after {args.client_timeout:.1f} s\n"
+    )
+    unbounded = AdaptiveConcurrencyLimiter(initial=10_000, minimum=10_000, maximum=10_000)
+    await _run("unbounded", args, unbounded)
+    adaptive = AdaptiveConcurrencyLimiter(
+        initial=args.capacity, minimum=2, maximum=4 * args.capacity,
+        max_queue=args.queue, queue_timeout=args.client_timeout / 2,
+    )
+    await _run("adaptive", args, adaptive)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--capacity", type=int, default=8, help="calls the fake serves at full speed")
+    parser.add_argument("--upstream-rps", type=float, default=100, help="calls per second before the fake answers 429")
+    parser.add_argument("--rate", type=float, default=30, help="steady arrivals per second")
+    parser.add_argument("--spike-rate", type=float, default=200, help="arrivals per second during the spike")
+    parser.add_argument("--spike-seconds", type=float, default=1.5)
+    parser.add_argument("--duration", type=float, default=4, help="seconds of steady traffic (split around the spike)")
+    parser.add_argument("--client-timeout", type=float, default=1.5, help="scaled stand-in for the web app's 30 s")
+    parser.add_argument("--queue", type=int, default=32, help="adaptive run's queue bound")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    logging.getLogger("pulse").setLevel(logging.ERROR)
+    asyncio.run(_simulate(args))
+
+
+if __name__ == "__main__":
+    main()
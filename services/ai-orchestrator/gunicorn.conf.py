@@ -0,0 +1,71 @@
+"""
+Gunicorn settings for serving the API with several worker processes.
+
+start.sh uses this when WEB_CONCURRENCY is not 1. Each worker is a uvicorn
+event loop with its own Redis pool, OpenAI clients, upstream concurrency
+limiter and circuit breakers, so the OPENAI_CONCURRENCY_* limits and Redis's
+max_connections apply per worker.
+
+- WEB_CONCURRENCY: worker count; "auto" (or 0) means one per CPU available
+  to the container (cgroup CPU quota and affinity, not the host's count).
+- The app is imported once in the master (preload_app) and warmup.preload
+  builds the warm state there (when_ready), before any worker is forked.
+  Workers fork in milliseconds and share those pages copy-on-write.
+- Graceful recycling: a worker restarts after WORKER_MAX_REQUESTS requests
+  (plus up to WORKER_MAX_REQUESTS_JITTER, so workers do not all restart at
+  once), finishing its in-flight requests first (up to
+  WORKER_GRACEFUL_TIMEOUT seconds, also used on SIGTERM during deploys).
+  The replacement is forked from the warm master.
+- Metrics: start.sh points PROMETHEUS_MULTIPROC_DIR at an empty directory
+  so /metrics on any worker covers all of them; dead workers' live gauges
+  are dropped (child_exit).
+"""
+
+import math
+import os
+
+
+def _available_cpus() -> int:
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+def _workers() -> int:
+    value = os.getenv("WEB_CONCURRENCY", "auto").strip().lower()
+    if value in ("", "auto", "0"):
+        return _available_cpus()
+    return max(1, int(value))
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8001')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = _workers()
+preload_app = True
+
+max_requests = int(os.getenv("WORKER_MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.getenv("WORKER_MAX_REQUESTS_JITTER", "1000"))
+graceful_timeout = int(os.getenv("WORKER_GRACEFUL_TIMEOUT", "30"))
+# Heartbeat only (the event loop pings the master); long streams are fine
+timeout = 60
+keepalive = 5
+
+
+def when_ready(server):
+    from app.core import warmup
+
+    warmup.preload()
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
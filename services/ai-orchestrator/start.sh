@@ -1,2 +1,16 @@
 #!/bin/sh
-exec uvicorn app.main:app --host 0.0.0.0 --port "${PORT:-8001}"
+# "start.sh worker" runs the precomputed-job worker instead of the API
+if [ "$1" = "worker" ]; then
+  exec python -m app.worker
+fi
+# WEB_CONCURRENCY=1 serves from a single uvicorn process; anything else
+# ("auto" = one per CPU, the default, or a number) runs gunicorn workers
+# (see gunicorn.conf.py)
+if [ "${WEB_CONCURRENCY:-auto}" = "1" ]; then
+  exec uvicorn app.main:app --host 0.0.0.0 --port "${PORT:-8001}"
+fi
+# Shared by the workers' metrics; values from a previous run must not be summed in
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/pulse-metrics}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+exec gunicorn app.main:app --config gunicorn.conf.py
@@ -0,0 +1,70 @@
+"""
+Shared fixtures: the app's OpenAI calls go to benchmarks.fake_openai,
+served over real HTTP from a background thread, so the SDK's timeouts and
+error handling apply as in production. No Redis is needed; without it the
+app uses its local fallbacks.
+
+Run from services/ai-orchestrator:
+    python -m pytest
+"""
+
+import os
+
+# App config is read at import time
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+
+import socket
+import threading
+import time
+
+import pytest
+import uvicorn
+from openai import AsyncOpenAI
+
+from app.core import openai_client
+from app.core.concurrency_limiter import AdaptiveConcurrencyLimiter
+from app.core.model_router import ModelRouter
+from app.routers import routine
+from benchmarks.fake_openai import FakeOpenAI, UpstreamProfile
+
+
+def _fast_profile() -> UpstreamProfile:
+    return UpstreamProfile(ttft_ms=5, ttft_sigma=0, tokens_per_second=0, text_tokens=20)
+
+
+@pytest.fixture(scope="session")
+def _fake_server():
+    fake = FakeOpenAI(_fast_profile())
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(fake.app, log_level="warning", ws="none"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    yield fake, f"http://127.0.0.1:{sock.getsockname()[1]}/v1"
+    server.should_exit = True
+    thread.join()
+
+
+@pytest.fixture
+def upstream(_fake_server, monkeypatch) -> FakeOpenAI:
+    """The fake upstream behind openai_client; tests tune fake.profile."""
+    fake, base_url = _fake_server
+    fake.profile = _fast_profile()
+    fake.reset()
+    client = AsyncOpenAI(api_key="unused", base_url=base_url, max_retries=0)
+    monkeypatch.setattr(openai_client, "router", ModelRouter([client]))
+    return fake
+
+
+@pytest.fixture
+def install_limiter(monkeypatch):
+    """Swap the process-wide upstream limiter everywhere it is used."""
+
+    def install(limiter: AdaptiveConcurrencyLimiter) -> AdaptiveConcurrencyLimiter:
+        monkeypatch.setattr(openai_client, "upstream_limiter", limiter)
+        monkeypatch.setattr(routine, "upstream_limiter", limiter)
+        return limiter
+
+    return install
@@ -0,0 +1,28 @@
+import pytest
+from pydantic import ValidationError
+
+from app.models.request import CatalogUploadRequest, GenerateRequest
+
+_SQUAT = {"rowid": 1, "name": "Squat", "equipment": "barbell"}
+
+
+@pytest.mark.parametrize("entry", [{"name": "Lunge"}, {"rowid": 2}, {"rowid": 2, "name": " "}, {"rowid": 2, "name": 7}])
+def test_exercise_without_rowid_or_name_is_rejected(entry):
+    with pytest.raises(ValidationError, match=r"available_exercises\[1\]"):
+        CatalogUploadRequest(available_exercises=[_SQUAT, entry])
+    with pytest.raises(ValidationError, match=r"available_exercises\[1\]"):
+        GenerateRequest(userId="u", profile={}, available_exercises=[_SQUAT, entry])
+
+
+def test_extra_exercise_fields_are_kept():
+    req = CatalogUploadRequest(available_exercises=[_SQUAT])
+    assert req.available_exercises == [_SQUAT]
+
+
+def test_bad_entry_is_422_not_500():
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    resp = TestClient(app).post("/routine/catalog", json={"available_exercises": [_SQUAT, {"name": "Lunge"}]})
+    assert resp.status_code == 422
@@ -0,0 +1,119 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from openai import APITimeoutError, RateLimitError
+
+from app.core import openai_client
+from app.core.concurrency_limiter import AdaptiveConcurrencyLimiter, UpstreamOverloadedError
+from app.core.model_router import ModelRouter
+
+_ROUTINE = {"routine": {"name": "Push Day", "exercises": []}}
+
+
+def _explain():
+    return openai_client._complete("explain", [{"role": "user", "content": "Explain this routine"}])
+
+
+def test_generate_is_admitted_before_explain():
+    limiter = AdaptiveConcurrencyLimiter(initial=1, minimum=1, maximum=1, max_queue=10, queue_timeout=5)
+    order = []
+
+    async def waiter(endpoint: str) -> None:
+        async with limiter.slot(endpoint):
+            order.append(endpoint)
+
+    async def run() -> None:
+        async with limiter.slot("generate"):
+            tasks = [asyncio.ensure_future(waiter(e)) for e in ("explain", "summarize", "adapt", "generate")]
+            await asyncio.sleep(0.01)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == ["adapt", "generate", "explain", "summarize"]
+
+
+def test_full_queue_sheds_without_waiting():
+    limiter = AdaptiveConcurrencyLimiter(initial=1, minimum=1, maximum=1, max_queue=1, queue_timeout=5)
+
+    async def run() -> None:
+        async with limiter.slot("generate"):
+            queued = asyncio.ensure_future(limiter.slot("explain").__aenter__())
+            await asyncio.sleep(0.01)
+            start = time.monotonic()
+            with pytest.raises(UpstreamOverloadedError) as shed:
+                async with limiter.slot("generate"):
+                    pass
+            assert time.monotonic() - start < 0.05
+            assert shed.value.retry_after >= 1
+        await queued
+
+    asyncio.run(run())
+
+
+def test_queue_timeout_sheds_and_frees_the_queue():
+    limiter = AdaptiveConcurrencyLimiter(initial=1, minimum=1, maximum=1, max_queue=5, queue_timeout=0.05)
+
+    async def run() -> None:
+        async with limiter.slot("generate"):
+            with pytest.raises(UpstreamOverloadedError):
+                async with limiter.slot("explain"):
+                    pass
+
+    asyncio.run(run())
+    assert limiter.has_capacity()
+
+
+def test_limit_halves_on_429(upstream, install_limiter):
+    limiter = install_limiter(AdaptiveConcurrencyLimiter(initial=16, minimum=2, maximum=64))
+
+    async def run() -> None:
+        await _explain()
+        upstream.profile.throttle_rate = 1.0
+        with pytest.raises(RateLimitError):
+            await _explain()
+
+    asyncio.run(run())
+    assert int(limiter.limit) == 8
+
+
+def test_limit_shrinks_on_timeout(upstream, install_limiter, monkeypatch):
+    limiter = install_limiter(AdaptiveConcurrencyLimiter(initial=16, minimum=2, maximum=64))
+    upstream.profile.ttft_ms = 500
+    client = openai_client.router.primary.with_options(timeout=0.05)
+    monkeypatch.setattr(openai_client, "router", ModelRouter([client]))
+
+    with pytest.raises(APITimeoutError):
+        asyncio.run(_explain())
+    assert int(limiter.limit) == 14
+
+
+def test_limit_grows_back_while_in_use(upstream, install_limiter):
+    limiter = install_limiter(AdaptiveConcurrencyLimiter(initial=4, minimum=2, maximum=64))
+
+    async def run() -> None:
+        for _ in range(10):
+            await asyncio.gather(*(_explain() for _ in range(int(limiter.limit))))
+
+    asyncio.run(run())
+    assert int(limiter.limit) > 4
+
+
+def test_shed_call_is_503_with_retry_after(upstream, install_limiter):
+    from app.main import app
+
+    limiter = install_limiter(AdaptiveConcurrencyLimiter(initial=1, minimum=1, maximum=1, max_queue=0))
+
+    async def run() -> None:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            async with limiter.slot("generate"):
+                for path in ("/routine/explain", "/routine/explain/stream"):
+                    resp = await client.post(path, json=_ROUTINE)
+                    assert resp.status_code == 503, resp.text
+                    assert int(resp.headers["Retry-After"]) >= 1
+            resp = await client.post("/routine/explain", json=_ROUTINE)
+            assert resp.status_code == 200, resp.text
+
+    asyncio.run(run())
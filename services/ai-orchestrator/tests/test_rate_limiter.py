@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.core import rate_limiter, usage
+from benchmarks.fixtures import redis_fixture
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "RATE_LIMIT_PER_MINUTE", 3)
+    monkeypatch.setattr(rate_limiter, "RATE_LIMIT_PER_HOUR", 0)
+    monkeypatch.setattr(rate_limiter, "RATE_LIMIT_PER_DAY", 0)
+    monkeypatch.setattr(usage, "TOKEN_LIMIT_PER_MINUTE", 0)
+    monkeypatch.setattr(usage, "TOKEN_LIMIT_PER_HOUR", 1000)
+    monkeypatch.setattr(usage, "TOKEN_LIMIT_PER_DAY", 0)
+
+
+@pytest.mark.parametrize("backend", ["zset", "counter"])
+def test_windows_reject_past_the_limit(limits, backend):
+    async def run() -> None:
+        async with redis_fixture():
+            for _ in range(3):
+                await rate_limiter._check_rate_limit("u1", backend=backend)
+            with pytest.raises(HTTPException) as rejected:
+                await rate_limiter._check_rate_limit("u1", backend=backend)
+            assert rejected.value.status_code == 429
+            assert rejected.value.detail["error"] == "rate_limit_exceeded"
+            assert int(rejected.value.headers["Retry-After"]) >= 1
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("backend", ["zset", "counter"])
+def test_spent_token_budget_rejects_without_recording_a_hit(limits, backend):
+    async def run() -> None:
+        async with redis_fixture() as client:
+            now = time.time()
+            (_, _, _, key), = usage.token_budgets("u2", now)
+            await client.set(key, 1000)
+            with pytest.raises(HTTPException) as rejected:
+                await rate_limiter._check_rate_limit("u2", backend=backend, now=now)
+            assert rejected.value.status_code == 429
+            assert rejected.value.detail["error"] == "token_budget_exceeded"
+            assert rejected.value.detail["window"] == "hour"
+            assert rejected.value.detail["used"] == 1000
+            assert await client.keys("ratelimit*") == []
+
+            await client.set(key, 999)
+            await rate_limiter._check_rate_limit("u2", backend=backend, now=now)
+            assert len(await client.keys("ratelimit*")) == 1
+
+    asyncio.run(run())
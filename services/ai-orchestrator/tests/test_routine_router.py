@@ -0,0 +1,27 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.routers import routine
+
+_ADAPT = {
+    "userId": "u",
+    "profile": {},
+    "currentRoutine": {"name": "Push Day", "exercises": []},
+    "available_exercises": [{"rowid": 1, "name": "Squat"}],
+}
+
+
+@pytest.mark.parametrize("default, mode", [("full", "delta"), ("delta", None)])
+def test_adapt_stream_rejects_delta_mode(monkeypatch, default, mode):
+    monkeypatch.setattr(routine, "ADAPT_MODE", default)
+    resp = TestClient(app).post("/routine/adapt/stream", json={**_ADAPT, "mode": mode})
+    assert resp.status_code == 400
+    assert "Delta mode" in resp.json()["detail"]
+
+
+def test_adapt_stream_takes_explicit_full_mode_under_delta_default(monkeypatch, upstream):
+    monkeypatch.setattr(routine, "ADAPT_MODE", "delta")
+    resp = TestClient(app).post("/routine/adapt/stream", json={**_ADAPT, "mode": "full"})
+    assert resp.status_code == 200
+    assert "event: done" in resp.text
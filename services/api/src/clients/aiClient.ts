@@ -3,6 +3,15 @@ import axios from "axios";
 const AI_ORCHESTRATOR_URL =
   process.env.AI_ORCHESTRATOR_URL || "http://localhost:8001";
 
+const AI_TIMEOUT_MS = 30000;
+
+// The orchestrator stops working on (and paying for) a request once this
+// budget has passed, instead of finishing a completion nobody will read.
+const requestOptions = {
+  timeout: AI_TIMEOUT_MS,
+  headers: { "X-Request-Timeout-Ms": String(AI_TIMEOUT_MS) },
+};
+
 /**
  * POST /routine/generate
  */
@@ -12,9 +21,7 @@ export async function generateRoutine(input: {
   available_exercises: Record<string, any>[];
   history?: Record<string, any>[];
 }) {
-  const { data } = await axios.post(`${AI_ORCHESTRATOR_URL}/routine/generate`, input, {
-    timeout: 30000,
-  });
+  const { data } = await axios.post(`${AI_ORCHESTRATOR_URL}/routine/generate`, input, requestOptions);
   return data;
 }
 
@@ -29,9 +36,7 @@ export async function adaptRoutine(input: {
   recentLogs?: Record<string, any>[];
   feedback?: string;
 }) {
-  const { data } = await axios.post(`${AI_ORCHESTRATOR_URL}/routine/adapt`, input, {
-    timeout: 30000,
-  });
+  const { data } = await axios.post(`${AI_ORCHESTRATOR_URL}/routine/adapt`, input, requestOptions);
   return data;
 }
 
@@ -43,8 +48,6 @@ export async function getRoutineExplanation(input: {
   userId?: string;
   profile?: Record<string, any>;
 }) {
-  const { data } = await axios.post(`${AI_ORCHESTRATOR_URL}/routine/explain`, input, {
-    timeout: 30000,
-  });
+  const { data } = await axios.post(`${AI_ORCHESTRATOR_URL}/routine/explain`, input, requestOptions);
   return data;
 }